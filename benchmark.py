@@ -0,0 +1,167 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from breakout_classes_final import BreakoutGame
+
+LAYOUTS = ['rectangle', 'triangle', 'circle']
+BRICK_NUMBERS = [6, 10, 15]
+BASELINE_TOLERANCE = 0.15
+MIN_SECONDS = 0.05  # timings below this are mostly noise and never count as regressions
+
+# Which way each metric should move; anything else in a result is informational only
+HIGHER_IS_BETTER = ['steps_per_sec', 'headless_episodes_per_sec', 'rendered_episodes_per_sec']
+LOWER_IS_BETTER = ['policy_json_load_sec', 'policy_json_save_sec', 'policy_json_bytes', 'policy_bin_load_sec',
+                   'policy_bin_save_sec', 'policy_bin_bytes', 'peak_rss_mb', 'play_rss_mb']
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+
+def measure_steps(game, layout, brick_number, frames, seed):
+    rng = random.Random(seed)
+    actions = [rng.choice([-1, 0, 1]) for _ in range(frames)]
+    random.seed(seed)
+    paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = game.reset_game(
+        layout, brick_number)
+    start = time.perf_counter()
+    for action in actions:
+        paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward, kicks = \
+            game.update_game_state(layout, brick_number, action, paddle_x, paddle_speed, ball_x, ball_y,
+                                   ball_speed_x, ball_speed_y, bricks, 0, 0)
+    return frames / (time.perf_counter() - start)
+
+
+def measure_play(game, layout, brick_number, episodes, seed, **options):
+    random.seed(seed)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        game.play(layout, brick_number, episodes, True, **options)
+    return episodes / (time.perf_counter() - start)
+
+
+def measure_policy_io(game, layout, brick_number):
+    result = {}
+    policy = game.load_policy(game.policy_path(layout, brick_number), game.policy_path(layout, brick_number, 'bin'),
+                              'json')
+    result['policy_states'] = len(policy)
+    for policy_format in ['json', 'bin']:
+        json_path = game.policy_path(layout, brick_number)
+        bin_path = game.policy_path(layout, brick_number, 'bin')
+        start = time.perf_counter()
+        game.save_policy(policy, json_path, bin_path, policy_format)
+        result['policy_' + policy_format + '_save_sec'] = time.perf_counter() - start
+        start = time.perf_counter()
+        game.load_policy(json_path, bin_path, policy_format)
+        result['policy_' + policy_format + '_load_sec'] = time.perf_counter() - start
+        result['policy_' + policy_format + '_bytes'] = os.path.getsize(
+            json_path if policy_format == 'json' else bin_path)
+    return result
+
+
+def measure_config(layout, brick_number, episodes, rendered_episodes, frames, seed):
+    # Runs in a fresh worker process inside a scratch directory, so RSS is this configuration's alone and
+    # the learned tables never touch the real policy/ and results/ directories
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for name in ['policy', 'win_policy', 'results']:
+            os.makedirs(name)
+        game = BreakoutGame(headless=True)
+        result = {'steps_per_sec': measure_steps(game, layout, brick_number, frames, seed)}
+
+        rss_before = peak_rss_mb()
+        result['headless_episodes_per_sec'] = measure_play(game, layout, brick_number, episodes, seed)
+        result['peak_rss_mb'] = peak_rss_mb()
+        result['play_rss_mb'] = result['peak_rss_mb'] - rss_before
+        result.update(measure_policy_io(game, layout, brick_number))
+
+        if rendered_episodes:
+            if not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+                os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+            for name in ['policy', 'win_policy']:
+                for entry in os.listdir(name):
+                    os.remove(os.path.join(name, entry))
+            result['rendered_episodes_per_sec'] = measure_play(BreakoutGame(headless=False), layout, brick_number,
+                                                               rendered_episodes, seed)
+        return result
+
+
+def run_benchmarks(layouts=LAYOUTS, brick_numbers=BRICK_NUMBERS, episodes=50, rendered_episodes=5, frames=200000,
+                   seed=0):
+    report = {
+        'meta': {'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'python': platform.python_version(),
+                 'machine': platform.machine(), 'processor': platform.processor(), 'seed': seed,
+                 'episodes': episodes, 'rendered_episodes': rendered_episodes, 'frames': frames},
+        'results': {},
+    }
+    for layout in layouts:
+        for brick_number in brick_numbers:
+            # One configuration at a time, each in a new process: timings stay comparable between runs
+            with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                result = pool.submit(measure_config, layout, brick_number, episodes, rendered_episodes, frames,
+                                     seed).result()
+            report['results'][layout + '/' + str(brick_number)] = result
+            print(layout, brick_number, ' '.join(f"{key}={value:.4g}" for key, value in result.items()))
+    return report
+
+
+def compare(report, baseline, tolerance=BASELINE_TOLERANCE):
+    # Metrics that got worse by more than tolerance (relative) against the baseline report
+    regressions = []
+    for config, result in report['results'].items():
+        previous = baseline['results'].get(config)
+        if previous is None:
+            continue
+        for metric, value in result.items():
+            old = previous.get(metric)
+            if not old or metric not in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+                continue
+            if metric in LOWER_IS_BETTER and metric.endswith('_sec') and max(old, value) < MIN_SECONDS:
+                continue
+            change = (value - old) / old
+            if (metric in HIGHER_IS_BETTER and change < -tolerance) or (
+                    metric in LOWER_IS_BETTER and change > tolerance):
+                regressions.append((config, metric, old, value, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seeded throughput, policy I/O and memory benchmarks")
+    parser.add_argument('--layouts', nargs='+', default=LAYOUTS)
+    parser.add_argument('--bricks', nargs='+', type=int, default=BRICK_NUMBERS)
+    parser.add_argument('--episodes', type=int, default=50, help="headless learn episodes per configuration")
+    parser.add_argument('--rendered-episodes', type=int, default=5, help="rendered learn episodes, 0 to skip")
+    parser.add_argument('--frames', type=int, default=200000, help="frames for the raw update_game_state rate")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='results/benchmark.json')
+    parser.add_argument('--baseline', default=None, help="earlier --output file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=BASELINE_TOLERANCE)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.layouts, args.bricks, args.episodes, args.rendered_episodes, args.frames, args.seed)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Wrote", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for config, metric, old, new, change in regressions:
+            print(f"REGRESSION {config} {metric}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.baseline)
@@ -0,0 +1,264 @@
+import random
+import time
+
+import numpy as np
+
+from breakout_classes_final import BreakoutGame
+
+
+class BreakoutBatch:
+    # Steps many independent games of one (layout, brick_number) configuration at once.
+    # Same rules as BreakoutGame.update_game_state, applied to struct-of-arrays state:
+    # every field below holds one entry per game, bricks are a (games, bricks) alive mask.
+    def __init__(self, num_envs, layout='rectangle', brick_number=5, game=None, seed=None):
+        if game is None:
+            game = BreakoutGame(headless=True)
+        self.game = game
+        self.num_envs = num_envs
+        self.layout = layout
+        self.brick_number = brick_number
+
+        self.WIDTH = game.WIDTH
+        self.HEIGHT = game.HEIGHT
+        self.PADDLE_WIDTH = game.PADDLE_WIDTH
+        self.PADDLE_HEIGHT = game.PADDLE_HEIGHT
+        self.MAX_PADDLE_SPEED = game.MAX_PADDLE_SPEED
+        self.BALL_RADIUS = game.BALL_RADIUS
+        self.BALL_SPEED_Y = game.BALL_SPEED_Y
+        self.BALL_SPEED_X_CHOICES = np.array(game.BALL_SPEED_X_CHOICES, dtype=np.float64)
+        self.BRICK_REWARD = game.BRICK_REWARD
+        self.PADDLE_REWARD = game.PADDLE_REWARD
+        # The scalar game's own constants, so the reflected speeds are bit-identical
+        self.REFLECT_LEFT = game.physics.reflect_left
+        self.REFLECT_RIGHT = game.physics.reflect_right
+
+        self.paddle_y = self.HEIGHT - self.PADDLE_HEIGHT - 10
+        self.bricks = list(game.layouts.get(layout, brick_number).bricks)
+        brick_array = np.array(self.bricks, dtype=np.float64).reshape(-1, 4)
+        self.brick_x = brick_array[:, 0]
+        self.brick_y = brick_array[:, 1]
+        self.brick_x2 = brick_array[:, 0] + brick_array[:, 2]
+        self.brick_y2 = brick_array[:, 1] + brick_array[:, 3]
+
+        self.rng = np.random.default_rng(seed)
+
+        self.paddle_x = np.zeros(num_envs)
+        self.paddle_speed = np.zeros(num_envs)
+        self.ball_x = np.zeros(num_envs)
+        self.ball_y = np.zeros(num_envs)
+        self.ball_speed_x = np.zeros(num_envs)
+        self.ball_speed_y = np.zeros(num_envs)
+        self.alive = np.ones((num_envs, len(self.bricks)), dtype=bool)
+        self.bricks_left = np.zeros(num_envs, dtype=np.int64)
+        self.kicks = np.zeros(num_envs, dtype=np.int64)
+        self.score = np.zeros(num_envs)
+
+        # Per-step outputs, reused between calls
+        self.reward = np.zeros(num_envs)
+        self.done = np.zeros(num_envs, dtype=bool)
+        self.won = np.zeros(num_envs, dtype=bool)
+
+        self.reset()
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        count = int(mask.sum())
+        if count == 0:
+            return
+        self.paddle_x[mask] = (self.WIDTH - self.PADDLE_WIDTH) // 2
+        self.paddle_speed[mask] = 0
+        self.ball_x[mask] = (self.WIDTH - self.BALL_RADIUS) / 2
+        self.ball_y[mask] = (self.HEIGHT - self.BALL_RADIUS) / 2
+        self.ball_speed_x[mask] = self.rng.choice(self.BALL_SPEED_X_CHOICES, size=count)
+        self.ball_speed_y[mask] = -1.0
+        self.alive[mask] = True
+        self.bricks_left[mask] = len(self.bricks)
+        self.kicks[mask] = 0
+        self.score[mask] = 0
+
+    def load(self, snapshot, rows=slice(None)):
+        # Puts the given games in the position of a breakout_env.BreakoutEnv.snapshot(), score zeroed
+        (paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, score, kicks,
+         (grid, bits, alive, count, brick_key), rng_state, done) = snapshot
+        self.paddle_x[rows] = paddle_x
+        self.paddle_speed[rows] = paddle_speed
+        self.ball_x[rows] = ball_x
+        self.ball_y[rows] = ball_y
+        self.ball_speed_x[rows] = ball_speed_x
+        self.ball_speed_y[rows] = ball_speed_y
+        self.alive[rows] = alive
+        self.bricks_left[rows] = count
+        self.kicks[rows] = kicks
+        self.score[rows] = 0
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        r = self.BALL_RADIUS
+        reward = self.reward
+        reward.fill(0)
+
+        # Paddle
+        speed = self.paddle_speed
+        np.copyto(speed, np.where(actions == -1, np.maximum(speed - 1, -self.MAX_PADDLE_SPEED),
+                                  np.where(actions == 1, np.minimum(speed + 1, self.MAX_PADDLE_SPEED), 0)))
+        self.paddle_x += speed
+        np.clip(self.paddle_x, 0, self.WIDTH - self.PADDLE_WIDTH, out=self.paddle_x)
+
+        # Ball
+        self.ball_x += self.ball_speed_x
+        self.ball_y += self.ball_speed_y
+        ball_x, ball_y = self.ball_x, self.ball_y
+
+        # Walls
+        hit_side = (ball_x - r <= 0) | (ball_x + r >= self.WIDTH)
+        self.ball_speed_x[hit_side] *= -1
+        self.ball_speed_y[ball_y - r <= 0] *= -1
+
+        # Paddle, pygame.Rect.colliderect on truncated integer rects
+        ball_left = np.trunc(ball_x - r)
+        ball_top = np.trunc(ball_y - r)
+        paddle_left = np.trunc(self.paddle_x)
+        on_paddle = ((ball_left < paddle_left + self.PADDLE_WIDTH) & (ball_left + 2 * r > paddle_left) &
+                     (ball_top < self.paddle_y + self.PADDLE_HEIGHT) & (ball_top + 2 * r > self.paddle_y))
+        if on_paddle.any():
+            speed_x = self.ball_speed_x[on_paddle]
+            speed_y = -self.ball_speed_y[on_paddle]
+            speed_x = np.where(speed_x < 0, self.REFLECT_LEFT, self.REFLECT_RIGHT)
+            bx = ball_x[on_paddle]
+            px = self.paddle_x[on_paddle]
+            flip = ((speed_x < 0) & (bx + r >= px + self.PADDLE_WIDTH)) | ((speed_x > 0) & (bx - r <= px))
+            speed_x[flip] *= -1
+            speed_y[speed_y > 0] = -self.BALL_SPEED_Y
+            self.ball_speed_x[on_paddle] = speed_x
+            self.ball_speed_y[on_paddle] = speed_y
+            reward[on_paddle] += self.PADDLE_REWARD
+            self.kicks[on_paddle] += 1
+
+        # Bricks, pygame.Rect.collidepoint on truncated probe points; the first alive brick in
+        # layout order wins, and its horizontal probe is tested before its vertical one
+        probe_x = np.trunc(ball_x + self.ball_speed_x)[:, None]
+        probe_y = np.trunc(ball_y + self.ball_speed_y)[:, None]
+        here_x = np.trunc(ball_x)[:, None]
+        here_y = np.trunc(ball_y)[:, None]
+        in_x = (here_x >= self.brick_x) & (here_x < self.brick_x2)
+        in_y = (here_y >= self.brick_y) & (here_y < self.brick_y2)
+        hit_h = (probe_x >= self.brick_x) & (probe_x < self.brick_x2) & in_y & self.alive
+        hit_v = in_x & (probe_y >= self.brick_y) & (probe_y < self.brick_y2) & self.alive
+        hit_any = hit_h | hit_v
+        hit_rows = hit_any.any(axis=1)
+        if hit_rows.any():
+            rows = np.flatnonzero(hit_rows)
+            first = hit_any[rows].argmax(axis=1)
+            horizontal = hit_h[rows, first]
+            self.alive[rows, first] = False
+            self.ball_speed_x[rows[horizontal]] *= -1
+            self.ball_speed_y[rows[~horizontal]] *= -1
+            reward[rows] += self.BRICK_REWARD
+            self.kicks[rows] += 1
+            self.bricks_left[rows] -= 1
+
+        self.score += reward
+        np.equal(self.bricks_left, 0, out=self.won)
+        np.greater_equal(ball_y, self.HEIGHT, out=self.done)
+        self.done |= self.won
+        if self.done.any():
+            self.reset(self.done)
+        return reward, self.done, self.won
+
+
+class BreakoutVectorEnv:
+    # breakout_env.BreakoutEnv's reset/step interface over a BreakoutBatch: one call steps every game.
+    # Observations are a (num_envs, 5) array of paddle_x, ball_x, ball_y, ball_speed_x, ball_speed_y, and
+    # state_keys() packs them into BreakoutGame state keys. Finished games are reset inside step(), so the
+    # observation of a done game is its next episode's first one; info['final_score'] holds the finished score.
+    # Every returned array is reused by the next call.
+    def __init__(self, num_envs, layout='rectangle', brick_number=5, game=None, seed=None, step_penalty=0.1):
+        self.batch = BreakoutBatch(num_envs, layout, brick_number, game=game, seed=seed)
+        self.game = self.batch.game
+        self.num_envs = num_envs
+        self.step_penalty = step_penalty
+        self.observations = np.zeros((num_envs, 5))
+        self.score = np.zeros(num_envs)
+        self.final_score = np.zeros(num_envs)
+        self.info = {'kicks': self.batch.kicks, 'bricks_left': self.batch.bricks_left, 'score': self.score,
+                     'won': self.batch.won, 'final_score': self.final_score, 'alive': self.batch.alive}
+
+    def observe(self):
+        batch = self.batch
+        observations = self.observations
+        observations[:, 0] = batch.paddle_x
+        observations[:, 1] = batch.ball_x
+        observations[:, 2] = batch.ball_y
+        observations[:, 3] = batch.ball_speed_x
+        observations[:, 4] = batch.ball_speed_y
+        return observations
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.batch.rng = np.random.default_rng(seed)
+        self.batch.reset()
+        self.score.fill(0)
+        self.final_score.fill(0)
+        return self.observe()
+
+    def step(self, actions):
+        # The batch resets finished games itself, so their score is read from the env's own running total
+        reward, done, won = self.batch.step(actions)
+        reward -= self.step_penalty
+        self.score += reward
+        np.copyto(self.final_score, self.score, where=done)
+        self.score[done] = 0
+        return self.observe(), reward, done, self.info
+
+    def state_keys(self):
+        # BreakoutGame.state_key for every game, as Python ints (the brick mask can pass 64 bits)
+        game = self.game
+        batch = self.batch
+        brick_bits = np.array([1 << i for i in range(batch.alive.shape[1])], dtype=object)
+        brick_masks = batch.alive.astype(object) @ brick_bits
+        paddle = np.rint(batch.paddle_x).astype(np.int64) << 30
+        ball_x = (np.rint(batch.ball_x).astype(np.int64) + game.POSITION_BIAS) << 19
+        ball_y = (np.rint(batch.ball_y).astype(np.int64) + game.POSITION_BIAS) << 8
+        fields = (paddle | ball_x | ball_y).tolist()
+        speed_x_codes = game.SPEED_X_CODES
+        speed_y_codes = game.SPEED_Y_CODES
+        return [mask << game.FIELD_BITS | field | speed_x_codes[speed_x] << 4 | speed_y_codes[speed_y]
+                for mask, field, speed_x, speed_y in zip(brick_masks.tolist(), fields, batch.ball_speed_x.tolist(),
+                                                         batch.ball_speed_y.tolist())]
+
+
+def benchmark(layout='rectangle', brick_number=15, num_envs=4096, seconds=2.0):
+    game = BreakoutGame(headless=True)
+    paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = game.reset_game(
+        layout, brick_number)
+    rng = random.Random(0)
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(1000):
+            paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward, kicks = \
+                game.update_game_state(layout, brick_number, rng.choice([-1, 0, 1]), paddle_x, paddle_speed,
+                                       ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, 0, 0)
+        steps += 1000
+    scalar_rate = steps / (time.perf_counter() - start)
+
+    batch = BreakoutBatch(num_envs, layout, brick_number, game=game, seed=0)
+    action_rng = np.random.default_rng(0)
+    actions = action_rng.integers(-1, 2, size=(64, num_envs))
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for row in actions:
+            batch.step(row)
+        steps += len(actions) * num_envs
+    batch_rate = steps / (time.perf_counter() - start)
+    return scalar_rate, batch_rate
+
+
+if __name__ == "__main__":
+    for layout in ['rectangle', 'triangle', 'circle']:
+        for brick_number in [6, 10, 15]:
+            scalar_rate, batch_rate = benchmark(layout, brick_number)
+            print(f"{layout:9} {brick_number:2}  scalar {scalar_rate:12,.0f} steps/s  "
+                  f"batch {batch_rate:14,.0f} steps/s  x{batch_rate / scalar_rate:.1f}")
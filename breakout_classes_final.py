@@ -1,15 +1,37 @@
-import pygame
 import random
 import math
 import json
 import ast
 import os
-import csv
-from datetime import datetime
+
+import breakout_physics
+import policy_store
+from brick_index import BrickSet
+from layouts import LayoutRegistry
+from checkpoint import PolicyCheckpoint
+from breakout_env import BreakoutEnv
+import profiler
+from renderer import Renderer
+from loop_detector import LOOP_ACTIONS, LoopDetector
+from results_log import ResultsLog
+import qlearning
+import trajectory
+from trajectory import TrajectoryBuffer, TrajectoryStore, credit_win, credit_loss, rebuild_win_policy
+
+
+pygame = None  # imported on first use, headless training never needs it
+
+
+def load_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as module
+        pygame = module
+    return pygame
 
 
 class BreakoutGame:
-    def __init__(self):
+    def __init__(self, headless=False, layout_file=None):
         # Game dimensions
         self.WIDTH = 450
         self.HEIGHT = 600
@@ -42,15 +64,51 @@ class BreakoutGame:
         self.PADDLE_REWARD = 10
 
         self.GAME_OVER = False
-
+        self.QUIT = False
+
+        self.physics = breakout_physics.PhysicsConfig(
+            self.WIDTH, self.HEIGHT, self.PADDLE_WIDTH, self.PADDLE_HEIGHT, self.MAX_PADDLE_SPEED, self.BALL_RADIUS,
+            self.BALL_SPEED_Y, self.BALL_SPEED_X_MAX, self.PADDLE_REWARD, self.BRICK_REWARD)
+
+        # Compact state keys: one int per state instead of a tuple holding the whole brick list.
+        # Low FIELD_BITS bits pack paddle/ball positions and speed codes, the bits above are a brick-alive mask
+        # indexed by brick position in the layout, updated in place when a brick is hit (see reset_bricks).
+        self.FIELD_BITS = 40
+        self.POSITION_BIAS = 512  # ball coordinates may leave the field by a few pixels
+        speed_x_values = set(self.BALL_SPEED_X_CHOICES) | {-speed for speed in self.BALL_SPEED_X_CHOICES}
+        reflect = math.sin(math.pi / 4) * self.BALL_SPEED_X_MAX
+        self.SPEED_X_VALUES = tuple(sorted(speed_x_values | {reflect, -reflect}))
+        self.SPEED_Y_VALUES = (-self.BALL_SPEED_Y, -1.0, 1.0, self.BALL_SPEED_Y)
+        self.SPEED_X_CODES = {speed: code for code, speed in enumerate(self.SPEED_X_VALUES)}
+        self.SPEED_Y_CODES = {speed: code for code, speed in enumerate(self.SPEED_Y_VALUES)}
+        self.layout = None
+
+        # Every (layout, brick_number) board is built once; layout_file adds custom boards by name
+        self.layouts = LayoutRegistry(self)
+        if layout_file:
+            self.layouts.load_file(layout_file)
+
+        # Headless mode never opens a window: no drawing, no event pumping and no frame pacing.
+        # A window is only created on demand for the spot-check episodes selected by play(render_every=N).
+        # Measured on rectangle/6 learn mode (SDL dummy driver): ~10k frames/s rendered vs ~100k frames/s headless.
+        self.headless = headless
+        self.window = None
+        self.clock = None
+        self.renderer = None
+        if not headless:
+            self.open_window()
+
+    def open_window(self):
         # Initialize Pygame
+        load_pygame()
         pygame.init()
         self.window = pygame.display.set_mode((self.WIDTH, self.HEIGHT))
         pygame.display.set_caption("Breakout")
 
         self.clock = pygame.time.Clock()
 
-    def reset_game(self, layout, brick_number):
+    def reset_game(self, layout, brick_number, rng=random):
+        # rng is where the serve is drawn from: the shared random module unless an env brings its own
         bricks = self.reset_bricks(layout, brick_number)
 
         # Initialize paddle
@@ -61,18 +119,40 @@ class BreakoutGame:
         # Initialize ball
         ball_x = (self.WIDTH - self.BALL_RADIUS) / 2
         ball_y = (self.HEIGHT - self.BALL_RADIUS) / 2
-        ball_speed_x = random.choice(self.BALL_SPEED_X_CHOICES)
-        ball_speed_y = random.uniform(-1, -1)  # Randomly select one of five directions directed upwards
+        ball_speed_x = rng.choice(self.BALL_SPEED_X_CHOICES)
+        ball_speed_y = rng.uniform(-1, -1)  # Randomly select one of five directions directed upwards
 
         return paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks
 
     def reset_bricks(self, layout_type, brick_number):
-        if layout_type == 'rectangle':
-            return self.reset_bricks_rectangle(brick_number)
-        elif layout_type == 'circle':
-            return self.reset_bricks_circle(brick_number)
-        elif layout_type == 'triangle':
-            return self.reset_bricks_triangle(brick_number)
+        # The board comes prebuilt from the registry, a reset only starts a fresh alive mask
+        layout = self.layouts.get(layout_type, brick_number)
+        self.layout = layout
+        return BrickSet(layout.grid, layout.brick_bits)
+
+    def state_key(self, paddle_x, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks):
+        # bricks is the game's BrickSet, whose key holds the alive-brick bits
+        return (bricks.key | round(paddle_x) << 30 | (round(ball_x) + self.POSITION_BIAS) << 19 |
+                (round(ball_y) + self.POSITION_BIAS) << 8 | self.SPEED_X_CODES[ball_speed_x] << 4 |
+                self.SPEED_Y_CODES[ball_speed_y])
+
+    def legacy_state(self, key):
+        # The tuple state used by the JSON policy files, rebuilt for the current layout
+        paddle_x = key >> 30 & 0x3ff
+        ball_x = (key >> 19 & 0x7ff) - self.POSITION_BIAS
+        ball_y = (key >> 8 & 0x7ff) - self.POSITION_BIAS
+        mask = key >> self.FIELD_BITS
+        bricks = tuple(brick for i, brick in enumerate(self.layout.bricks) if mask >> i & 1)
+        return (paddle_x, paddle_x, ball_x, ball_y, self.SPEED_X_VALUES[key >> 4 & 0xf],
+                self.SPEED_Y_VALUES[key & 0xf], bricks)
+
+    def compact_state(self, state):
+        paddle_x, _, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = state
+        mask = 0
+        for brick in bricks:
+            mask |= self.layout.brick_bits[self.layout.ids[brick]]
+        return (mask | paddle_x << 30 | (ball_x + self.POSITION_BIAS) << 19 | (ball_y + self.POSITION_BIAS) << 8 |
+                self.SPEED_X_CODES[ball_speed_x] << 4 | self.SPEED_Y_CODES[ball_speed_y])
 
     def reset_bricks_rectangle(self, brick_number=10):
         BRICK_COLS = min(brick_number, self.WIDTH // self.BRICK_WIDTH)
@@ -133,101 +213,61 @@ class BreakoutGame:
         return bricks
 
     def draw_elements(self, paddle_x, paddle_y, ball_x, ball_y, bricks):
-        self.window.fill(self.BLACK)
-
-        pygame.draw.rect(self.window, self.ORANGE, (paddle_x, paddle_y, self.PADDLE_WIDTH, self.PADDLE_HEIGHT))
-        pygame.draw.circle(self.window, self.RED, (ball_x, ball_y), self.BALL_RADIUS)
-
-        for brick in bricks:
-            pygame.draw.rect(self.window, self.GREEN, brick)
-            pygame.draw.rect(self.window, self.BLACK, brick, 2)  # Add black outline to bricks
-
-        pygame.display.flip()
+        # Only the paddle, ball and removed-brick areas are redrawn and updated, see renderer.py
+        if self.renderer is None or self.renderer.window is not self.window:
+            self.renderer = Renderer(pygame, self.window, self.PADDLE_WIDTH, self.PADDLE_HEIGHT, self.BALL_RADIUS,
+                                     self.BLACK, self.ORANGE, self.RED, self.GREEN, self.BLACK)
+        self.renderer.draw(paddle_x, paddle_y, ball_x, ball_y, bricks)
 
     def move_paddle(self, paddle_x, paddle_speed):
-        paddle_x += paddle_speed
-        if paddle_x < 0:
-            paddle_x = 0
-        if paddle_x > self.WIDTH - self.PADDLE_WIDTH:
-            paddle_x = self.WIDTH - self.PADDLE_WIDTH
-        return paddle_x
+        return breakout_physics.move_paddle(self.physics, paddle_x, paddle_speed)
 
     def move_ball(self, ball_x, ball_y, ball_speed_x, ball_speed_y):
-        ball_x += ball_speed_x
-        ball_y += ball_speed_y
-        return ball_x, ball_y
+        return breakout_physics.move_ball(ball_x, ball_y, ball_speed_x, ball_speed_y)
 
     def check_wall_collision(self, ball_x, ball_y, ball_speed_x, ball_speed_y):
-        if ball_x - self.BALL_RADIUS <= 0 or ball_x + self.BALL_RADIUS >= self.WIDTH:
-            ball_speed_x *= -1
-        if ball_y - self.BALL_RADIUS <= 0:
-            ball_speed_y *= -1
-        return ball_speed_x, ball_speed_y
+        return breakout_physics.check_wall_collision(self.physics, ball_x, ball_y, ball_speed_x, ball_speed_y)
 
     def check_paddle_collision(self, ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, paddle_y, reward, kicks):
-        paddle_rect = pygame.Rect(paddle_x, paddle_y, self.PADDLE_WIDTH, self.PADDLE_HEIGHT)
-        ball_rect = pygame.Rect(ball_x - self.BALL_RADIUS, ball_y - self.BALL_RADIUS, self.BALL_RADIUS * 2,
-                                self.BALL_RADIUS * 2)
-
-        if ball_rect.colliderect(paddle_rect):
-            ball_speed_y *= -1
+        ball_speed_x, ball_speed_y, on_paddle = breakout_physics.check_paddle_collision(
+            self.physics, ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, paddle_y)
+        if on_paddle:
             # REWARD
             reward += self.PADDLE_REWARD
             kicks += 1
-            # Calculate the reflection angle based on the direction of the ball's incoming velocity
-            if ball_speed_x < 0:
-                angle = -math.pi / 4  # Reflect to the left
-            else:
-                angle = math.pi / 4  # Reflect to the right
-
-            ball_speed_x = math.sin(angle) * self.BALL_SPEED_X_MAX
-
-            # Adjust the ball's horizontal direction if it's in contact with both paddle and wall
-            if (ball_speed_x < 0 and ball_x + self.BALL_RADIUS >= paddle_x + self.PADDLE_WIDTH) or (
-                    ball_speed_x > 0 and ball_x - self.BALL_RADIUS <= paddle_x):
-                ball_speed_x *= -1
-
-            # Adjust the ball's vertical direction to prevent sticking
-            if ball_speed_y > 0:
-                ball_speed_y = -self.BALL_SPEED_Y
-
         return ball_speed_x, ball_speed_y, reward, kicks
 
     def check_brick_collision(self, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward, kicks):
-        for brick in bricks:
-            brick_rect = pygame.Rect(*brick)  # Convert to Rect
-            if brick_rect.collidepoint(ball_x + ball_speed_x, ball_y):  # Check horizontal collision
-                bricks.remove(brick)
+        # Only the bricks in the grid cells under the two probe points are tested, in layout order
+        hit = bricks.hit(ball_x, ball_y, ball_speed_x, ball_speed_y)
+        if hit is not None:
+            brick_id, horizontal = hit
+            bricks.remove_id(brick_id)
+            if horizontal:  # Horizontal collision
                 ball_speed_x *= -1
-                reward += self.BRICK_REWARD
-                kicks += 1
-                return ball_speed_x, ball_speed_y, bricks, reward, kicks
-            elif brick_rect.collidepoint(ball_x, ball_y + ball_speed_y):  # Check vertical collision
-                bricks.remove(brick)
+            else:  # Vertical collision
                 ball_speed_y *= -1
-                reward += self.BRICK_REWARD
-                kicks += 1
-                return ball_speed_x, ball_speed_y, bricks, reward, kicks
+            reward += self.BRICK_REWARD
+            kicks += 1
         return ball_speed_x, ball_speed_y, bricks, reward, kicks
 
     def update_game_state(self, layout, brick_number, action, paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x,
                           ball_speed_y,
                           bricks, reward, kicks):
-        if action == -1:
-            paddle_speed = max(paddle_speed - 1, -self.MAX_PADDLE_SPEED)
-        elif action == 1:
-            paddle_speed = min(paddle_speed + 1, self.MAX_PADDLE_SPEED)
-        else:
-            paddle_speed = 0
-
-        paddle_y = self.HEIGHT - self.PADDLE_HEIGHT - 10
-
-        paddle_x = self.move_paddle(paddle_x, paddle_speed)
-        ball_x, ball_y = self.move_ball(ball_x, ball_y, ball_speed_x, ball_speed_y)
-        ball_speed_x, ball_speed_y = self.check_wall_collision(ball_x, ball_y, ball_speed_x, ball_speed_y)
-        ball_speed_x, ball_speed_y, reward, kicks = self.check_paddle_collision(ball_x, ball_y, ball_speed_x,
-                                                                                ball_speed_y, paddle_x,
-                                                                                paddle_y, reward, kicks)
+        paddle_speed = breakout_physics.accelerate(self.physics, paddle_speed, action)
+        paddle_y = self.physics.paddle_y
+
+        physics = self.physics
+        paddle_x = breakout_physics.move_paddle(physics, paddle_x, paddle_speed)
+        ball_x, ball_y = breakout_physics.move_ball(ball_x, ball_y, ball_speed_x, ball_speed_y)
+        ball_speed_x, ball_speed_y = breakout_physics.check_wall_collision(physics, ball_x, ball_y, ball_speed_x,
+                                                                           ball_speed_y)
+        ball_speed_x, ball_speed_y, on_paddle = breakout_physics.check_paddle_collision(
+            physics, ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, paddle_y)
+        if on_paddle:
+            # REWARD
+            reward += self.PADDLE_REWARD
+            kicks += 1
         ball_speed_x, ball_speed_y, bricks, reward, kicks = self.check_brick_collision(ball_x, ball_y, ball_speed_x,
                                                                                        ball_speed_y,
                                                                                        bricks, reward, kicks)
@@ -244,25 +284,131 @@ class BreakoutGame:
 
         return paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward, kicks
 
-    def play(self, layout='rectangle', brick_number=5, num_episodes=20, learn_mode=True):
-        win_count = 0
+    def run_name(self, layout, brick_number, frame_skip=1, event_driven=False, abstraction=None):
+        # Frame-skip and event-driven runs only key states at their decision points and state abstractions key
+        # them differently, so each keeps its own tables and results
+        name = layout + '_' + str(brick_number)
+        if frame_skip > 1:
+            name += '_k' + str(frame_skip)
+        if event_driven:
+            name += '_ev'
+        if abstraction is not None and abstraction.name:
+            name += '_' + abstraction.name
+        return name
+
+    def policy_path(self, layout, brick_number, policy_format='json', frame_skip=1, event_driven=False,
+                    abstraction=None):
+        return ('policy/policy_' + self.run_name(layout, brick_number, frame_skip, event_driven, abstraction) + '.' +
+                policy_format)
+
+    def win_policy_path(self, layout, brick_number, policy_format='json', frame_skip=1, event_driven=False,
+                        abstraction=None):
+        return ('win_policy/win_policy_' + self.run_name(layout, brick_number, frame_skip, event_driven, abstraction) +
+                '.' + policy_format)
+
+    def load_policy(self, json_path, bin_path, policy_format):
+        # 'bin' falls back to an existing JSON file, so old runs migrate on their first binary save
+        if policy_format == 'bin' and os.path.exists(bin_path):
+            return policy_store.load_policy(bin_path)
+        if os.path.exists(json_path):
+            with open(json_path, 'r') as f:
+                policy_str = json.load(f)
+            return {self.compact_state(ast.literal_eval(key)): value for key, value in policy_str.items()}
+        return {}
+
+    def save_policy(self, policy, json_path, bin_path, policy_format, with_reward=False):
+        if policy_format == 'bin':
+            policy_store.save_policy(bin_path, policy, self.FIELD_BITS, with_reward)
+            return
+        new_dict = {str(self.legacy_state(key)): value for key, value in policy.items()}
+        with open(json_path + '.tmp', 'w') as f:
+            json.dump(new_dict, f)
+        os.replace(json_path + '.tmp', json_path)
+
+    def results_path(self, layout, brick_number, learn_mode, frame_skip=1, event_driven=False, abstraction=None):
+        return ('results/' + self.run_name(layout, brick_number, frame_skip, event_driven, abstraction) + '_' +
+                str(learn_mode) + '_results.csv')
+
+    def profile_path(self, layout, brick_number, learn_mode, frame_skip=1, event_driven=False, abstraction=None):
+        return ('results/' + self.run_name(layout, brick_number, frame_skip, event_driven, abstraction) + '_' +
+                str(learn_mode) + '_profile.csv')
+
+    def win_trajectories_path(self, layout, brick_number, frame_skip=1, event_driven=False, abstraction=None):
+        return ('win_policy/win_trajectories_' + self.run_name(layout, brick_number, frame_skip, event_driven,
+                                                               abstraction) + '.trj')
+
+    def recording_path(self, layout, brick_number, learn_mode, frame_skip=1, event_driven=False, abstraction=None):
+        return ('results/' + self.run_name(layout, brick_number, frame_skip, event_driven, abstraction) + '_' +
+                str(learn_mode) + '_episodes.trj')
+
+    def should_render(self, epoch, render_every):
+        # Without a window every episode is simulated only, unless render_every picks it for a spot check
+        if render_every:
+            return epoch % render_every == 0
+        return not self.headless
+
+    def play(self, layout='rectangle', brick_number=5, num_episodes=20, learn_mode=True, render_every=None,
+             render_frame_every=1, policy_format='json', checkpoint_every=None, frame_skip=1, event_driven=False,
+             profile=False, abstraction=None, learner='table', win_trajectories=False, progress_seconds=10.0,
+             record_every=None, tables=None, tracker=None, loop_action=None, loop_memory=256, max_frames=None):
+        # learner='q' swaps the dict policy below for the dense Q-table learner in qlearning.py
+        if learner == 'q':
+            unsupported = [name for name, value in (
+                ('policy_format', policy_format != 'json'), ('checkpoint_every', checkpoint_every),
+                ('profile', profile), ('win_trajectories', win_trajectories), ('record_every', record_every),
+                ('tables', tables is not None), ('tracker', tracker is not None), ('loop_action', loop_action),
+                ('max_frames', max_frames is not None)) if value]
+            if unsupported:
+                raise ValueError("The Q-learner does not support " + ", ".join(unsupported))
+            qlearning.play(self, layout, brick_number, num_episodes, learn_mode, render_every, render_frame_every,
+                           frame_skip, event_driven, abstraction, progress_seconds=progress_seconds)
+            return
+        elif learner != 'table':
+            raise ValueError("Unknown learner " + str(learner))
+        if loop_action not in (None,) + LOOP_ACTIONS:
+            raise ValueError("Unknown loop action " + str(loop_action))
         reward = 0
-        results = []
+        kicks = 0
 
         # Initialize the agent's policy
-        if os.path.exists('policy/policy_' + layout + '_' + str(brick_number) + '.json'):
-            with open('policy/policy_' + layout + '_' + str(brick_number) + '.json', 'r') as f:
-                policy_str = json.load(f)
-            policy = {ast.literal_eval(key): value for key, value in policy_str.items()}
-        else:
-            policy = {}
-
-        if os.path.exists('win_policy/win_policy_' + layout + '_' + str(brick_number) + '.json'):
-            with open('win_policy/win_policy_' + layout + '_' + str(brick_number) + '.json', 'r') as f:
-                win_policy_str = json.load(f)
-            win_policy = {ast.literal_eval(key): value for key, value in win_policy_str.items()}
+        self.reset_bricks(layout, brick_number)  # index the layout so stored states map to compact keys
+        if policy_format == 'bin' and len(self.layout.bricks) > policy_store.MAX_BRICKS:
+            raise ValueError(f"The binary policy format holds at most {policy_store.MAX_BRICKS} bricks, "
+                             f"{layout}/{brick_number} has {len(self.layout.bricks)}")
+        run = (frame_skip, event_driven, abstraction)
+        custom_bricks = self.layout.bricks if layout in self.layouts.custom else None  # stored with trajectories
+        policy_paths = (self.policy_path(layout, brick_number, 'json', *run),
+                        self.policy_path(layout, brick_number, 'bin', *run), policy_format)
+        win_policy_paths = (self.win_policy_path(layout, brick_number, 'json', *run),
+                            self.win_policy_path(layout, brick_number, 'bin', *run), policy_format)
+        trajectories = None
+        if win_trajectories:
+            # Winning episodes are stored as serve + action stream (trajectory.py) and win_policy is rebuilt from
+            # them by replay, in place of the win policy files
+            if checkpoint_every:
+                raise ValueError("win_trajectories replaces the win policy files that checkpoints log")
+            trajectories = TrajectoryStore(self.win_trajectories_path(layout, brick_number, *run), layout,
+                                           brick_number, frame_skip, abstraction, bricks=custom_bricks)
+        if tables is not None:
+            # (policy, win_policy) owned by the caller, e.g. a parallel_train.py worker: nothing is loaded or saved
+            # here, and tracker.mark/mark_win are told every state an episode may have changed, as a checkpoint is
+            if checkpoint_every or win_trajectories:
+                raise ValueError("tables are kept by the caller, without checkpoints or win trajectories")
+            checkpoint = None
+            policy, win_policy = tables
+        elif checkpoint_every:
+            # Changed entries are appended to a delta log every checkpoint_every episodes and the
+            # tables are rewritten only when the log outgrows them; a restart replays the log
+            checkpoint = PolicyCheckpoint(self, layout, brick_number, policy_format, *run)
+            policy, win_policy = checkpoint.load()
+            tracker = checkpoint
         else:
-            win_policy = {}
+            checkpoint = None
+            policy = self.load_policy(*policy_paths)
+            if trajectories is not None:
+                win_policy = rebuild_win_policy(self, trajectories)
+            else:
+                win_policy = self.load_policy(*win_policy_paths)
 
         # if os.path.exists('lose_policy/lose_policy_' + layout + '_' + str(brick_number) + '.json'):
         #     with open('lose_policy/lose_policy_' + layout + '_' + str(brick_number) + '.json', 'r') as f:
@@ -271,192 +417,275 @@ class BreakoutGame:
         # else:
         #     lose_policy = {}
 
+        # The game itself runs in a BreakoutEnv; this loop is only the learner on top of it.
+        # With frame_skip > 1 every decision is held for frame_skip frames and only those decision points
+        # are keyed, looked up and remembered. With event_driven the frames in which nothing can happen are jumped
+        # over between decisions; rendered episodes are still stepped frame by frame. An abstraction
+        # (state_abstraction.py) coarsens the states the policy is keyed by.
+        env = BreakoutEnv(layout, brick_number, game=self, frame_skip=frame_skip, event_driven=event_driven,
+                          abstraction=abstraction)
+        # profile=True times every phase of the loop per episode (see profiler.py), streamed to a _profile.csv next to
+        # the results; without it each phase boundary costs a single falsy check
+        phases = profiler.PhaseProfiler(self.profile_path(layout, brick_number, learn_mode, *run)) if profile else None
+        env.profiler = phases
+        game_state = env.state
+        info = env.info
+        paddle_y = self.physics.paddle_y
+        # The episode's (state, action, reward, kicks) rows, kept in numpy columns reused by every episode
+        episode_memory = TrajectoryBuffer(self.FIELD_BITS + len(self.layouts.get(layout, brick_number).bricks))
+
+        # Results are streamed to the CSV as episodes end, with a rolling progress line every progress_seconds
+        results = ResultsLog(self.results_path(layout, brick_number, learn_mode, *run),
+                             progress_seconds=progress_seconds)
+        # record_every=N logs every Nth episode (config, serve, actions, state checksums) for replay.py to
+        # re-simulate and render offline; like the results, the file starts over with each run
+        recorder = None
+        if record_every:
+            recording_path = self.recording_path(layout, brick_number, learn_mode, *run)
+            if os.path.exists(recording_path):
+                os.remove(recording_path)
+            recorder = TrajectoryStore(recording_path, layout, brick_number, frame_skip, abstraction,
+                                       env.step_penalty, trajectory.CHECKSUM_EVERY, custom_bricks)
+        checksums = []
+        # loop_action='cut' ends a rally caught going round in circles (loop_detector.py) as a loss, 'perturb'
+        # plays random actions until the ball's next contact; max_frames cuts any episode that long as a loss.
+        # The results get each episode's frames, loops and why it was cut.
+        detector = LoopDetector(loop_memory) if loop_action is not None else None
+        perturb_kicks = -1
+
         start_ball_speed_x = None
-        for epoch in range(num_episodes):
-            paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = self.reset_game(
-                layout,
-                brick_number)
-
-            if not start_ball_speed_x:
-                start_ball_speed_x = ball_speed_x
-            episode_memory = []  # Store state, action, reward tuples for the episode
-            kicks = 0
-            self.GAME_OVER = False
-            print("Epoch", epoch)
-
-            while not self.GAME_OVER:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        self.GAME_OVER = True
-                reward -= 0.1
-                # state_paddle_x = round(paddle_x / 20)
-                # state_paddle_y = round(paddle_x / 20)
-                # state_ball_x = round(ball_x / 20)
-                # state_ball_y = round(ball_y / 20)
-
-                state_paddle_x = round(paddle_x)
-                state_paddle_y = round(paddle_x)
-                state_ball_x = round(ball_x)
-                state_ball_y = round(ball_y)
-
-                state = (
-                    state_paddle_x, state_paddle_y, state_ball_x, state_ball_y, ball_speed_x, ball_speed_y,
-                    tuple(bricks))
-                if learn_mode == True:
-                    if state in win_policy.keys():
-                        # if reward > win_policy[state][1]:
-                        #     policy[state] = win_policy[state][0]
-                        # else:
-                        new_action = random.choice([-1, 0, 1])
-                        while new_action == win_policy[state][0]:
+        try:
+            for epoch in range(num_episodes):
+                observation = env.reset()
+                serve = (game_state.ball_speed_x, game_state.ball_speed_y)
+
+                if not start_ball_speed_x:
+                    start_ball_speed_x = game_state.ball_speed_x
+                episode_memory.clear()
+                self.GAME_OVER = False
+
+                render = self.should_render(epoch, render_every)
+                if render and self.window is None:
+                    self.open_window()
+                elif not render and self.window is not None:
+                    pygame.event.pump()  # keep the window responsive during skipped episodes
+                env.event_driven = event_driven and not render
+                recording = recorder is not None and epoch % record_every == 0
+                checksums.clear()
+                frame = 0
+                episode_frames = 0
+                loops = 0
+                cut = ''
+                if detector is not None:
+                    detector.reset(game_state)
+                    perturb_kicks = -1
+                if phases:
+                    phases.start_episode(len(policy))
+
+                while not self.GAME_OVER:
+                    if render:
+                        for event in pygame.event.get():
+                            if event.type == pygame.QUIT:
+                                self.GAME_OVER = True
+                                self.QUIT = True
+                    if phases:
+                        phases.tick(profiler.EVENTS)
+                    # The score this frame's decision sees, after the env's step penalty
+                    reward = game_state.reward - env.step_penalty
+                    # state_paddle_x = round(paddle_x / 20)
+                    # state_paddle_y = round(paddle_x / 20)
+                    # state_ball_x = round(ball_x / 20)
+                    # state_ball_y = round(ball_y / 20)
+
+                    state = observation
+                    if learn_mode == True:
+                        if state in win_policy.keys():
+                            # if reward > win_policy[state][1]:
+                            #     policy[state] = win_policy[state][0]
+                            # else:
                             new_action = random.choice([-1, 0, 1])
-                        policy[state] = new_action
-                    # else:
-                    #     new_action = random.choice([-1, 0, 1])
-                    #     while new_action == policy[state]:
-                    #         new_action = random.choice([-1, 0, 1])
-                    #     policy[state] = new_action
-                else:
-                    if state in win_policy.keys():
-                        policy[state] = win_policy[state][0]
-                # print(reward)
-                if state not in policy.keys() or reward < -20 * brick_number:
-                    # print("RANDOM")
-                    # if state not in policy.keys() or kicks - (brick_number-len(tuple(bricks))) <= 3:
-                    policy[state] = random.choice([-1, 0, 1])
-
-                action = policy[state]
-
-                paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward, kicks = self.update_game_state(
-                    layout, brick_number, action, paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y,
-                    bricks, reward, kicks)
-                # print("reward", reward)
-                # print("kicks", kicks)
-                # WIN!
-                if len(bricks) == 0:
-                    win_count += 1
-                    print("WIN!!", win_count)
-
-                    print("reward", reward)
-                    episode_memory.append((state, action, 1000, kicks))
-
-                    for state_mem, action_mem, reward_mem, kicks_mem in reversed(episode_memory):
-                        policy[state_mem] = action_mem
-
-                        if state_mem in win_policy:
-                            if reward > win_policy[state_mem][1]:
-                                win_policy[state_mem] = [action_mem, reward]
+                            while new_action == win_policy[state][0]:
+                                new_action = random.choice([-1, 0, 1])
+                            policy[state] = new_action
+                        # else:
+                        #     new_action = random.choice([-1, 0, 1])
+                        #     while new_action == policy[state]:
+                        #         new_action = random.choice([-1, 0, 1])
+                        #     policy[state] = new_action
+                    else:
+                        if state in win_policy.keys():
+                            policy[state] = win_policy[state][0]
+                    # print(reward)
+                    if state not in policy.keys() or reward < -20 * brick_number or kicks == perturb_kicks:
+                        # print("RANDOM")
+                        # if state not in policy.keys() or kicks - (brick_number-len(tuple(bricks))) <= 3:
+                        policy[state] = random.choice([-1, 0, 1])
+
+                    action = policy[state]
+                    if phases:
+                        phases.tick(profiler.POLICY)
+
+                    observation, step_reward, done, info = env.step(action)
+                    if recording and not done and (frame + 1) % trajectory.CHECKSUM_EVERY == 0:
+                        checksums.append(trajectory.state_checksum(self, game_state))
+                    reward = info['score']
+                    kicks = info['kicks']
+                    won = info['won']
+                    if done and not won:
+                        self.GAME_OVER = True
+                    episode_frames += info['frames']
+                    if detector is not None and not done and detector.check(game_state):
+                        loops += 1
+                        if loop_action == 'cut':
+                            cut = 'loop'
+                            self.GAME_OVER = True
                         else:
-                            win_policy[state_mem] = [action_mem, reward]
+                            perturb_kicks = kicks
+                    if max_frames is not None and episode_frames >= max_frames and not done and not cut:
+                        cut = 'cap'
+                        self.GAME_OVER = True
+                    # print("reward", reward)
+                    # print("kicks", kicks)
+                    # WIN!
+                    if won:
+                        episode_memory.append(state, action, 1000, kicks)
+                        credit_win(episode_memory, policy, win_policy, reward)
+                        if trajectories is not None:
+                            trajectories.append(episode_memory.actions[:len(episode_memory)], reward, serve,
+                                                env.event_driven, env.seed)
+
+                        results.write(epoch + 1, "WIN", reward, start_ball_speed_x, episode_frames, loops, cut)
+
+                        start_ball_speed_x = None
+                        reward = 0
+                        kicks = 0
+                        self.GAME_OVER = True
 
-                    results.append(
-                        [epoch + 1, "WIN", reward, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), start_ball_speed_x])
+                    # LOSE
+                    if self.GAME_OVER == True and not won:
+                        # LOOSE
+
+                        credit_loss(episode_memory, policy)
+
+                        # episode_memory = episode_memory[::-1]
+                        # max_kicks = max(item[3] for item in episode_memory)
+                        #
+                        # index_max_kicks = [index for index, item in enumerate(episode_memory) if
+                        #                    item[3] == max_kicks]
+                        # index_max_kicks = index_max_kicks[:-1]
+                        #
+                        # for index in index_max_kicks:
+                        #     state_mem, action_mem, reward_mem, kicks_mem = episode_memory[index]
+                        #
+                        #     # -1 -> 0, 0 -> 1, 1 -> 2
+                        #     # if state_mem not in lose_policy:
+                        #     #     lose_policy[state_mem] = [None, None, None]
+                        #     # lose_policy[state_mem][action_mem + 1] = action_mem
+                        #     if state_mem in policy:
+                        #         new_action = random.choice([-1, 0, 1])
+                        #         # while new_action == action_mem or new_action in lose_policy[state_mem]:
+                        #         while new_action == action_mem:
+                        #             new_action = random.choice([-1, 0, 1])
+                        #         policy[state_mem] = new_action
+
+                        # episode_memory = [item for index, item in enumerate(episode_memory) if index not in index_max_kicks]
+
+                        # for state_mem, action_mem, reward_mem, kicks_mem in episode_memory:
+                        #     # print(reward_mem)
+                        #     print(reward_mem)
+                        #     if kicks_mem - (brick_number - len(state_mem[6])) <= 3:
+                        #         policy[state_mem] = action_mem
+                        #         # print("LOSE BUT WRITE")
+                        #     elif reward_mem >= -50:
+                        #         policy[state_mem] = action_mem
+                        #     else:
+                        #         # print("RANDOM")
+                        #         new_action = action_mem
+                        #         if state_mem in policy:
+                        #             while new_action == action_mem:
+                        #                 new_action = random.choice([-1, 0, 1])
+
+                        # episode_memory = episode_memory[::-1]
+
+                        results.write(epoch + 1, "LOSE", reward, start_ball_speed_x, episode_frames, loops, cut)
+                        # episode_memory.append((state, action, reward, kicks))
+
+                        start_ball_speed_x = None
+                        reward = 0
+                        kicks = 0
+                        self.GAME_OVER = True
 
-                    start_ball_speed_x = None
-                    reward = 0
-                    kicks = 0
-                    self.GAME_OVER = True
+                    if phases:
+                        phases.tick(profiler.CREDIT)
+
+                    if self.GAME_OVER != True and not won:
+                        episode_memory.append(state, action, reward, kicks)
+                    if phases:
+                        phases.tick(profiler.MEMORY)
+
+                    if render and frame % render_frame_every == 0:
+                        self.draw_elements(game_state.paddle_x, paddle_y, game_state.ball_x, game_state.ball_y,
+                                           game_state.bricks)
+                        self.clock.tick(100000)
+                        if phases:
+                            phases.tick(profiler.RENDER)
+                    frame += 1
+
+                if recording and env.done:
+                    # A lost episode's last decision is not in its memory
+                    actions = episode_memory.actions[:len(episode_memory)].tolist()
+                    if not won:
+                        actions.append(action)
+                    recorder.append(actions, info['score'], serve, env.event_driven, env.seed, won, checksums)
+                if tracker is not None:
+                    tracker.mark(episode_memory.keys())
+                    tracker.mark([state])
+                    if won:
+                        tracker.mark_win(episode_memory.keys())
+                if checkpoint is not None and (epoch + 1) % checkpoint_every == 0:
+                    checkpoint.flush(policy, win_policy)
+                    if checkpoint.needs_compaction():
+                        checkpoint.compact(policy, win_policy)
+                if phases:
+                    phases.tick(profiler.CHECKPOINT)
+                    phases.end_episode(epoch + 1, "WIN" if won else "LOSE", frame, len(policy), len(win_policy))
+                if self.QUIT:
+                    break
 
-                # LOSE
-                if self.GAME_OVER == True and len(bricks) != 0:
-                    # LOOSE
+                # game_result = "WIN" if len(bricks) == 0 else "LOSE"
+                # current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-                    for state_mem, action_mem, reward_mem, kicks_mem in reversed(episode_memory):
+                # results.append([epoch + 1, game_result, reward, current_time, start_ball_speed_x])
+        except KeyboardInterrupt:
+            print("Interrupted, saving progress")
 
-                        if kicks_mem <= 1:
-                            if state_mem in policy:
-                                policy[state_mem] = random.choice([-1, 0, 1])
-                        elif reward_mem / kicks_mem > 20:
-                            # print(reward_mem)
-                            policy[state_mem] = action_mem
-                        else:
-                            if state_mem in policy:
-                                policy[state_mem] = random.choice([-1, 0, 1])
-
-                    # episode_memory = episode_memory[::-1]
-                    # max_kicks = max(item[3] for item in episode_memory)
-                    #
-                    # index_max_kicks = [index for index, item in enumerate(episode_memory) if
-                    #                    item[3] == max_kicks]
-                    # index_max_kicks = index_max_kicks[:-1]
-                    #
-                    # for index in index_max_kicks:
-                    #     state_mem, action_mem, reward_mem, kicks_mem = episode_memory[index]
-                    #
-                    #     # -1 -> 0, 0 -> 1, 1 -> 2
-                    #     # if state_mem not in lose_policy:
-                    #     #     lose_policy[state_mem] = [None, None, None]
-                    #     # lose_policy[state_mem][action_mem + 1] = action_mem
-                    #     if state_mem in policy:
-                    #         new_action = random.choice([-1, 0, 1])
-                    #         # while new_action == action_mem or new_action in lose_policy[state_mem]:
-                    #         while new_action == action_mem:
-                    #             new_action = random.choice([-1, 0, 1])
-                    #         policy[state_mem] = new_action
-
-                    # episode_memory = [item for index, item in enumerate(episode_memory) if index not in index_max_kicks]
-
-                    # for state_mem, action_mem, reward_mem, kicks_mem in episode_memory:
-                    #     # print(reward_mem)
-                    #     print(reward_mem)
-                    #     if kicks_mem - (brick_number - len(state_mem[6])) <= 3:
-                    #         policy[state_mem] = action_mem
-                    #         # print("LOSE BUT WRITE")
-                    #     elif reward_mem >= -50:
-                    #         policy[state_mem] = action_mem
-                    #     else:
-                    #         # print("RANDOM")
-                    #         new_action = action_mem
-                    #         if state_mem in policy:
-                    #             while new_action == action_mem:
-                    #                 new_action = random.choice([-1, 0, 1])
-
-                    # episode_memory = episode_memory[::-1]
-
-                    results.append(
-                        [epoch + 1, "LOSE", reward, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), start_ball_speed_x])
-                    # episode_memory.append((state, action, reward, kicks))
-
-                    start_ball_speed_x = None
-                    reward = 0
-                    kicks = 0
-                    self.GAME_OVER = True
-
-                if self.GAME_OVER != True and len(bricks) != 0:
-                    episode_memory.append((state, action, reward, kicks))
-
-                self.draw_elements(paddle_x, paddle_y, ball_x, ball_y, bricks)
-                self.clock.tick(100000)
-
-            # game_result = "WIN" if len(bricks) == 0 else "LOSE"
-            # current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            # results.append([epoch + 1, game_result, reward, current_time, start_ball_speed_x])
-
-        with open('results/' + layout + '_' + str(brick_number) + '_' + str(learn_mode) + '_results.csv', mode='w',
-                  newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Epoch", "Result", "Score", "Date and Time", "Start"])
-            writer.writerows(results)
-
-        new_dict = {str(key): value for key, value in policy.items()}
-        with open('policy/policy_' + layout + '_' + str(brick_number) + '.json', 'w') as f:
-            json.dump(new_dict, f)
+        results.close()
+        if recorder is not None:
+            recorder.close()
+        if trajectories is not None:
+            trajectories.close()
+        if phases:
+            phases.close()
 
-        new_win_dict = {str(key): value for key, value in win_policy.items()}
-        with open('win_policy/win_policy_' + layout + '_' + str(brick_number) + '.json', 'w') as f:
-            json.dump(new_win_dict, f)
+        if checkpoint is not None:
+            checkpoint.compact(policy, win_policy)
+        elif tables is None:
+            self.save_policy(policy, *policy_paths)
+            if trajectories is None:
+                self.save_policy(win_policy, *win_policy_paths, with_reward=True)
 
         # new_lose_dict = {str(key): value for key, value in lose_policy.items()}
         # with open('lose_policy/lose_policy_' + layout + '_' + str(brick_number) + '.json', 'w') as f:
         #     json.dump(new_lose_dict, f)
 
-        pygame.quit()
+        if pygame is not None:
+            pygame.quit()
 
 
 if __name__ == "__main__":
     game = BreakoutGame()
     game.play('rectangle', 6, 5000, learn_mode=True)
+    # The full layout x brick-count grid below runs in parallel with: python sweep.py
     # game.play('rectangle', 6, 1000, learn_mode=False)
     # game = BreakoutGame()
     # game.play('rectangle', 10, 1000, learn_mode=True)
@@ -492,4 +721,5 @@ if __name__ == "__main__":
     # game.play('circle', 15, 1000, learn_mode=True)
     # game = BreakoutGame()
     # game.play('circle', 15, 1000, learn_mode=False)
-    pygame.quit()
+    if pygame is not None:
+        pygame.quit()
@@ -0,0 +1,197 @@
+import random
+import time
+
+import breakout_physics
+import profiler
+
+# Gym-style wrapper around BreakoutGame's rules:
+#   obs = env.reset(seed)
+#   obs, reward, done, info = env.step(action)
+# obs is the game's compact integer state key (BreakoutGame.state_key), reward is this step's change in score
+# (the -0.1 per frame step penalty plus paddle/brick rewards), info is one dict reused across steps holding the
+# episode's running counters: kicks, bricks_left, score and won, plus the frames simulated by the last step.
+# With frame_skip = k a step holds the action for k frames (fewer if the episode ends), summing their rewards.
+# With event_driven a step first jumps over the quiet frames ahead (breakout_physics.quiet_frames: no wall, brick
+# or paddle contact possible, and a falling ball still more than decision_frames frames from the paddle) holding
+# the action, then steps as usual. The jump is bit-identical to stepping those frames one by one
+# (test_breakout_env.py).
+# An abstraction (state_abstraction.StateAbstraction) replaces the raw state key as the observation.
+# Serves are drawn from rng: the shared random module by default, as play() needs for seeded runs to match the
+# frame-by-frame trainer, or a random.Random of the env's own so envs seeded alike serve alike whatever else
+# draws random numbers in between. reset(seed) reseeds that rng; seed is the one this episode was reset with.
+# State lives in a breakout_physics.GameState updated in place, so a step allocates no tuples.
+# snapshot() captures the episode as a flat tuple and restore(snapshot) puts it back, any number of times: the
+# bricks are shared copy-on-write (brick_index.BrickSet.snapshot), so there is no copy of the board. The rng's
+# state is part of it, so a lookahead that loses the ball and serves again leaves the real episode's next serve
+# alone; with the shared random module that rewinds everyone's draws since the snapshot.
+
+
+class BreakoutEnv:
+    def __init__(self, layout='rectangle', brick_number=5, game=None, step_penalty=0.1, frame_skip=1,
+                 event_driven=False, decision_frames=None, abstraction=None, rng=None):
+        if game is None:
+            # Imported here: breakout_classes_final builds its own play() loop on this module
+            from breakout_classes_final import BreakoutGame
+            game = BreakoutGame(headless=True)
+        self.game = game
+        self.layout = layout
+        self.brick_number = brick_number
+        self.step_penalty = step_penalty
+        self.frame_skip = frame_skip
+        self.event_driven = event_driven
+        if decision_frames is None:
+            # Long enough for the paddle to cross the whole field before the ball arrives
+            config = game.physics
+            decision_frames = (config.width - config.paddle_width) // config.max_paddle_speed
+        self.decision_frames = decision_frames
+        self.abstraction = abstraction
+        self.rng = random if rng is None else rng
+        self.seed = None
+        self.state = breakout_physics.GameState(0, 0, 0, 0, 0, 0, None)
+        self.done = True
+        self.info = {'kicks': 0, 'bricks_left': 0, 'score': 0, 'won': False, 'frames': 0}
+        self.profiler = None  # a profiler.PhaseProfiler splits step() into simulation and state-key time
+
+    def serve(self):
+        # Fresh board, paddle and ball from BreakoutGame.reset_game; score and kicks are left alone
+        state = self.state
+        (state.paddle_x, paddle_y, state.paddle_speed, state.ball_x, state.ball_y, state.ball_speed_x,
+         state.ball_speed_y, state.bricks) = self.game.reset_game(self.layout, self.brick_number, self.rng)
+
+    def observation(self):
+        state = self.state
+        if self.abstraction is not None:
+            return self.abstraction.key(self.game, state.paddle_x, state.ball_x, state.ball_y, state.ball_speed_x,
+                                        state.ball_speed_y, state.bricks)
+        return self.game.state_key(state.paddle_x, state.ball_x, state.ball_y, state.ball_speed_x,
+                                   state.ball_speed_y, state.bricks)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng.seed(seed)
+        self.seed = seed
+        self.serve()
+        state = self.state
+        state.reward = 0
+        state.kicks = 0
+        self.done = False
+        info = self.info
+        info['kicks'] = 0
+        info['bricks_left'] = len(state.bricks)
+        info['score'] = 0
+        info['won'] = False
+        info['frames'] = 0
+        return self.observation()
+
+    def snapshot(self):
+        state = self.state
+        return (state.paddle_x, state.paddle_speed, state.ball_x, state.ball_y, state.ball_speed_x,
+                state.ball_speed_y, state.reward, state.kicks, state.bricks.snapshot(), self.rng.getstate(), self.done)
+
+    def restore(self, snapshot):
+        state = self.state
+        (state.paddle_x, state.paddle_speed, state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y,
+         state.reward, state.kicks, bricks, rng_state, self.done) = snapshot
+        state.bricks.restore(bricks)
+        self.rng.setstate(rng_state)
+        info = self.info
+        info['kicks'] = state.kicks
+        info['bricks_left'] = len(state.bricks)
+        info['score'] = state.reward
+        info['won'] = self.done and not len(state.bricks)
+        info['frames'] = 0
+        return self.observation()
+
+    def step(self, action):
+        game = self.game
+        config = game.physics
+        state = self.state
+        score = state.reward
+        quiet = 0
+        if self.event_driven:
+            quiet = breakout_physics.quiet_frames(config, state, self.decision_frames)
+            if quiet:
+                breakout_physics.advance(config, state, quiet, action, self.step_penalty)
+        for frame in range(self.frame_skip):
+            state.reward -= self.step_penalty
+            state.paddle_speed = breakout_physics.accelerate(config, state.paddle_speed, action)
+            breakout_physics.step(config, state)
+            bricks_left = len(state.bricks)
+            lost = state.ball_y >= config.height
+            if lost or bricks_left == 0:
+                break
+        if lost:
+            # A lost ball is served again right away, as update_game_state does, so seeded runs draw
+            # the same random numbers as the frame-by-frame trainer
+            self.serve()
+        self.done = done = lost or bricks_left == 0
+
+        info = self.info
+        info['kicks'] = state.kicks
+        info['bricks_left'] = bricks_left
+        info['score'] = state.reward
+        info['won'] = not lost and bricks_left == 0
+        info['frames'] = quiet + frame + 1
+        phases = self.profiler
+        if phases is None:
+            return self.observation(), state.reward - score, done, info
+        phases.tick(profiler.STEP)
+        phases.frames += quiet + frame + 1
+        observation = self.observation()
+        phases.tick(profiler.STATE_KEY)
+        return observation, state.reward - score, done, info
+
+
+def benchmark(layout='rectangle', brick_number=15, frames=300000, seed=0):
+    # Frames/s of the raw update_game_state call against env.step on the same actions, and the microseconds a
+    # snapshot plus restore takes
+    from breakout_classes_final import BreakoutGame
+    game = BreakoutGame(headless=True)
+    rng = random.Random(seed)
+    actions = [rng.choice([-1, 0, 1]) for _ in range(frames)]
+
+    paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = game.reset_game(
+        layout, brick_number)
+    start = time.perf_counter()
+    for action in actions:
+        paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward, kicks = \
+            game.update_game_state(layout, brick_number, action, paddle_x, paddle_speed, ball_x, ball_y,
+                                   ball_speed_x, ball_speed_y, bricks, 0, 0)
+        state = game.state_key(paddle_x, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks)
+    raw_rate = frames / (time.perf_counter() - start)
+
+    env = BreakoutEnv(layout, brick_number, game=game)
+    env.reset(seed)
+    start = time.perf_counter()
+    for action in actions:
+        state, reward, done, info = env.step(action)
+        if done:
+            env.reset()
+    env_rate = frames / (time.perf_counter() - start)
+
+    # Event-driven: the same number of simulated frames, a decision only at every step
+    env = BreakoutEnv(layout, brick_number, game=game, event_driven=True)
+    env.reset(seed)
+    simulated = decisions = 0
+    start = time.perf_counter()
+    while simulated < frames:
+        state, reward, done, info = env.step(actions[decisions % frames])
+        simulated += info['frames']
+        decisions += 1
+        if done:
+            env.reset()
+    event_rate = simulated / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        env.restore(env.snapshot())
+    snapshot_us = (time.perf_counter() - start) * 100
+    return raw_rate, env_rate, event_rate, simulated / decisions, snapshot_us
+
+
+if __name__ == "__main__":
+    for layout in ['rectangle', 'triangle', 'circle']:
+        raw_rate, env_rate, event_rate, frames_per_decision, snapshot_us = benchmark(layout)
+        print(f"{layout:9}  update_game_state {raw_rate:10,.0f} frames/s  env.step {env_rate:10,.0f} frames/s  "
+              f"event-driven {event_rate:12,.0f} frames/s ({frames_per_decision:.1f} frames/decision)  "
+              f"snapshot+restore {snapshot_us:.1f} us")
@@ -0,0 +1,308 @@
+import math
+
+# Game rules shared by the trainer (breakout_classes_final.py) and the interactive player (play.py).
+# Plain floats and ints only, no pygame: the collision tests reproduce pygame.Rect semantics, which
+# truncate float coordinates towards zero before comparing; test_breakout_physics.py checks that they still do.
+# benchmark() imports pygame to time the helpers against it.
+
+
+class PhysicsConfig:
+    __slots__ = ('width', 'height', 'paddle_width', 'paddle_height', 'paddle_y', 'max_paddle_speed',
+                 'ball_radius', 'ball_speed_y', 'ball_speed_x_max', 'reflect_left', 'reflect_right',
+                 'paddle_reward', 'brick_reward')
+
+    def __init__(self, width=450, height=600, paddle_width=100, paddle_height=20, max_paddle_speed=2,
+                 ball_radius=10, ball_speed_y=3, ball_speed_x_max=2, paddle_reward=10, brick_reward=50):
+        self.width = width
+        self.height = height
+        self.paddle_width = paddle_width
+        self.paddle_height = paddle_height
+        self.paddle_y = height - paddle_height - 10
+        self.max_paddle_speed = max_paddle_speed
+        self.ball_radius = ball_radius
+        self.ball_speed_y = ball_speed_y
+        self.ball_speed_x_max = ball_speed_x_max
+        # Reflection speeds off the paddle, 45 degrees to either side
+        self.reflect_left = math.sin(-math.pi / 4) * ball_speed_x_max
+        self.reflect_right = math.sin(math.pi / 4) * ball_speed_x_max
+        self.paddle_reward = paddle_reward
+        self.brick_reward = brick_reward
+
+
+class GameState:
+    __slots__ = ('paddle_x', 'paddle_speed', 'ball_x', 'ball_y', 'ball_speed_x', 'ball_speed_y', 'bricks',
+                 'reward', 'kicks')
+
+    def __init__(self, paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward=0,
+                 kicks=0):
+        self.paddle_x = paddle_x
+        self.paddle_speed = paddle_speed
+        self.ball_x = ball_x
+        self.ball_y = ball_y
+        self.ball_speed_x = ball_speed_x
+        self.ball_speed_y = ball_speed_y
+        self.bricks = bricks
+        self.reward = reward
+        self.kicks = kicks
+
+
+def rects_overlap(ax, ay, aw, ah, bx, by, bw, bh):
+    # pygame.Rect.colliderect for rects with positive size
+    ax, ay, bx, by = int(ax), int(ay), int(bx), int(by)
+    return ax < bx + bw and ay < by + bh and ax + aw > bx and ay + ah > by
+
+
+def point_in_rect(px, py, rx, ry, rw, rh):
+    # pygame.Rect.collidepoint
+    px, py = int(px), int(py)
+    return rx <= px < rx + rw and ry <= py < ry + rh
+
+
+def accelerate(config, paddle_speed, action):
+    # Trainer actions: -1/1 push the paddle one step further left/right, anything else stops it
+    if action == -1:
+        return max(paddle_speed - 1, -config.max_paddle_speed)
+    elif action == 1:
+        return min(paddle_speed + 1, config.max_paddle_speed)
+    return 0
+
+
+def move_paddle(config, paddle_x, paddle_speed):
+    paddle_x += paddle_speed
+    if paddle_x < 0:
+        paddle_x = 0
+    if paddle_x > config.width - config.paddle_width:
+        paddle_x = config.width - config.paddle_width
+    return paddle_x
+
+
+def move_ball(ball_x, ball_y, ball_speed_x, ball_speed_y):
+    return ball_x + ball_speed_x, ball_y + ball_speed_y
+
+
+def check_wall_collision(config, ball_x, ball_y, ball_speed_x, ball_speed_y):
+    if ball_x - config.ball_radius <= 0 or ball_x + config.ball_radius >= config.width:
+        ball_speed_x *= -1
+    if ball_y - config.ball_radius <= 0:
+        ball_speed_y *= -1
+    return ball_speed_x, ball_speed_y
+
+
+def check_paddle_collision(config, ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, paddle_y):
+    # Returns the new ball speeds and whether the ball touched the paddle
+    # rects_overlap() of the ball's bounding box and the paddle, inlined with the vertical test first:
+    # most frames the ball is nowhere near the paddle's row
+    r = config.ball_radius
+    ball_top = int(ball_y - r)
+    if ball_top + r * 2 <= paddle_y or ball_top >= paddle_y + config.paddle_height:
+        return ball_speed_x, ball_speed_y, False
+    ball_left = int(ball_x - r)
+    paddle_left = int(paddle_x)
+    if ball_left + r * 2 <= paddle_left or ball_left >= paddle_left + config.paddle_width:
+        return ball_speed_x, ball_speed_y, False
+
+    ball_speed_y *= -1
+    # Reflect to the side the ball was travelling towards
+    ball_speed_x = config.reflect_left if ball_speed_x < 0 else config.reflect_right
+
+    # Adjust the ball's horizontal direction if it's in contact with both paddle and wall
+    if (ball_speed_x < 0 and ball_x + r >= paddle_x + config.paddle_width) or (
+            ball_speed_x > 0 and ball_x - r <= paddle_x):
+        ball_speed_x *= -1
+
+    # Adjust the ball's vertical direction to prevent sticking
+    if ball_speed_y > 0:
+        ball_speed_y = -config.ball_speed_y
+    return ball_speed_x, ball_speed_y, True
+
+
+def find_brick_hit(bricks, ball_x, ball_y, ball_speed_x, ball_speed_y):
+    # Linear scan over a plain list of (x, y, w, h) bricks: the first brick hit by the horizontal probe
+    # (x + speed_x, y) or, failing that, the vertical probe (x, y + speed_y). Returns (index, horizontal).
+    for i, (x, y, w, h) in enumerate(bricks):
+        if point_in_rect(ball_x + ball_speed_x, ball_y, x, y, w, h):
+            return i, True
+        elif point_in_rect(ball_x, ball_y + ball_speed_y, x, y, w, h):
+            return i, False
+    return None
+
+
+def step(config, state):
+    # One frame with the paddle speed already chosen. state.bricks is a brick_index.BrickSet.
+    # Returns the id of the brick hit this frame or -1; the paddle hit shows up in state.kicks/reward.
+    state.paddle_x = move_paddle(config, state.paddle_x, state.paddle_speed)
+    ball_x, ball_y = move_ball(state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y)
+    state.ball_x, state.ball_y = ball_x, ball_y
+    ball_speed_x, ball_speed_y = check_wall_collision(config, ball_x, ball_y, state.ball_speed_x,
+                                                      state.ball_speed_y)
+    ball_speed_x, ball_speed_y, on_paddle = check_paddle_collision(config, ball_x, ball_y, ball_speed_x,
+                                                                   ball_speed_y, state.paddle_x, config.paddle_y)
+    if on_paddle:
+        state.reward += config.paddle_reward
+        state.kicks += 1
+
+    brick_id = -1
+    hit = state.bricks.hit(ball_x, ball_y, ball_speed_x, ball_speed_y)
+    if hit is not None:
+        brick_id, horizontal = hit
+        state.bricks.remove_id(brick_id)
+        if horizontal:
+            ball_speed_x *= -1
+        else:
+            ball_speed_y *= -1
+        state.reward += config.brick_reward
+        state.kicks += 1
+
+    state.ball_speed_x, state.ball_speed_y = ball_speed_x, ball_speed_y
+    return brick_id
+
+
+INFINITE_FRAMES = 1 << 30
+
+
+def frames_before(room, speed):
+    # Whole frames t >= 0 for which position + t * speed stays strictly short of a limit `room` ahead
+    if speed <= 0:
+        return INFINITE_FRAMES
+    if room <= 0:
+        return 0
+    return max(int(room / speed) - 1, 0)
+
+
+def quiet_frames(config, state, decision_frames):
+    # Conservative count of the frames ahead in which nothing but straight-line motion can happen: the ball
+    # touches no wall, brick or the paddle row, and a falling ball is more than decision_frames frames away
+    # from the paddle row. One pixel of slack (plus a frame of probe reach around bricks) covers the float
+    # drift between t * speed and t repeated additions.
+    r = config.ball_radius
+    x, y = state.ball_x, state.ball_y
+    vx, vy = state.ball_speed_x, state.ball_speed_y
+
+    # Paddle row: the ball may overlap the paddle once its bottom passes paddle_y - 1. Inside it, always step.
+    to_paddle = config.paddle_y - 1 - r - y
+    if to_paddle <= abs(vy):
+        return 0
+    frames = frames_before(config.width - 1 - r - x, vx)
+    frames = min(frames, frames_before(x - r - 1, -vx), frames_before(y - r - 1, -vy))
+    if vy > 0:
+        frames = min(frames, max(frames_before(to_paddle, vy) - decision_frames, 0))
+    if frames == 0:
+        return 0
+
+    # Bricks: a probe can only hit a brick while the ball centre is inside it grown by the speed plus a pixel
+    bricks = state.bricks
+    grid = bricks.grid
+    reach_x = abs(vx) + 1
+    reach_y = abs(vy) + 1
+    for i, alive in enumerate(bricks.alive):
+        if not alive:
+            continue
+        enter, leave = 0.0, float(frames + 1)
+        for position, speed, low, high in ((x, vx, grid.left[i] - reach_x, grid.right[i] + reach_x),
+                                           (y, vy, grid.top[i] - reach_y, grid.bottom[i] + reach_y)):
+            if speed == 0:
+                if not low < position < high:
+                    enter, leave = 1.0, 0.0
+                continue
+            t_low = (low - position) / speed
+            t_high = (high - position) / speed
+            if t_low > t_high:
+                t_low, t_high = t_high, t_low
+            enter = max(enter, t_low)
+            leave = min(leave, t_high)
+        if enter < leave:
+            frames = min(frames, max(int(enter) - 1, 0))
+            if frames == 0:
+                return 0
+    return frames
+
+
+def advance(config, state, frames, action, step_penalty=0.0):
+    # Runs `frames` quiet frames (see quiet_frames) with the action held, without any collision tests.
+    # Positions and the score are still accumulated frame by frame so the result is bit-identical to stepping.
+    paddle_speed = state.paddle_speed
+    paddle_x = state.paddle_x
+    low, high = 0, config.width - config.paddle_width
+    # The paddle speed settles after at most 2 * max_paddle_speed frames, after which it moves in a straight line
+    while frames and paddle_speed != accelerate(config, paddle_speed, action):
+        paddle_speed = accelerate(config, paddle_speed, action)
+        paddle_x = min(max(paddle_x + paddle_speed, low), high)
+        ball_x, ball_y = state.ball_x + state.ball_speed_x, state.ball_y + state.ball_speed_y
+        state.ball_x, state.ball_y = ball_x, ball_y
+        state.reward -= step_penalty
+        frames -= 1
+    state.paddle_speed = paddle_speed
+    state.paddle_x = min(max(paddle_x + paddle_speed * frames, low), high)
+
+    ball_x, ball_y, reward = state.ball_x, state.ball_y, state.reward
+    speed_x, speed_y = state.ball_speed_x, state.ball_speed_y
+    for _ in range(frames):
+        ball_x += speed_x
+        ball_y += speed_y
+        reward -= step_penalty
+    state.ball_x, state.ball_y, state.reward = ball_x, ball_y, reward
+
+
+def pygame_brick_hit(pygame, bricks, ball_x, ball_y, ball_speed_x, ball_speed_y):
+    # The original check_brick_collision probes on pygame.Rect, the reference find_brick_hit is tested and timed against
+    for i, brick in enumerate(bricks):
+        brick_rect = pygame.Rect(*brick)
+        if brick_rect.collidepoint(ball_x + ball_speed_x, ball_y):
+            return i, True
+        elif brick_rect.collidepoint(ball_x, ball_y + ball_speed_y):
+            return i, False
+    return None
+
+
+def benchmark(layout='rectangle', brick_number=15, calls=200000, frames=300000, seed=0):
+    # Calls/s of each helper against the pygame.Rect tests it replaces (building the Rects, as the old code did
+    # per test), and frames/s of step() over a random-action game
+    import random
+    import time
+    import pygame
+    from breakout_classes_final import BreakoutGame
+    game = BreakoutGame(headless=True)
+    config = game.physics
+    rng = random.Random(seed)
+    bricks = list(game.reset_bricks(layout, brick_number))
+    samples = [(rng.uniform(0, config.width), rng.uniform(0, config.height), rng.choice([-1.5, 0, 1.5]),
+                rng.choice([-3, -1, 1, 3]), rng.uniform(0, config.width - config.paddle_width))
+               for _ in range(calls)]
+    r = config.ball_radius
+    paddle_y, paddle_width, paddle_height = config.paddle_y, config.paddle_width, config.paddle_height
+    rates = {}
+
+    def rate(name, function):
+        start = time.perf_counter()
+        for sample in samples:
+            function(*sample)
+        rates[name] = calls / (time.perf_counter() - start)
+
+    rate('rects_overlap', lambda x, y, sx, sy, px: rects_overlap(x - r, y - r, r * 2, r * 2, px, paddle_y,
+                                                                 paddle_width, paddle_height))
+    rate('pygame colliderect', lambda x, y, sx, sy, px: pygame.Rect(x - r, y - r, r * 2, r * 2).colliderect(
+        pygame.Rect(px, paddle_y, paddle_width, paddle_height)))
+    rate('point_in_rect', lambda x, y, sx, sy, px: point_in_rect(x, y, *bricks[0]))
+    rate('pygame collidepoint', lambda x, y, sx, sy, px: pygame.Rect(*bricks[0]).collidepoint(x, y))
+    rate('find_brick_hit', lambda x, y, sx, sy, px: find_brick_hit(bricks, x, y, sx, sy))
+    rate('pygame brick scan', lambda x, y, sx, sy, px: pygame_brick_hit(pygame, bricks, x, y, sx, sy))
+
+    state = GameState(0, 0, 0, 0, 0, 0, None)
+    actions = [rng.choice([-1, 0, 1]) for _ in range(frames)]
+    start = time.perf_counter()
+    for action in actions:
+        if state.bricks is None or not len(state.bricks) or state.ball_y >= config.height:
+            (state.paddle_x, paddle_y, state.paddle_speed, state.ball_x, state.ball_y, state.ball_speed_x,
+             state.ball_speed_y, state.bricks) = game.reset_game(layout, brick_number, rng)
+        state.paddle_speed = accelerate(config, state.paddle_speed, action)
+        step(config, state)
+    rates['step'] = frames / (time.perf_counter() - start)
+    return rates
+
+
+if __name__ == "__main__":
+    # The agreement with pygame.Rect is checked by test_breakout_physics.py
+    for layout in ['rectangle', 'triangle', 'circle']:
+        rates = benchmark(layout)
+        print(f"{layout:9} step() {rates.pop('step'):,.0f} frames/s")
+        print('    ' + '  '.join(f"{name} {value:,.0f}/s" for name, value in rates.items()))
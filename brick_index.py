@@ -0,0 +1,173 @@
+import random
+import time
+
+
+class BrickGrid:
+    # Immutable collision index of one layout: a uniform grid over the bricks' bounding box, each cell
+    # listing (in layout order) the bricks overlapping it, plus the bricks' bounds as plain ints.
+    # pygame.Rect.collidepoint truncates its point to ints, so the probes below do the same.
+    def __init__(self, bricks, cell_width, cell_height):
+        self.bricks = tuple(bricks)
+        self.ids = {brick: i for i, brick in enumerate(self.bricks)}
+        self.left = [x for x, y, w, h in self.bricks]
+        self.top = [y for x, y, w, h in self.bricks]
+        self.right = [x + w for x, y, w, h in self.bricks]
+        self.bottom = [y + h for x, y, w, h in self.bricks]
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+
+        self.min_x = min(self.left, default=0)
+        self.min_y = min(self.top, default=0)
+        self.cols = (max(self.right, default=0) - self.min_x + cell_width - 1) // cell_width
+        self.rows = (max(self.bottom, default=0) - self.min_y + cell_height - 1) // cell_height
+        self.cells = [[] for _ in range(self.cols * self.rows)]
+        for i in range(len(self.bricks)):
+            for row in range((self.top[i] - self.min_y) // cell_height,
+                             (self.bottom[i] - 1 - self.min_y) // cell_height + 1):
+                for col in range((self.left[i] - self.min_x) // cell_width,
+                                 (self.right[i] - 1 - self.min_x) // cell_width + 1):
+                    self.cells[row * self.cols + col].append(i)
+
+    def __len__(self):
+        return len(self.bricks)
+
+    def cell(self, x, y):
+        col = (x - self.min_x) // self.cell_width
+        row = (y - self.min_y) // self.cell_height
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return self.cells[row * self.cols + col]
+        return ()
+
+    def hit(self, alive, ball_x, ball_y, ball_speed_x, ball_speed_y):
+        # Same answer as scanning the alive bricks in layout order and testing, per brick, the horizontal
+        # probe (x + speed_x, y) before the vertical probe (x, y + speed_y).
+        # Returns (brick id, horizontal) or None.
+        hx, hy = int(ball_x + ball_speed_x), int(ball_y)
+        vx, vy = int(ball_x), int(ball_y + ball_speed_y)
+        horizontal_cell = self.cell(hx, hy)
+        vertical_cell = self.cell(vx, vy)
+        if not horizontal_cell and not vertical_cell:
+            return None
+        if horizontal_cell is vertical_cell or not vertical_cell:
+            candidates = horizontal_cell
+        elif not horizontal_cell:
+            candidates = vertical_cell
+        else:
+            candidates = sorted(set(horizontal_cell).union(vertical_cell))
+        left, top, right, bottom = self.left, self.top, self.right, self.bottom
+        for i in candidates:
+            if not alive[i]:
+                continue
+            if left[i] <= hx < right[i] and top[i] <= hy < bottom[i]:
+                return i, True
+            if left[i] <= vx < right[i] and top[i] <= vy < bottom[i]:
+                return i, False
+        return None
+
+
+class BrickSet:
+    # The alive bricks of one game: a shared BrickGrid plus an alive flag per brick.
+    # Iterates like the old brick list (alive bricks in layout order) and removes in O(1).
+    # key is the alive bricks' part of the state key: bits[i] is brick i's bit (layouts.Layout.brick_bits, bit i by
+    # default), flipped as the brick is removed, so every game keeps its own mask next to the flags it mirrors.
+    # snapshot() hands out the alive list itself and restore() adopts one; either marks it shared, and the next
+    # removal copies it first, so snapshots cost nothing until the game they were taken from changes.
+    def __init__(self, grid, bits=None):
+        self.grid = grid
+        self.bits = bits if bits is not None else tuple(1 << i for i in range(len(grid)))
+        self.alive = [True] * len(grid)
+        self.count = len(grid)
+        self.key = sum(self.bits)
+        self.shared = False
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (brick for brick, alive in zip(self.grid.bricks, self.alive) if alive)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def remove_id(self, i):
+        if self.shared:
+            self.alive = list(self.alive)
+            self.shared = False
+        self.alive[i] = False
+        self.count -= 1
+        self.key ^= self.bits[i]
+
+    def snapshot(self):
+        self.shared = True
+        return self.grid, self.bits, self.alive, self.count, self.key
+
+    def restore(self, snapshot):
+        self.grid, self.bits, self.alive, self.count, self.key = snapshot
+        self.shared = True
+
+    def remove(self, brick):
+        i = self.grid.ids[brick]
+        if not self.alive[i]:
+            raise ValueError(brick)
+        self.remove_id(i)
+
+    def hit(self, ball_x, ball_y, ball_speed_x, ball_speed_y):
+        if not self.count:
+            return None
+        return self.grid.hit(self.alive, ball_x, ball_y, ball_speed_x, ball_speed_y)
+
+
+def linear_scan(bricks, ball_x, ball_y, ball_speed_x, ball_speed_y):
+    # The previous check_brick_collision loop, kept as the reference for benchmark() and test_brick_index.py
+    import pygame
+    for brick in bricks:
+        brick_rect = pygame.Rect(*brick)
+        if brick_rect.collidepoint(ball_x + ball_speed_x, ball_y):
+            bricks.remove(brick)
+            return brick, True
+        elif brick_rect.collidepoint(ball_x, ball_y + ball_speed_y):
+            bricks.remove(brick)
+            return brick, False
+    return None
+
+
+def benchmark(game, layout, brick_number, probes=200000, seed=0):
+    # Ball positions sampled over the upper part of the field, where the bricks are
+    bricks = list(game.reset_bricks(layout, brick_number))
+    grid = BrickGrid(bricks, game.BRICK_WIDTH, game.BRICK_HEIGHT)
+    rng = random.Random(seed)
+    speeds = [1.414213562373095, -1.414213562373095, 0]
+    samples = [(rng.uniform(0, game.WIDTH), rng.uniform(0, game.HEIGHT / 2), rng.choice(speeds),
+                rng.choice([-3, -1, 1, 3])) for _ in range(probes)]
+
+    scan_bricks = list(bricks)
+    brick_set = BrickSet(grid)
+    start = time.perf_counter()
+    for sample in samples:
+        if linear_scan(scan_bricks, *sample) is not None and len(scan_bricks) < brick_number // 2:
+            scan_bricks = list(bricks)
+    scan_rate = probes / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for sample in samples:
+        hit = brick_set.hit(*sample)
+        if hit is not None:
+            brick_set.remove_id(hit[0])
+            if len(brick_set) < brick_number // 2:
+                brick_set = BrickSet(grid)
+    grid_rate = probes / (time.perf_counter() - start)
+    return scan_rate, grid_rate
+
+
+if __name__ == "__main__":
+    from breakout_classes_final import BreakoutGame
+
+    game = BreakoutGame(headless=True)
+    for layout in ['rectangle', 'triangle', 'circle']:
+        for brick_number in [6, 10, 15, 50]:
+            scan_rate, grid_rate = benchmark(game, layout, brick_number)
+            print(f"{layout:9} {brick_number:2}  linear scan {scan_rate:11,.0f} probes/s  "
+                  f"grid {grid_rate:11,.0f} probes/s  x{grid_rate / scan_rate:.1f}")
@@ -0,0 +1,113 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import policy_store
+
+# Delta log next to the policy file, one block per flush:
+#   header   magic, policy entry count, win_policy entry count, crc32 of the payload
+#   payload  policy masks, fields (uint64), actions (int8)
+#            win_policy masks, fields (uint64), actions (int8), rewards (float64)
+# Blocks are only appended, so a crash can at worst leave a torn last block, which fails its
+# checksum and is dropped on replay.
+BLOCK = struct.Struct('<4sIII')
+BLOCK_MAGIC = b'PDLT'
+
+
+class PolicyCheckpoint:
+    def __init__(self, game, layout, brick_number, policy_format='bin', frame_skip=1, event_driven=False,
+                 abstraction=None):
+        self.game = game
+        self.field_bits = game.FIELD_BITS
+        run = (frame_skip, event_driven, abstraction)
+        self.policy_paths = (game.policy_path(layout, brick_number, 'json', *run),
+                             game.policy_path(layout, brick_number, 'bin', *run), policy_format)
+        self.win_policy_paths = (game.win_policy_path(layout, brick_number, 'json', *run),
+                                 game.win_policy_path(layout, brick_number, 'bin', *run), policy_format)
+        self.log_path = game.policy_path(layout, brick_number, 'log', *run)
+        self.dirty = set()
+        self.win_dirty = set()
+
+    def load(self):
+        # Last compacted tables plus every intact block logged after them
+        policy = self.game.load_policy(*self.policy_paths)
+        win_policy = self.game.load_policy(*self.win_policy_paths)
+        if os.path.exists(self.log_path):
+            valid_size = self.replay(policy, win_policy)
+            if valid_size < os.path.getsize(self.log_path):
+                with open(self.log_path, 'r+b') as f:
+                    f.truncate(valid_size)
+        return policy, win_policy
+
+    def replay(self, policy, win_policy):
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + BLOCK.size <= len(data):
+            magic, count, win_count, checksum = BLOCK.unpack_from(data, offset)
+            payload_size = count * 17 + win_count * 25
+            payload = data[offset + BLOCK.size:offset + BLOCK.size + payload_size]
+            if magic != BLOCK_MAGIC or len(payload) != payload_size or zlib.crc32(payload) != checksum:
+                break
+            position = 0
+            for target, entries, with_reward in [(policy, count, False), (win_policy, win_count, True)]:
+                masks = np.frombuffer(payload, np.uint64, entries, position)
+                fields = np.frombuffer(payload, np.uint64, entries, position + entries * 8)
+                actions = np.frombuffer(payload, np.int8, entries, position + entries * 16).tolist()
+                position += entries * 17
+                keys = policy_store.join_keys(masks, fields, self.field_bits)
+                if with_reward:
+                    rewards = np.frombuffer(payload, np.float64, entries, position).tolist()
+                    position += entries * 8
+                    target.update((key, [action, reward]) for key, action, reward in zip(keys, actions, rewards))
+                else:
+                    target.update(zip(keys, actions))
+            offset += BLOCK.size + payload_size
+        return offset
+
+    def mark(self, states):
+        self.dirty.update(states)
+
+    def mark_win(self, states):
+        self.win_dirty.update(states)
+
+    def flush(self, policy, win_policy):
+        # Appends only the entries changed since the last flush, so the cost follows the changes
+        if not self.dirty and not self.win_dirty:
+            return
+        parts = []
+        keys = [key for key in self.dirty if key in policy]
+        masks, fields = policy_store.split_keys(keys, self.field_bits)
+        parts += [masks.tobytes(), fields.tobytes(), np.array([policy[key] for key in keys], np.int8).tobytes()]
+        win_keys = [key for key in self.win_dirty if key in win_policy]
+        masks, fields = policy_store.split_keys(win_keys, self.field_bits)
+        parts += [masks.tobytes(), fields.tobytes(),
+                  np.array([win_policy[key][0] for key in win_keys], np.int8).tobytes(),
+                  np.array([win_policy[key][1] for key in win_keys], np.float64).tobytes()]
+        payload = b''.join(parts)
+
+        with open(self.log_path, 'ab') as f:
+            f.write(BLOCK.pack(BLOCK_MAGIC, len(keys), len(win_keys), zlib.crc32(payload)) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.dirty.clear()
+        self.win_dirty.clear()
+
+    def needs_compaction(self):
+        # Rewriting the tables once the log outgrows them keeps the total write cost linear in the changes
+        if not os.path.exists(self.log_path):
+            return False
+        main_path = self.policy_paths[1] if self.policy_paths[2] == 'bin' else self.policy_paths[0]
+        main_size = os.path.getsize(main_path) if os.path.exists(main_path) else 0
+        return os.path.getsize(self.log_path) > main_size
+
+    def compact(self, policy, win_policy):
+        # Everything pending goes to the log first: if the process dies between the two table writes,
+        # replaying the log over them still yields the in-memory tables
+        self.flush(policy, win_policy)
+        self.game.save_policy(policy, *self.policy_paths)
+        self.game.save_policy(win_policy, *self.win_policy_paths, with_reward=True)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
@@ -0,0 +1,161 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from breakout_classes_final import BreakoutGame
+from breakout_env import BreakoutEnv
+from state_abstraction import parse
+
+# Read-only evaluation of a learned policy: M seeded headless episodes over worker processes, aggregated into
+# win rate, score distribution, episode lengths and throughput. Unlike play(learn_mode=False) nothing is
+# written back: the policy files are only read, and the random actions play() would store for unknown states
+# (or when the score drops below -20 per brick) live in a per-episode overlay instead.
+# The tables are loaded once in the parent, win_policy actions folded over policy, and the workers are forked
+# after gc.freeze(): they read the parent's dicts copy-on-write. Lookups never write to the stored keys, so the
+# pages stay shared. Where fork is unavailable each worker loads the tables itself.
+ACTIONS = [-1, 0, 1]
+PERCENTILES = (5, 25, 50, 75, 95)
+MAX_DECISIONS = 200000  # an episode still running after this many decisions counts as a loss, see 'capped'
+
+shared = None  # (actions, win_states) of the policy under evaluation, set before the workers start
+
+
+def load_tables(layout, brick_number, policy_format='json', frame_skip=1, event_driven=False, abstraction=None,
+                layout_file=None):
+    game = BreakoutGame(headless=True, layout_file=layout_file)
+    game.reset_bricks(layout, brick_number)
+    run = (frame_skip, event_driven, abstraction)
+    policy = game.load_policy(game.policy_path(layout, brick_number, 'json', *run),
+                              game.policy_path(layout, brick_number, 'bin', *run), policy_format)
+    win_policy = game.load_policy(game.win_policy_path(layout, brick_number, 'json', *run),
+                                  game.win_policy_path(layout, brick_number, 'bin', *run), policy_format)
+    # The action play(learn_mode=False) takes in each known state: win_policy's where it has one
+    policy.update((state, value[0]) for state, value in win_policy.items())
+    return policy, frozenset(win_policy)
+
+
+def init_worker(config):
+    global shared
+    if shared is None:
+        shared = load_tables(*config)
+
+
+def run_episode(env, actions, win_states, seed, threshold, max_decisions):
+    # One seeded episode following the policy: (won, score, decisions, frames, capped)
+    rng = random.Random(seed)
+    observation = env.reset(seed)
+    state = env.state
+    overlay = {}
+    frames = 0
+    for decision in range(max_decisions):
+        action = overlay.get(observation)
+        if action is None:
+            action = actions.get(observation)
+        if action is None or state.reward - env.step_penalty < threshold:
+            action = rng.choice(ACTIONS)
+            if observation not in win_states:
+                overlay[observation] = action
+        observation, reward, done, info = env.step(action)
+        frames += info['frames']
+        if done:
+            return info['won'], info['score'], decision + 1, frames, False
+    return False, state.reward, max_decisions, frames, True
+
+
+def run_seeds(config, seeds, max_decisions):
+    layout, brick_number, policy_format, frame_skip, event_driven, abstraction, layout_file = config
+    actions, win_states = shared
+    env = BreakoutEnv(layout, brick_number, game=BreakoutGame(headless=True, layout_file=layout_file),
+                      frame_skip=frame_skip, event_driven=event_driven, abstraction=abstraction, rng=random.Random())
+    threshold = -20 * brick_number
+    start = time.perf_counter()
+    rows = [run_episode(env, actions, win_states, seed, threshold, max_decisions) for seed in seeds]
+    return rows, time.perf_counter() - start
+
+
+def summarize(rows, wall_time, worker_seconds):
+    won, score, decisions, frames, capped = (np.array(column) for column in zip(*rows))
+    return {
+        'episodes': len(rows), 'wins': int(won.sum()), 'win_rate': float(won.mean()), 'capped': int(capped.sum()),
+        'score_mean': float(score.mean()), 'score_std': float(score.std()), 'score_min': float(score.min()),
+        'score_max': float(score.max()),
+        'score_percentiles': {p: float(v) for p, v in zip(PERCENTILES, np.percentile(score, PERCENTILES))},
+        'decision_percentiles': {p: float(v) for p, v in zip(PERCENTILES, np.percentile(decisions, PERCENTILES))},
+        'frame_percentiles': {p: float(v) for p, v in zip(PERCENTILES, np.percentile(frames, PERCENTILES))},
+        'wall_time': wall_time, 'episodes_per_sec': len(rows) / wall_time, 'frames_per_sec': frames.sum() / wall_time,
+        'frames_per_worker_sec': frames.sum() / worker_seconds if worker_seconds else 0.0,
+    }
+
+
+def evaluate(layout='rectangle', brick_number=6, episodes=1000, seed=0, workers=None, policy_format='json',
+             frame_skip=1, event_driven=False, abstraction=None, max_decisions=MAX_DECISIONS, layout_file=None):
+    # Seeds seed .. seed + episodes - 1, one episode each, so results do not depend on the worker count
+    global shared
+    if episodes < 1:
+        raise ValueError("episodes must be at least 1, got " + str(episodes))
+    config = (layout, brick_number, policy_format, frame_skip, event_driven, abstraction, layout_file)
+    workers = min(workers or os.cpu_count(), episodes)
+    chunks = [list(range(seed + i, seed + episodes, workers)) for i in range(workers)]
+    start = time.perf_counter()
+    tables = load_tables(*config)
+    load_time = time.perf_counter() - start
+    if 'fork' in multiprocessing.get_all_start_methods():
+        shared = tables
+        gc.freeze()  # keep the collector from touching, and so copying, the shared tables in the workers
+        context = multiprocessing.get_context('fork')
+    else:
+        context = None
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker, initargs=(config,)) as pool:
+            results = list(pool.map(run_seeds, [config] * workers, chunks, [max_decisions] * workers))
+    finally:
+        shared = None
+        gc.unfreeze()
+    wall_time = time.perf_counter() - start
+    rows = [row for chunk_rows, _ in results for row in chunk_rows]
+    report = summarize(rows, wall_time, sum(seconds for _, seconds in results))
+    report.update({'layout': layout, 'bricks': brick_number, 'seed': seed, 'workers': workers,
+                   'policy_states': len(tables[0]), 'load_time': load_time})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only parallel evaluation of a learned policy")
+    parser.add_argument('--layout', default='rectangle')
+    parser.add_argument('--bricks', type=int, default=6)
+    parser.add_argument('--episodes', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--policy-format', default='json', choices=['json', 'bin'])
+    parser.add_argument('--frame-skip', type=int, default=1)
+    parser.add_argument('--event-driven', action='store_true')
+    parser.add_argument('--abstraction', default=None, help="e.g. p20_x20_y20_rel_sign, see state_abstraction.py")
+    parser.add_argument('--max-decisions', type=int, default=MAX_DECISIONS)
+    parser.add_argument('--layout-file', default=None, help="custom boards the run was trained on, see layouts.py")
+    parser.add_argument('--output', default=None, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    report = evaluate(args.layout, args.bricks, args.episodes, args.seed, args.workers, args.policy_format,
+                      args.frame_skip, args.event_driven, parse(args.abstraction) if args.abstraction else None,
+                      args.max_decisions, args.layout_file)
+    print(f"{report['layout']}/{report['bricks']}: {report['policy_states']} states loaded in "
+          f"{report['load_time']:.1f} s, {report['episodes']} episodes on {report['workers']} workers in "
+          f"{report['wall_time']:.1f} s: {report['episodes_per_sec']:.1f} episodes/s, "
+          f"{report['frames_per_sec']:,.0f} frames/s")
+    print(f"win rate {report['win_rate']:.1%} ({report['wins']} wins, {report['capped']} capped)")
+    print(f"score mean {report['score_mean']:.1f} std {report['score_std']:.1f} min {report['score_min']:.1f} "
+          f"max {report['score_max']:.1f}")
+    for name in ['score', 'decision', 'frame']:
+        print(f"{name + ' percentiles':21}", '  '.join(f"p{p} {value:.0f}"
+                                                       for p, value in report[name + '_percentiles'].items()))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
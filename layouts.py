@@ -0,0 +1,72 @@
+import json
+
+from brick_index import BrickGrid
+
+
+class Layout:
+    # One (layout, brick_number) board, built once and never mutated: games only copy its alive mask.
+    # Brick i is bricks[i], owns bit FIELD_BITS + i of the state key and is indexed by grid.
+    def __init__(self, name, brick_number, bricks, cell_width, cell_height, field_bits):
+        self.name = name
+        self.brick_number = brick_number
+        self.bricks = tuple(tuple(brick) for brick in bricks)
+        self.grid = BrickGrid(self.bricks, cell_width, cell_height)
+        self.ids = self.grid.ids
+        self.bounds = (self.grid.min_x, self.grid.min_y, max(self.grid.right, default=0),
+                       max(self.grid.bottom, default=0))
+        self.brick_bits = tuple(1 << (field_bits + i) for i in range(len(self.bricks)))
+
+    def __len__(self):
+        return len(self.bricks)
+
+
+class LayoutRegistry:
+    def __init__(self, game):
+        self.game = game
+        self.builders = {
+            'rectangle': game.reset_bricks_rectangle,
+            'circle': game.reset_bricks_circle,
+            'triangle': game.reset_bricks_triangle,
+        }
+        self.custom = {}
+        self.layouts = {}
+
+    def names(self):
+        return list(self.builders) + list(self.custom)
+
+    def register(self, name, bricks):
+        # A user-defined board; brick_number then selects its first bricks
+        self.custom[name] = [tuple(brick) for brick in bricks]
+        self.layouts = {key: layout for key, layout in self.layouts.items() if key[0] != name}
+
+    def load_file(self, path):
+        # {"name": [[x, y, width, height], ...], ...}; [x, y] entries use the game's brick size
+        with open(path, 'r') as f:
+            boards = json.load(f)
+        for name, bricks in boards.items():
+            self.register(name, [brick if len(brick) == 4 else
+                                 (brick[0], brick[1], self.game.BRICK_WIDTH, self.game.BRICK_HEIGHT)
+                                 for brick in bricks])
+        return list(boards)
+
+    def build(self, name, brick_number):
+        if name in self.custom:
+            bricks = self.custom[name]
+            if brick_number is None:
+                return bricks
+            if brick_number > len(bricks):
+                raise ValueError("Layout " + name + " has only " + str(len(bricks)) + " bricks")
+            return bricks[:brick_number]
+        if name in self.builders:
+            return self.builders[name](brick_number)
+        raise ValueError("Unknown layout " + str(name))
+
+    def get(self, name, brick_number):
+        key = (name, brick_number)
+        layout = self.layouts.get(key)
+        if layout is None:
+            game = self.game
+            layout = Layout(name, brick_number, self.build(name, brick_number), game.BRICK_WIDTH,
+                            game.BRICK_HEIGHT, game.FIELD_BITS)
+            self.layouts[key] = layout
+        return layout
@@ -0,0 +1,100 @@
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+
+# Spots rallies that have stopped getting anywhere. At every paddle contact the ball's exact position and speed
+# are hashed, the paddle left out since from there to the next contact the ball's path does not depend on it,
+# and looked up among the last `memory` contacts since a brick last fell (so the bricks are the same too).
+# Seeing one again means the ball is back where it was without a brick falling in between: the rally goes round
+# in circles, and only a different paddle (or nothing at all) will end it. The floats are compared as they are,
+# not rounded like the policy's state key, or two contacts a sub-pixel apart would pass for a loop.
+# play(loop_action=...) then cuts the episode as a loss or perturbs it with random actions until the next
+# contact; max_frames caps an episode either way.
+LOOP_ACTIONS = ('cut', 'perturb')
+
+
+class LoopDetector:
+    def __init__(self, memory=256):
+        self.memory = memory
+        self.recent = {}  # state keys of the last contacts, oldest first
+        self.kicks = 0
+        self.bricks = 0
+
+    def reset(self, state):
+        self.recent.clear()
+        self.kicks = state.kicks
+        self.bricks = len(state.bricks)
+
+    def check(self, state):
+        # True when this step's contact repeats a recent one; call after every step
+        if state.kicks == self.kicks:
+            return False
+        self.kicks = state.kicks
+        recent = self.recent
+        if len(state.bricks) != self.bricks:
+            self.bricks = len(state.bricks)
+            recent.clear()
+            return False
+        key = (state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y)
+        if key in recent:
+            # Start over, so a perturbed rally is only flagged again after repeating itself once more
+            recent.clear()
+            return True
+        if len(recent) >= self.memory:
+            del recent[next(iter(recent))]
+        recent[key] = None
+        return False
+
+
+def compare(layout, brick_number, episodes, seed=0, max_frames=None, frame_skip=1, event_driven=False):
+    # The same seeded learn run without loop detection and with each loop action, each from empty tables in a
+    # scratch directory: frames simulated, time, wins and what the detector did
+    from breakout_classes_final import BreakoutGame
+    cwd = os.getcwd()
+    rows = []
+    for loop_action in (None,) + LOOP_ACTIONS:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                for name in ['policy', 'win_policy', 'results']:
+                    os.makedirs(name)
+                game = BreakoutGame(headless=True)
+                random.seed(seed)
+                start = time.perf_counter()
+                game.play(layout, brick_number, episodes, True, frame_skip=frame_skip, event_driven=event_driven,
+                          progress_seconds=None, loop_action=loop_action, max_frames=max_frames)
+                seconds = time.perf_counter() - start
+                with open(game.results_path(layout, brick_number, True, frame_skip, event_driven), newline='') as file:
+                    results = list(csv.DictReader(file))
+            finally:
+                os.chdir(cwd)
+        rows.append({'loop_action': loop_action or 'off', 'seconds': seconds,
+                     'wins': sum(row['Result'] == "WIN" for row in results),
+                     'frames': sum(int(row['Frames']) for row in results),
+                     'longest': max(int(row['Frames']) for row in results),
+                     'loops': sum(int(row['Loops']) for row in results),
+                     'cut_loop': sum(row['Cut'] == 'loop' for row in results),
+                     'cut_cap': sum(row['Cut'] == 'cap' for row in results)})
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frames and time a learn run spends with and without loop cuts")
+    parser.add_argument('--layouts', nargs='+', default=['rectangle', 'triangle', 'circle'])
+    parser.add_argument('--bricks', nargs='+', type=int, default=[6, 10])
+    parser.add_argument('--episodes', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-frames', type=int, default=None, help="cap every episode at this many frames")
+    args = parser.parse_args()
+
+    print(f"{'layout':9} {'bricks':>6} {'loops':>7} {'frames':>11} {'longest':>9} {'seconds':>8} {'wins':>5} "
+          f"{'loops':>6} {'cut':>5} {'capped':>6}")
+    for layout in args.layouts:
+        for brick_number in args.bricks:
+            for row in compare(layout, brick_number, args.episodes, args.seed, args.max_frames):
+                print(f"{layout:9} {brick_number:6} {row['loop_action']:>7} {row['frames']:11,} "
+                      f"{row['longest']:9,} {row['seconds']:8.1f} {row['wins']:5} {row['loops']:6} "
+                      f"{row['cut_loop']:5} {row['cut_cap']:6}")
@@ -0,0 +1,302 @@
+import argparse
+import csv
+import gc
+import multiprocessing
+import os
+import random
+import signal
+import tempfile
+import time
+
+from breakout_classes_final import BreakoutGame
+from results_log import ResultsLog
+from state_abstraction import parse
+
+# Data-parallel training of one configuration. Each worker process runs play() episodes against its own copy of
+# policy/win_policy, seeded seed + worker index; every sync_every episodes per worker they send the entries
+# their episodes touched, the coordinator merges them into the global tables and sends the merged entries back,
+# so all copies agree again before the next round:
+#   win_policy  the highest-reward entry wins, the global one and then the lowest worker index on ties
+#   policy      the action most workers chose wins, the lowest worker index on ties
+# The tables reach the workers once, forked copy-on-write; after that only the round's changes are pickled, and
+# each worker is sent just the merged entries that differ from its own.
+# A run is reproducible for a given worker count, sync_every and seed.
+# Ctrl-C is left to the coordinator: it lets the workers finish the round (a second Ctrl-C stops waiting), merges
+# what they send and saves. A worker that dies is dropped and the run goes on with the rest.
+
+shared = None  # (policy, win_policy) the workers start from, set while they are forked
+
+
+class DeltaTracker:
+    # The states a worker's episodes touched since the last sync, marked by play() as a PolicyCheckpoint is
+    def __init__(self):
+        self.dirty = set()
+        self.win_dirty = set()
+
+    def mark(self, states):
+        self.dirty.update(states)
+
+    def mark_win(self, states):
+        self.win_dirty.update(states)
+
+
+def load_tables(layout, brick_number, policy_format='json', frame_skip=1, event_driven=False, abstraction=None,
+                layout_file=None):
+    game = BreakoutGame(headless=True, layout_file=layout_file)
+    game.reset_bricks(layout, brick_number)
+    run = (frame_skip, event_driven, abstraction)
+    return (game.load_policy(game.policy_path(layout, brick_number, 'json', *run),
+                             game.policy_path(layout, brick_number, 'bin', *run), policy_format),
+            game.load_policy(game.win_policy_path(layout, brick_number, 'json', *run),
+                             game.win_policy_path(layout, brick_number, 'bin', *run), policy_format))
+
+
+def worker(config, seed, connection, coordinator_ends):
+    # Runs in its own scratch directory: play() still writes a results CSV there, which is read back per round.
+    # The coordinator's pipe ends a fork copied in are closed, so the worker sees EOF if the coordinator dies.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for end in coordinator_ends:
+        end.close()
+    layout, brick_number, policy_format, frame_skip, event_driven, abstraction, layout_file = config
+    policy, win_policy = shared if shared is not None else load_tables(*config)
+    tracker = DeltaTracker()
+    random.seed(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for name in ['policy', 'win_policy', 'results']:
+            os.makedirs(name)
+        game = BreakoutGame(headless=True, layout_file=layout_file)
+        results_path = game.results_path(layout, brick_number, True, frame_skip, event_driven, abstraction)
+        while True:
+            message = receive(connection)
+            if message is None:
+                break
+            episodes, policy_update, win_update = message
+            policy.update(policy_update)
+            win_policy.update(win_update)
+            rows = []
+            if episodes:
+                game.play(layout, brick_number, episodes, True, frame_skip=frame_skip, event_driven=event_driven,
+                          abstraction=abstraction, progress_seconds=None, tables=(policy, win_policy),
+                          tracker=tracker)
+                with open(results_path, newline='') as file:
+                    rows = [(row[1], float(row[2]), row[4], int(row[5]), int(row[6]), row[7])
+                            for row in list(csv.reader(file))[1:]]
+            try:
+                connection.send((rows, {state: policy[state] for state in tracker.dirty},
+                                 {state: win_policy[state] for state in tracker.win_dirty}))
+            except OSError:
+                break
+            tracker.dirty.clear()
+            tracker.win_dirty.clear()
+
+
+def merge_policy(deltas):
+    votes = {}
+    for delta in deltas:
+        for state, action in delta.items():
+            votes.setdefault(state, []).append(action)
+    return {state: actions[0] if len(actions) == 1 else
+            max(actions, key=lambda action: (actions.count(action), -actions.index(action)))
+            for state, actions in votes.items()}
+
+
+def merge_win_policy(win_policy, deltas):
+    # The entries that beat the global table; every worker already holds the global entry for the rest
+    update = {}
+    for delta in deltas:
+        for state, entry in delta.items():
+            best = update.get(state) or win_policy.get(state)
+            if best is None or entry[1] > best[1]:
+                update[state] = entry
+    return update
+
+
+def updates_for(merged, delta):
+    # What one worker is missing of the merged entries: it already holds the ones it sent itself
+    return {state: value for state, value in merged.items() if state not in delta or delta[state] != value}
+
+
+def receive(connection):
+    # The next message, or None once the other end is gone
+    try:
+        return connection.recv()
+    except (EOFError, OSError):
+        return None
+
+
+def train(layout='rectangle', brick_number=6, episodes=1000, workers=2, sync_every=50, seed=0, policy_format='json',
+          frame_skip=1, event_driven=False, abstraction=None, progress_seconds=10.0, layout_file=None):
+    global shared
+    if layout_file:
+        layout_file = os.path.abspath(layout_file)  # the workers run in scratch directories
+    config = (layout, brick_number, policy_format, frame_skip, event_driven, abstraction, layout_file)
+    run = (frame_skip, event_driven, abstraction)
+    game = BreakoutGame(headless=True, layout_file=layout_file)
+    game.reset_bricks(layout, brick_number)
+    policy, win_policy = load_tables(*config)
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        shared = (policy, win_policy)
+        gc.freeze()  # the workers' collectors then leave the inherited tables' pages alone
+    else:
+        context = multiprocessing.get_context()
+    connections = []
+    processes = []
+    try:
+        for index in range(workers):
+            connection, child = context.Pipe()
+            connections.append(connection)
+            process = context.Process(target=worker, args=(config, seed + index, child, list(connections)),
+                                      daemon=True)
+            process.start()
+            child.close()
+            processes.append(process)
+    finally:
+        shared = None
+        gc.unfreeze()
+
+    results = ResultsLog(game.results_path(layout, brick_number, True, *run), progress_seconds=progress_seconds)
+    epoch = 0
+    first_win = None
+    synced = 0
+    merge_time = 0.0
+    alive = list(range(workers))  # the workers still running
+    deltas = {index: ({}, {}) for index in alive}  # (policy, win_policy) entries each sent last round
+    outstanding = []  # the workers this round's replies are still due from
+    replies = {}
+    policy_update, win_update = {}, {}
+    start = time.perf_counter()
+
+    def merge():
+        nonlocal epoch, first_win, merge_time, policy_update, win_update
+        for index in sorted(replies):
+            rows, policy_delta, win_delta = replies[index]
+            deltas[index] = (policy_delta, win_delta)
+            for result, score, start_ball_speed_x, frames, loops, cut in rows:
+                epoch += 1
+                results.write(epoch, result, score, start_ball_speed_x, frames, loops, cut)
+                if result == "WIN" and first_win is None:
+                    first_win = (epoch, time.perf_counter() - start)
+        merge_start = time.perf_counter()
+        ordered = [replies[index] for index in sorted(replies)]
+        policy_update = merge_policy([reply[1] for reply in ordered])
+        win_update = merge_win_policy(win_policy, [reply[2] for reply in ordered])
+        policy.update(policy_update)
+        win_policy.update(win_update)
+        merge_time += time.perf_counter() - merge_start
+        replies.clear()
+
+    def collect():
+        while outstanding:
+            index = outstanding[0]
+            reply = receive(connections[index])
+            if reply is None:
+                print(f"Worker {index} died, going on without it")
+                alive.remove(index)
+            else:
+                replies[index] = reply
+            outstanding.pop(0)
+
+    try:
+        while epoch < episodes and alive:
+            # Up to sync_every episodes per worker, the last round split evenly
+            base, extra = divmod(min(episodes - epoch, len(alive) * sync_every), len(alive))
+            for rank, index in enumerate(list(alive)):
+                policy_delta, win_delta = deltas[index]
+                worker_policy = updates_for(policy_update, policy_delta)
+                worker_win = updates_for(win_update, win_delta)
+                try:
+                    connections[index].send((base + (rank < extra), worker_policy, worker_win))
+                except OSError:
+                    print(f"Worker {index} died, going on without it")
+                    alive.remove(index)
+                    continue
+                synced += len(worker_policy) + len(worker_win)
+                outstanding.append(index)
+            collect()
+            merge()
+    except KeyboardInterrupt:
+        print("Interrupted, finishing the round and saving progress (Ctrl-C again to stop waiting)")
+        try:
+            collect()
+            merge()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        for index in alive:
+            try:
+                connections[index].send(None)
+            except OSError:
+                pass
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        results.close()
+    wall_time = time.perf_counter() - start
+
+    game.save_policy(policy, game.policy_path(layout, brick_number, 'json', *run),
+                     game.policy_path(layout, brick_number, 'bin', *run), policy_format)
+    game.save_policy(win_policy, game.win_policy_path(layout, brick_number, 'json', *run),
+                     game.win_policy_path(layout, brick_number, 'bin', *run), policy_format, with_reward=True)
+    return {'layout': layout, 'bricks': brick_number, 'workers': workers, 'sync_every': sync_every,
+            'episodes': epoch, 'wins': results.wins, 'wall_time': wall_time,
+            'first_win_episode': first_win[0] if first_win else None,
+            'first_win_seconds': first_win[1] if first_win else None,
+            'wins_per_hour': results.wins * 3600 / wall_time, 'episodes_per_sec': epoch / wall_time,
+            'merge_seconds': merge_time, 'synced_entries': synced, 'policy_states': len(policy)}
+
+
+def scaling(layout, brick_number, episodes, worker_counts, sync_every, seed, **options):
+    # The same training from empty tables per worker count, each in a scratch directory
+    cwd = os.getcwd()
+    if options.get('layout_file'):
+        options['layout_file'] = os.path.abspath(options['layout_file'])
+    rows = []
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            for name in ['policy', 'win_policy', 'results']:
+                os.makedirs(name)
+            try:
+                rows.append(train(layout, brick_number, episodes, workers, sync_every, seed, progress_seconds=None,
+                                  **options))
+            finally:
+                os.chdir(cwd)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train one configuration on several worker processes")
+    parser.add_argument('--layout', default='rectangle')
+    parser.add_argument('--bricks', type=int, default=6)
+    parser.add_argument('--episodes', type=int, default=1000, help="in total, over all workers")
+    parser.add_argument('--workers', nargs='+', type=int, default=[os.cpu_count()],
+                        help="several counts compare time to first win and wins/hour from empty tables")
+    parser.add_argument('--sync-every', type=int, default=50, help="episodes per worker between merges")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--policy-format', default='json', choices=['json', 'bin'])
+    parser.add_argument('--frame-skip', type=int, default=1)
+    parser.add_argument('--event-driven', action='store_true')
+    parser.add_argument('--abstraction', default=None, help="e.g. p20_x20_y20_rel_sign, see state_abstraction.py")
+    parser.add_argument('--layout-file', default=None, help="custom boards by name, see layouts.py")
+    args = parser.parse_args()
+
+    options = {'policy_format': args.policy_format, 'frame_skip': args.frame_skip,
+               'event_driven': args.event_driven, 'abstraction': parse(args.abstraction) if args.abstraction else None,
+               'layout_file': args.layout_file}
+    if len(args.workers) == 1:
+        reports = [train(args.layout, args.bricks, args.episodes, args.workers[0], args.sync_every, args.seed,
+                         **options)]
+    else:
+        reports = scaling(args.layout, args.bricks, args.episodes, args.workers, args.sync_every, args.seed, **options)
+    print(f"{'workers':>7} {'episodes':>8} {'wins':>5} {'first win':>9} {'after s':>8} {'wins/hour':>10} "
+          f"{'episodes/s':>10} {'merge s':>8} {'synced':>9}")
+    for report in reports:
+        first_seconds = report['first_win_seconds']
+        print(f"{report['workers']:7} {report['episodes']:8} {report['wins']:5} {str(report['first_win_episode']):>9} "
+              f"{'-' if first_seconds is None else f'{first_seconds:.1f}':>8} {report['wins_per_hour']:10,.0f} "
+              f"{report['episodes_per_sec']:10.1f} {report['merge_seconds']:8.2f} {report['synced_entries']:9,}")
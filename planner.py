@@ -0,0 +1,165 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+import evaluate
+from breakout_batch import BreakoutBatch
+from breakout_classes_final import BreakoutGame
+from breakout_env import BreakoutEnv
+from state_abstraction import parse
+
+# Lookahead play without a learned table. At every decision the planner tries each action on the env itself
+# (snapshot, step, snapshot, restore: the exact event-driven/frame-skip step the env will take), then loads the
+# three resulting positions into one BreakoutBatch and plays `rollouts` random continuations of each for up to
+# `horizon` frames. A continuation holds a random action for `hold` frames at a time, and is worth its score
+# (step penalty included) plus win_bonus if it clears the board or minus loss_penalty if it drops the ball.
+# Batches repeat until the decision's time budget is spent (at least one runs); the action with the best mean
+# value is taken, the first of ACTIONS on ties.
+ACTIONS = [-1, 0, 1]
+MAX_DECISIONS = 20000  # an episode still running after this many decisions counts as a loss, see 'capped'
+
+
+class RolloutPlanner:
+    def __init__(self, layout, brick_number, game=None, rollouts=32, horizon=240, hold=8, budget=0.02,
+                 win_bonus=1000.0, loss_penalty=1000.0, step_penalty=0.1, seed=0):
+        self.batch = BreakoutBatch(len(ACTIONS) * rollouts, layout, brick_number, game=game, seed=seed)
+        self.rollouts = rollouts
+        self.horizon = horizon
+        self.hold = hold
+        self.budget = budget
+        self.win_bonus = win_bonus
+        self.loss_penalty = loss_penalty
+        self.step_penalty = step_penalty
+        self.rng = np.random.default_rng(seed)
+        self.value = np.zeros(self.batch.num_envs)
+        self.live = np.zeros(self.batch.num_envs, dtype=bool)
+        self.decisions = 0
+        self.batches = 0
+
+    def act(self, env):
+        snapshot = env.snapshot()
+        values = np.zeros(len(ACTIONS))
+        starts = []
+        for action in ACTIONS:
+            env.restore(snapshot)
+            observation, reward, done, info = env.step(action)
+            if done:
+                values[len(starts)] = reward + (self.win_bonus if info['won'] else -self.loss_penalty)
+                starts.append(None)
+            else:
+                values[len(starts)] = reward
+                starts.append(env.snapshot())
+        env.restore(snapshot)
+        self.decisions += 1
+        if any(start is not None for start in starts):
+            totals = np.zeros(len(ACTIONS))
+            batches = 0
+            deadline = time.perf_counter() + self.budget
+            while not batches or time.perf_counter() < deadline:
+                totals += self.rollout(starts).reshape(len(ACTIONS), self.rollouts).sum(axis=1)
+                batches += 1
+            self.batches += batches
+            values += totals / (batches * self.rollouts)
+        return ACTIONS[int(np.argmax(values))]
+
+    def rollout(self, starts):
+        # One batch of continuations from each start; rows of a finished start stay at 0
+        batch = self.batch
+        rollouts = self.rollouts
+        value = self.value
+        live = self.live
+        value.fill(0)
+        for i, start in enumerate(starts):
+            rows = slice(i * rollouts, (i + 1) * rollouts)
+            live[rows] = start is not None
+            if start is not None:
+                batch.load(start, rows)
+        segments = self.rng.integers(-1, 2, size=(-(-self.horizon // self.hold), batch.num_envs))
+        for frame in range(self.horizon):
+            reward, done, won = batch.step(segments[frame // self.hold])
+            np.add(value, reward - self.step_penalty, out=value, where=live)
+            ended = done & live
+            if ended.any():
+                value[ended & won] += self.win_bonus
+                value[ended & ~won] -= self.loss_penalty
+                live &= ~done
+                if not live.any():
+                    break
+        return value
+
+
+def run_episode(planner, env, seed, max_decisions=MAX_DECISIONS):
+    # One seeded episode: (won, score, decisions, frames, capped), as evaluate.run_episode
+    env.reset(seed)
+    frames = 0
+    for decision in range(max_decisions):
+        observation, reward, done, info = env.step(planner.act(env))
+        frames += info['frames']
+        if done:
+            return info['won'], info['score'], decision + 1, frames, False
+    return False, env.state.reward, max_decisions, frames, True
+
+
+def report(name, rows, seconds):
+    won, score, decisions, frames, capped = (np.array(column) for column in zip(*rows))
+    return {'name': name, 'episodes': len(rows), 'wins': int(won.sum()), 'win_rate': float(won.mean()),
+            'capped': int(capped.sum()), 'score_mean': float(score.mean()), 'decisions': int(decisions.sum()),
+            'decisions_per_sec': decisions.sum() / seconds, 'frames_per_sec': frames.sum() / seconds,
+            'seconds': seconds}
+
+
+def compare(layout='rectangle', brick_number=6, episodes=20, seed=0, policy_format='json', frame_skip=1,
+            event_driven=False, abstraction=None, planner_frame_skip=8, **options):
+    # The planner and the learned tables of one run (win_policy over policy, as evaluate.py plays them) on the
+    # same seeds, so both get the same serves
+    game = BreakoutGame(headless=True)
+    threshold = -20 * brick_number
+    actions, win_states = evaluate.load_tables(layout, brick_number, policy_format, frame_skip, event_driven,
+                                               abstraction)
+    env = BreakoutEnv(layout, brick_number, game=game, frame_skip=frame_skip, event_driven=event_driven,
+                      abstraction=abstraction, rng=random.Random())
+    start = time.perf_counter()
+    rows = [evaluate.run_episode(env, actions, win_states, seed + i, threshold, evaluate.MAX_DECISIONS)
+            for i in range(episodes)]
+    learned = report(f"learned ({len(actions)} states)", rows, time.perf_counter() - start)
+
+    env = BreakoutEnv(layout, brick_number, game=game, frame_skip=planner_frame_skip, event_driven=True,
+                      rng=random.Random())
+    planner = RolloutPlanner(layout, brick_number, game=game, seed=seed, **options)
+    start = time.perf_counter()
+    rows = [run_episode(planner, env, seed + i) for i in range(episodes)]
+    planned = report("planner", rows, time.perf_counter() - start)
+    planned['rollouts_per_decision'] = planner.batches * planner.rollouts * len(ACTIONS) / planner.decisions
+    return learned, planned
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollout planner against a run's learned win_policy")
+    parser.add_argument('--layout', default='rectangle')
+    parser.add_argument('--bricks', type=int, default=6)
+    parser.add_argument('--episodes', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget', type=float, default=0.02, help="seconds of rollouts per decision")
+    parser.add_argument('--rollouts', type=int, default=32, help="per action and batch")
+    parser.add_argument('--horizon', type=int, default=240, help="frames per rollout")
+    parser.add_argument('--hold', type=int, default=8, help="frames a rollout holds each random action")
+    parser.add_argument('--planner-frame-skip', type=int, default=8, help="frames per planner decision, plus "
+                                                                          "the quiet frames jumped event-driven")
+    parser.add_argument('--policy-format', default='json', choices=['json', 'bin'])
+    parser.add_argument('--frame-skip', type=int, default=1, help="of the learned run")
+    parser.add_argument('--event-driven', action='store_true', help="of the learned run")
+    parser.add_argument('--abstraction', default=None, help="of the learned run, see state_abstraction.py")
+    args = parser.parse_args()
+
+    results = compare(args.layout, args.bricks, args.episodes, args.seed, args.policy_format, args.frame_skip,
+                      args.event_driven, parse(args.abstraction) if args.abstraction else None,
+                      args.planner_frame_skip, rollouts=args.rollouts, horizon=args.horizon, hold=args.hold,
+                      budget=args.budget)
+    print(f"{args.layout}/{args.bricks}, {args.episodes} episodes from seed {args.seed}")
+    print(f"{'':24} {'win rate':>8} {'capped':>6} {'mean score':>10} {'decisions/s':>11} {'frames/s':>10}")
+    for result in results:
+        print(f"{result['name']:24} {result['win_rate']:8.1%} {result['capped']:6} {result['score_mean']:10.1f} "
+              f"{result['decisions_per_sec']:11,.1f} {result['frames_per_sec']:10,.0f}")
+    print(f"planner: {results[1]['rollouts_per_decision']:.0f} rollouts per decision")
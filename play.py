@@ -1,6 +1,8 @@
-import pygame
 import random
-import math
+
+import breakout_physics
+from brick_index import BrickGrid, BrickSet
+from renderer import Renderer
 
 # Game dimensions
 WIDTH = 640
@@ -19,6 +21,7 @@ PADDLE_WIDTH = 100
 PADDLE_HEIGHT = 20
 PADDLE_SPEED = 5
 MAX_PADDLE_SPEED = 2
+PADDLE_Y = HEIGHT - PADDLE_HEIGHT - 10
 
 # Ball dimensions and speed
 BALL_RADIUS = 10
@@ -38,17 +41,48 @@ NUM_PADDLE_PARTS = 5
 # Reward
 REWARD = -1
 
-# Initialize Pygame
-pygame.init()
-window = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Breakout")
+# Same rules as the trainer, on this window's dimensions
+PHYSICS = breakout_physics.PhysicsConfig(WIDTH, HEIGHT, PADDLE_WIDTH, PADDLE_HEIGHT, MAX_PADDLE_SPEED, BALL_RADIUS,
+                                         BALL_SPEED_Y, BALL_SPEED_X_MAX, paddle_reward=0, brick_reward=REWARD)
+
+# Pygame is only imported and initialized by open_window(), not when this module is imported
+pygame = None
+window = None
+clock = None
+renderer = None
+
+
+def open_window():
+    global pygame, window, clock, renderer
+    import pygame
+    pygame.init()
+    window = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Breakout")
+
+    clock = pygame.time.Clock()
+    renderer = Renderer(pygame, window, PADDLE_WIDTH, PADDLE_HEIGHT, BALL_RADIUS, BLACK, ORANGE, RED, GREEN, BLACK)
+
+
+def build_brick_grid():
+    bricks = []
+    total_width = BRICK_COLS * BRICK_WIDTH
+    initial_x = (WIDTH - total_width) // 2
+    initial_y = 50
+    for row in range(BRICK_ROWS):
+        for col in range(BRICK_COLS):
+            brick_x = initial_x + col * BRICK_WIDTH
+            brick_y = initial_y + row * BRICK_HEIGHT
+            bricks.append((brick_x, brick_y, BRICK_WIDTH, BRICK_HEIGHT))
+    return BrickGrid(bricks, BRICK_WIDTH, BRICK_HEIGHT)
+
+
+BRICK_GRID = build_brick_grid()
 
-clock = pygame.time.Clock()
 
 def reset_game():
     # Initialize paddle
     paddle_x = (WIDTH - PADDLE_WIDTH) // 2
-    paddle_y = HEIGHT - PADDLE_HEIGHT - 10
+    paddle_y = PADDLE_Y
     paddle_speed = 0
 
     # Initialize ball
@@ -63,99 +97,45 @@ def reset_game():
     return paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks
 
 def reset_bricks():
-    bricks = []
-    total_width = BRICK_COLS * BRICK_WIDTH
-    initial_x = (WIDTH - total_width) // 2
-    initial_y = 50
-    for row in range(BRICK_ROWS):
-        for col in range(BRICK_COLS):
-            brick_x = initial_x + col * BRICK_WIDTH
-            brick_y = initial_y + row * BRICK_HEIGHT
-            bricks.append(pygame.Rect(brick_x, brick_y, BRICK_WIDTH, BRICK_HEIGHT))
-    return bricks
+    return BrickSet(BRICK_GRID)
 
 def draw_elements(paddle_x, paddle_y, ball_x, ball_y, bricks):
-    # Clear the screen
-    window.fill(BLACK)
-
-    # Draw paddle, ball, and bricks
-    pygame.draw.rect(window, ORANGE, (paddle_x, paddle_y, PADDLE_WIDTH, PADDLE_HEIGHT))
-    pygame.draw.circle(window, RED, (ball_x, ball_y), BALL_RADIUS)
-    for brick in bricks:
-        pygame.draw.rect(window, GREEN, brick)
-        pygame.draw.rect(window, BLACK, brick, 2)  # Add black outline to bricks
-
-    # Update the display
-    pygame.display.flip()
+    # Bricks come from a cached background, only the moving parts are redrawn (renderer.py)
+    renderer.draw(paddle_x, paddle_y, ball_x, ball_y, bricks)
 
 def move_paddle(paddle_x, paddle_speed):
-    paddle_x += paddle_speed
-    if paddle_x < 0:
-        paddle_x = 0
-    if paddle_x > WIDTH - PADDLE_WIDTH:
-        paddle_x = WIDTH - PADDLE_WIDTH
-    return paddle_x
+    return breakout_physics.move_paddle(PHYSICS, paddle_x, paddle_speed)
 
 def move_ball(ball_x, ball_y, ball_speed_x, ball_speed_y):
-    ball_x += ball_speed_x
-    ball_y += ball_speed_y
-    return ball_x, ball_y
+    return breakout_physics.move_ball(ball_x, ball_y, ball_speed_x, ball_speed_y)
 
 def check_wall_collision(ball_x, ball_y, ball_speed_x, ball_speed_y):
-    if ball_x - BALL_RADIUS <= 0 or ball_x + BALL_RADIUS >= WIDTH:
-        ball_speed_x *= -1
-    if ball_y - BALL_RADIUS <= 0:
-        ball_speed_y *= -1
-    return ball_speed_x, ball_speed_y
+    return breakout_physics.check_wall_collision(PHYSICS, ball_x, ball_y, ball_speed_x, ball_speed_y)
 
 def check_paddle_collision(ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, paddle_y):
-    paddle_rect = pygame.Rect(paddle_x, paddle_y, PADDLE_WIDTH, PADDLE_HEIGHT)
-    ball_rect = pygame.Rect(ball_x - BALL_RADIUS, ball_y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2)
-    if ball_rect.colliderect(paddle_rect):
-        ball_speed_y *= -1
-
-        # Calculate the reflection angle based on the direction of the ball's incoming velocity
-        if ball_speed_x < 0:
-            angle = -math.pi / 4  # Reflect to the left
-        else:
-            angle = math.pi / 4  # Reflect to the right
-
-        ball_speed_x = math.sin(angle) * BALL_SPEED_X_MAX
-
-        # Adjust the ball's horizontal direction if it's in contact with both paddle and wall
-        if (ball_speed_x < 0 and ball_x + BALL_RADIUS >= paddle_x + PADDLE_WIDTH) or (ball_speed_x > 0 and ball_x - BALL_RADIUS <= paddle_x):
-            ball_speed_x *= -1
-
-        # Adjust the ball's vertical direction to prevent sticking
-        if ball_speed_y > 0:
-            ball_speed_y = -BALL_SPEED_Y
-
+    ball_speed_x, ball_speed_y, _ = breakout_physics.check_paddle_collision(PHYSICS, ball_x, ball_y, ball_speed_x,
+                                                                           ball_speed_y, paddle_x, paddle_y)
     return ball_speed_x, ball_speed_y
 
 def check_brick_collision(ball_x, ball_y, ball_speed_x, ball_speed_y, bricks):
-    for brick in bricks:
-        if brick.collidepoint(ball_x + ball_speed_x, ball_y):  # Check horizontal collision
-            bricks.remove(brick)
-            ball_speed_x *= -1
-            return ball_speed_x, ball_speed_y, REWARD, bricks
-        elif brick.collidepoint(ball_x, ball_y + ball_speed_y):  # Check vertical collision
-            bricks.remove(brick)
-            ball_speed_y *= -1
-            return ball_speed_x, ball_speed_y, REWARD, bricks
-    return ball_speed_x, ball_speed_y, 0, bricks
+    hit = bricks.hit(ball_x, ball_y, ball_speed_x, ball_speed_y)
+    if hit is None:
+        return ball_speed_x, ball_speed_y, 0, bricks
+    brick_id, horizontal = hit
+    bricks.remove_id(brick_id)
+    if horizontal:  # Horizontal collision
+        ball_speed_x *= -1
+    else:  # Vertical collision
+        ball_speed_y *= -1
+    return ball_speed_x, ball_speed_y, REWARD, bricks
 
 def update_game_state(action, paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks):
-    if action == -1:
-        paddle_speed = max(paddle_speed - 1, -MAX_PADDLE_SPEED)
-    elif action == 1:
-        paddle_speed = min(paddle_speed + 1, MAX_PADDLE_SPEED)
-    else:
-        paddle_speed = 0
+    paddle_speed = breakout_physics.accelerate(PHYSICS, paddle_speed, action)
 
     paddle_x = move_paddle(paddle_x, paddle_speed)
     ball_x, ball_y = move_ball(ball_x, ball_y, ball_speed_x, ball_speed_y)
     ball_speed_x, ball_speed_y = check_wall_collision(ball_x, ball_y, ball_speed_x, ball_speed_y)
-    ball_speed_x, ball_speed_y = check_paddle_collision(ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, paddle_y)
+    ball_speed_x, ball_speed_y = check_paddle_collision(ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, PADDLE_Y)
     ball_speed_x, ball_speed_y, reward, bricks = check_brick_collision(ball_x, ball_y, ball_speed_x, ball_speed_y, bricks)
 
     if ball_y >= HEIGHT:
@@ -170,10 +150,11 @@ def update_game_state(action, paddle_x, paddle_speed, ball_x, ball_y, ball_speed
     return paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, reward, bricks
 
 def main():
+    open_window()
     paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = reset_game()
+    state = breakout_physics.GameState(paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks)
 
     game_over = False
-    score = 0
 
     while not game_over:
         for event in pygame.event.get():
@@ -182,33 +163,23 @@ def main():
 
         keys = pygame.key.get_pressed()
         if keys[pygame.K_LEFT]:
-            paddle_speed = max(paddle_speed - PADDLE_SPEED, -MAX_PADDLE_SPEED)
+            state.paddle_speed = max(state.paddle_speed - PADDLE_SPEED, -MAX_PADDLE_SPEED)
         elif keys[pygame.K_RIGHT]:
-            paddle_speed = min(paddle_speed + PADDLE_SPEED, MAX_PADDLE_SPEED)
+            state.paddle_speed = min(state.paddle_speed + PADDLE_SPEED, MAX_PADDLE_SPEED)
         else:
-            paddle_speed = 0
-
-        paddle_x = move_paddle(paddle_x, paddle_speed)
-        ball_x, ball_y = move_ball(ball_x, ball_y, ball_speed_x, ball_speed_y)
-        ball_speed_x, ball_speed_y = check_wall_collision(ball_x, ball_y, ball_speed_x, ball_speed_y)
-        ball_speed_x, ball_speed_y = check_paddle_collision(ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, paddle_y)
-        ball_speed_x, ball_speed_y, reward, bricks = check_brick_collision(ball_x, ball_y, ball_speed_x, ball_speed_y, bricks)
-
-        score += reward
-
-        if ball_y >= HEIGHT:
-            bricks = reset_bricks()
-            paddle_x = (WIDTH - PADDLE_WIDTH) // 2
-            paddle_speed = 0
-            ball_x = random.randint(0, WIDTH - BALL_RADIUS)
-            ball_y = HEIGHT // 2
-            ball_speed_x = random.choice(BALL_SPEED_X_CHOICES)
-            ball_speed_y = random.uniform(-1, -5)
-
-        draw_elements(paddle_x, paddle_y, ball_x, ball_y, bricks)
+            state.paddle_speed = 0
+
+        # The score is the accumulated brick REWARD, paddle hits are worth nothing here
+        breakout_physics.step(PHYSICS, state)
+
+        if state.ball_y >= HEIGHT:
+            (state.paddle_x, paddle_y, state.paddle_speed, state.ball_x, state.ball_y, state.ball_speed_x,
+             state.ball_speed_y, state.bricks) = reset_game()
+
+        draw_elements(state.paddle_x, paddle_y, state.ball_x, state.ball_y, state.bricks)
         clock.tick(60)
 
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import ast
+import json
+import os
+import struct
+
+import numpy as np
+
+# Binary policy file:
+#   header   magic, flags, field_bits, count
+#   uint64   brick masks (key >> field_bits), sorted together with the field column
+#   uint64   packed paddle/ball fields (key & field mask)
+#   int8     actions, zero-padded to 8 bytes
+#   float64  rewards, only for win policies (HAS_REWARD flag)
+# Keys are sorted by (mask, fields), i.e. by the full integer key, so a memory-mapped file can be
+# searched without loading it.
+MAGIC = b'BKPOLICY'
+HEADER = struct.Struct('<8sIIQ')
+HAS_REWARD = 1
+MAX_BRICKS = 64  # the mask column is one uint64 word per key
+
+
+def split_keys(keys, field_bits):
+    field_mask = (1 << field_bits) - 1
+    try:
+        packed = np.array(keys, dtype=np.uint64)
+    except OverflowError:
+        # More bricks than fit next to the fields in 64 bits: split through Python ints
+        packed = np.array(keys, dtype=object)
+        masks = packed >> field_bits
+        if int(masks.max()) >> MAX_BRICKS:
+            raise ValueError(f"The binary policy format holds at most {MAX_BRICKS} bricks, use policy_format='json'")
+        return masks.astype(np.uint64), (packed & field_mask).astype(np.uint64)
+    return packed >> np.uint64(field_bits), packed & np.uint64(field_mask)
+
+
+def join_keys(masks, fields, field_bits):
+    if len(masks) and int(masks.max()) < 1 << (64 - field_bits):
+        return ((masks << np.uint64(field_bits)) | fields).tolist()
+    return [mask << field_bits | field for mask, field in zip(masks.tolist(), fields.tolist())]
+
+
+def save_policy(path, policy, field_bits, with_reward=False):
+    keys = list(policy)
+    masks, fields = split_keys(keys, field_bits)
+    if with_reward:
+        values = list(policy.values())
+        actions = np.array([value[0] for value in values], dtype=np.int8)
+        rewards = np.array([value[1] for value in values], dtype=np.float64)
+    else:
+        actions = np.fromiter(policy.values(), dtype=np.int8, count=len(keys))
+        rewards = None
+    order = np.lexsort((fields, masks))
+
+    # Write next to the target and rename, so a crash never leaves a half-written policy behind
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, HAS_REWARD if with_reward else 0, field_bits, len(keys)))
+        f.write(masks[order].tobytes())
+        f.write(fields[order].tobytes())
+        f.write(actions[order].tobytes())
+        f.write(b'\0' * (-len(keys) % 8))
+        if with_reward:
+            f.write(rewards[order].tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class MappedPolicy:
+    # Read-only view of a binary policy file; nothing is loaded until a page is touched
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, flags, self.field_bits, self.count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(path + ' is not a binary policy file')
+        self.has_reward = bool(flags & HAS_REWARD)
+        self.field_mask = (1 << self.field_bits) - 1
+
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        offset = HEADER.size
+        size = self.count * 8
+        self.masks = data[offset:offset + size].view(np.uint64)
+        self.fields = data[offset + size:offset + 2 * size].view(np.uint64)
+        offset += 2 * size
+        self.actions = data[offset:offset + self.count].view(np.int8)
+        offset += self.count + (-self.count % 8)
+        self.rewards = data[offset:offset + size].view(np.float64) if self.has_reward else None
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key):
+        mask = key >> self.field_bits
+        start = np.searchsorted(self.masks, mask, 'left')
+        end = np.searchsorted(self.masks, mask, 'right')
+        index = start + np.searchsorted(self.fields[start:end], key & self.field_mask)
+        if index < end and self.fields[index] == key & self.field_mask:
+            return int(index)
+        return -1
+
+    def __contains__(self, key):
+        return self.find(key) >= 0
+
+    def __getitem__(self, key):
+        index = self.find(key)
+        if index < 0:
+            raise KeyError(key)
+        if self.has_reward:
+            return [int(self.actions[index]), float(self.rewards[index])]
+        return int(self.actions[index])
+
+    def get(self, key, default=None):
+        index = self.find(key)
+        if index < 0:
+            return default
+        return self[key]
+
+    def to_dict(self):
+        keys = join_keys(self.masks, self.fields, self.field_bits)
+        actions = self.actions.tolist()
+        if self.has_reward:
+            return {key: [action, reward] for key, action, reward in zip(keys, actions, self.rewards.tolist())}
+        return dict(zip(keys, actions))
+
+
+def load_policy(path):
+    return MappedPolicy(path).to_dict()
+
+
+def convert_json(game, layout, brick_number, frame_skip=1, event_driven=False, abstraction=None):
+    # Rewrites the JSON policy and win_policy of one run in the binary format
+    game.reset_bricks(layout, brick_number)
+    run = (frame_skip, event_driven, abstraction)
+    for json_path, bin_path, with_reward in [
+            (game.policy_path(layout, brick_number, 'json', *run), game.policy_path(layout, brick_number, 'bin', *run),
+             False),
+            (game.win_policy_path(layout, brick_number, 'json', *run),
+             game.win_policy_path(layout, brick_number, 'bin', *run), True)]:
+        if not os.path.exists(json_path):
+            continue
+        with open(json_path, 'r') as f:
+            policy_str = json.load(f)
+        policy = {game.compact_state(ast.literal_eval(key)): value for key, value in policy_str.items()}
+        save_policy(bin_path, policy, game.FIELD_BITS, with_reward)
+        print("Converted", json_path, "->", bin_path, len(policy), "states")
+
+
+if __name__ == "__main__":
+    from breakout_classes_final import BreakoutGame
+    from state_abstraction import parse
+
+    parser = argparse.ArgumentParser(description="Convert JSON policies to the binary format")
+    parser.add_argument('configs', nargs='+', help="<layout> <brick_number> [<layout> <brick_number> ...]")
+    parser.add_argument('--frame-skip', type=int, default=1)
+    parser.add_argument('--event-driven', action='store_true')
+    parser.add_argument('--abstraction', default=None, help="e.g. p20_x20_y20_rel_sign, see state_abstraction.py")
+    parser.add_argument('--layout-file', default=None, help="custom boards by name, see layouts.py")
+    args = parser.parse_args()
+    if len(args.configs) % 2:
+        parser.error("configs come in <layout> <brick_number> pairs")
+
+    game = BreakoutGame(headless=True, layout_file=args.layout_file)
+    abstraction = parse(args.abstraction) if args.abstraction else None
+    for i in range(0, len(args.configs), 2):
+        convert_json(game, args.configs[i], int(args.configs[i + 1]), args.frame_skip, args.event_driven, abstraction)
@@ -0,0 +1,60 @@
+import csv
+from time import perf_counter
+
+# Phases of one play() frame, in loop order, plus the end-of-episode work
+PHASES = ('events', 'policy', 'step', 'state_key', 'credit', 'memory', 'render', 'checkpoint')
+EVENTS, POLICY, STEP, STATE_KEY, CREDIT, MEMORY, RENDER, CHECKPOINT = range(len(PHASES))
+HEADER = (["Epoch", "Result", "Decisions", "Frames", "Policy size", "Policy growth", "Win policy size", "Seconds"] +
+          [phase + " sec" for phase in PHASES] + [phase + " calls" for phase in PHASES])
+
+
+class PhaseProfiler:
+    # Cumulative wall time and call count per phase for the current episode.
+    # tick(phase) charges the time since the previous tick to phase, so the ticks along the loop partition it.
+    # Each episode's row is streamed to the CSV at path as it ends, through a 64 KiB file buffer flushed every
+    # flush_seconds as ResultsLog does; only the per-phase totals are kept.
+    __slots__ = ('seconds', 'calls', 'last', 'episode_start', 'policy_start', 'frames', 'total_seconds', 'file',
+                 'writer', 'flush_seconds', 'last_flush')
+
+    def __init__(self, path, flush_seconds=5.0):
+        self.seconds = [0.0] * len(PHASES)
+        self.calls = [0] * len(PHASES)
+        self.total_seconds = [0.0] * len(PHASES)
+        self.file = open(path, mode='w', newline='', buffering=1 << 16)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(HEADER)
+        self.flush_seconds = flush_seconds
+        self.last = self.episode_start = self.last_flush = perf_counter()
+        self.policy_start = 0
+        self.frames = 0
+
+    def start_episode(self, policy_size):
+        for phase in range(len(PHASES)):
+            self.seconds[phase] = 0.0
+            self.calls[phase] = 0
+        self.policy_start = policy_size
+        self.frames = 0
+        self.last = self.episode_start = perf_counter()
+
+    def tick(self, phase):
+        now = perf_counter()
+        self.seconds[phase] += now - self.last
+        self.calls[phase] += 1
+        self.last = now
+
+    def end_episode(self, epoch, result, decisions, policy_size, win_policy_size):
+        now = perf_counter()
+        self.writer.writerow([epoch, result, decisions, self.frames, policy_size, policy_size - self.policy_start,
+                              win_policy_size, now - self.episode_start] + self.seconds + self.calls)
+        for phase, seconds in enumerate(self.seconds):
+            self.total_seconds[phase] += seconds
+        if now - self.last_flush >= self.flush_seconds:
+            self.file.flush()
+            self.last_flush = now
+
+    def close(self):
+        self.file.close()
+
+    def totals(self):
+        # Seconds per phase over every recorded episode
+        return dict(zip(PHASES, self.total_seconds))
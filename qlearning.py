@@ -0,0 +1,287 @@
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from breakout_env import BreakoutEnv
+from results_log import ResultsLog
+from state_abstraction import StateAbstraction, parse
+
+# Tabular Q-learning / SARSA on a preallocated (states, 3) float32 array instead of the dict policy.
+# States get a dense id by mixed-radix arithmetic over the binned features of a StateAbstraction, so the table
+# size is fixed up front; the default abstraction drops the brick mask and keeps it around 120k states (1.5 MB).
+# Exploration draws come in numpy blocks, greedy actions are read from a per-state argmax cache, and the
+# TD updates of an episode are applied in one batch when it ends.
+DEFAULT_ABSTRACTION = StateAbstraction(paddle_bin=20, ball_x_bin=20, ball_y_bin=20, speed_sign=True, bricks=False)
+MAX_STATES = 1 << 22
+WIN_REWARD = 1000
+RANDOM_BLOCK = 4096
+
+
+class DenseIndex:
+    # Maps an env state to 0 <= id < size for one game geometry, layout and abstraction
+    def __init__(self, game, layout, brick_number, abstraction):
+        self.game = game
+        self.abstraction = abstraction
+        a = abstraction
+        margin = game.BALL_SPEED_Y + game.BALL_SPEED_X_MAX  # the ball can pass a wall by one frame's travel
+        self.paddle_count = round((game.WIDTH - game.PADDLE_WIDTH) / a.paddle_bin) + 1
+        if a.relative:
+            reach = game.WIDTH - game.PADDLE_WIDTH / 2 + margin
+            self.x_low, x_high = round(-reach / a.ball_x_bin), round(reach / a.ball_x_bin)
+        else:
+            self.x_low, x_high = round(-margin / a.ball_x_bin), round((game.WIDTH + margin) / a.ball_x_bin)
+        self.y_low, y_high = round(-margin / a.ball_y_bin), round((game.HEIGHT + margin) / a.ball_y_bin)
+        self.x_count = x_high - self.x_low + 1
+        self.y_count = y_high - self.y_low + 1
+        self.speed_x_count = 3 if a.speed_sign else len(game.SPEED_X_VALUES)
+        self.speed_y_count = 3 if a.speed_sign else len(game.SPEED_Y_VALUES)
+        # The mask covers the bricks the layout builds, which can be more than brick_number (rectangle/10 has 14)
+        bricks = len(game.layouts.get(layout, brick_number).bricks)
+        self.mask_count = 1 << bricks if a.bricks else 1
+        self.size = (self.mask_count * self.paddle_count * self.x_count * self.y_count * self.speed_x_count *
+                     self.speed_y_count)
+        if self.size > MAX_STATES:
+            raise ValueError(str(abstraction) + " needs " + str(self.size) + " states for " + str(bricks) +
+                             " bricks, more than " + str(MAX_STATES) + "; use coarser bins or bricks=False")
+
+    def index(self, state):
+        game = self.game
+        a = self.abstraction
+        ball_x = state.ball_x
+        if a.relative:
+            ball_x = ball_x - state.paddle_x - game.PADDLE_WIDTH / 2
+        x = min(max(round(ball_x / a.ball_x_bin) - self.x_low, 0), self.x_count - 1)
+        y = min(max(round(state.ball_y / a.ball_y_bin) - self.y_low, 0), self.y_count - 1)
+        speed_x, speed_y = state.ball_speed_x, state.ball_speed_y
+        if a.speed_sign:
+            speed_x = (speed_x > 0) - (speed_x < 0) + 1
+            speed_y = (speed_y > 0) - (speed_y < 0) + 1
+        else:
+            speed_x = game.SPEED_X_CODES[speed_x]
+            speed_y = game.SPEED_Y_CODES[speed_y]
+        mask = state.bricks.key >> game.FIELD_BITS if a.bricks else 0
+        return (((((mask * self.paddle_count + round(state.paddle_x / a.paddle_bin)) * self.x_count + x) *
+                  self.y_count + y) * self.speed_x_count + speed_x) * self.speed_y_count + speed_y)
+
+
+class QTable:
+    # q[state, action + 1]; best[state] caches the greedy action + 1 and is refreshed by every update
+    def __init__(self, size):
+        self.q = np.zeros((size, 3), dtype=np.float32)
+        self.best = np.ones(size, dtype=np.int8)
+        self.best_view = memoryview(self.best)  # plain-int reads in the per-frame loop
+
+    @property
+    def nbytes(self):
+        return self.q.nbytes + self.best.nbytes
+
+    def load(self, path):
+        q = np.load(path)
+        if q.shape != self.q.shape:
+            raise ValueError(path + " holds a " + str(q.shape) + " table, expected " + str(self.q.shape))
+        self.q[:] = q
+        self.best[:] = self.q.argmax(axis=1)
+
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, self.q)
+        os.replace(path + '.tmp', path)
+
+    def update(self, states, actions, rewards, final_value, alpha, gamma, sarsa=False):
+        # One batched TD(0) pass over an episode: the target of step t bootstraps from state t + 1 (the value
+        # of the step after the last one is final_value). Repeated (state, action) pairs move towards their
+        # mean target, so long episodes cannot overshoot.
+        q = self.q
+        following = np.empty_like(rewards)
+        if sarsa:
+            following[:-1] = q[states[1:], actions[1:]]
+        else:
+            following[:-1] = q[states[1:]].max(axis=1)
+        following[-1] = final_value
+        targets = rewards + gamma * following
+        cells = states * 3 + actions
+        unique, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        mean_targets = np.bincount(inverse, weights=targets) / counts
+        flat = q.reshape(-1)
+        flat[unique] += alpha * (mean_targets - flat[unique])
+        touched = np.unique(unique // 3)
+        self.best[touched] = q[touched].argmax(axis=1)
+
+
+class QLearner:
+    def __init__(self, game, layout, brick_number, abstraction=None, alpha=0.1, gamma=0.99, epsilon=0.1,
+                 sarsa=False, seed=None, max_steps=50000):
+        self.game = game
+        self.abstraction = abstraction or DEFAULT_ABSTRACTION
+        self.index = DenseIndex(game, layout, brick_number, self.abstraction)
+        self.table = QTable(self.index.size)
+        self.alpha = alpha
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.sarsa = sarsa
+        self.max_steps = max_steps  # a greedy policy can keep the ball in a loop that never ends the episode
+        self.rng = np.random.default_rng(seed)
+        self.explore = []
+        self.random_actions = []
+        self.draw = 0
+
+    def refill(self):
+        self.explore = (self.rng.random(RANDOM_BLOCK) < self.epsilon).tolist()
+        self.random_actions = self.rng.integers(0, 3, RANDOM_BLOCK).tolist()
+        self.draw = 0
+
+    def run_episode(self, env, learn_mode=True, on_frame=None):
+        # Returns (won, score, decisions, starting ball speed x); learns from the episode when learn_mode
+        index = self.index.index
+        best = self.table.best_view
+        state = env.state
+        states, actions, rewards = [], [], []
+        env.reset()
+        start_ball_speed_x = state.ball_speed_x
+        won = False
+        for step in range(self.max_steps):
+            i = index(state)
+            if learn_mode:
+                if self.draw == len(self.explore):
+                    self.refill()
+                action = self.random_actions[self.draw] if self.explore[self.draw] else best[i]
+                self.draw += 1
+            else:
+                action = best[i]
+            observation, reward, done, info = env.step(action - 1)
+            states.append(i)
+            actions.append(action)
+            rewards.append(reward)
+            if on_frame is not None:
+                on_frame()
+            if done:
+                won = info['won']
+                break
+        if learn_mode and states:
+            rewards[-1] += WIN_REWARD if won else 0
+            # A capped episode bootstraps from where it stopped, a finished one from nothing
+            final_value = 0.0 if env.done else float(self.table.q[index(state)].max())
+            self.table.update(np.array(states), np.array(actions), np.array(rewards), final_value, self.alpha,
+                              self.gamma, self.sarsa)
+        return won, env.info['score'], len(states), start_ball_speed_x
+
+
+def qtable_path(game, layout, brick_number, abstraction, frame_skip=1, event_driven=False):
+    return 'policy/qtable_' + game.run_name(layout, brick_number, frame_skip, event_driven, abstraction) + '.npy'
+
+
+def frame_renderer(game, env, render_frame_every):
+    # on_frame for a rendered episode: pumps the window's events and draws every render_frame_every-th frame
+    if game.window is None:
+        game.open_window()
+    import pygame
+    frames = [0]
+
+    def on_frame():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                game.QUIT = True
+        if frames[0] % render_frame_every == 0:
+            state = env.state
+            game.draw_elements(state.paddle_x, game.physics.paddle_y, state.ball_x, state.ball_y, state.bricks)
+            game.clock.tick(100000)
+        frames[0] += 1
+    return on_frame
+
+
+def play(game, layout='rectangle', brick_number=5, num_episodes=20, learn_mode=True, render_every=None,
+         render_frame_every=1, frame_skip=1, event_driven=False, abstraction=None, seed=None, progress_seconds=10.0):
+    # BreakoutGame.play(learner='q'): same results CSV, the table goes to policy/qtable_<run>.npy
+    learner = QLearner(game, layout, brick_number, abstraction, seed=seed)
+    abstraction = learner.abstraction
+    path = qtable_path(game, layout, brick_number, abstraction, frame_skip, event_driven)
+    if os.path.exists(path):
+        learner.table.load(path)
+    env = BreakoutEnv(layout, brick_number, game=game, frame_skip=frame_skip, event_driven=event_driven)
+    rendered = False
+    results = ResultsLog(game.results_path(layout, brick_number, learn_mode, frame_skip, event_driven, abstraction),
+                         progress_seconds=progress_seconds)
+    try:
+        for epoch in range(num_episodes):
+            render = game.should_render(epoch, render_every)
+            if render:
+                env.event_driven = False
+                on_frame = frame_renderer(game, env, render_frame_every)
+                rendered = True
+            else:
+                env.event_driven = event_driven
+                on_frame = None
+            won, score, decisions, start_ball_speed_x = learner.run_episode(env, learn_mode, on_frame)
+            results.write(epoch + 1, "WIN" if won else "LOSE", score, start_ball_speed_x)
+            if game.QUIT:
+                break
+    except KeyboardInterrupt:
+        print("Interrupted, saving progress")
+
+    results.close()
+    if learn_mode:
+        learner.table.save(path)
+    if rendered:
+        import pygame
+        pygame.quit()
+    return learner
+
+
+def compare_run(layout, brick_number, learner, text, episodes, seed):
+    # Runs in a worker inside a scratch directory; memory is the learner's table (bytes) and the process'
+    # peak RSS growth over the run
+    from benchmark import peak_rss_mb
+    from breakout_classes_final import BreakoutGame
+    abstraction = parse(text) if text else None
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for name in ['policy', 'win_policy', 'results']:
+            os.makedirs(name)
+        game = BreakoutGame(headless=True)
+        random.seed(seed)
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.play(layout, brick_number, episodes, True, abstraction=abstraction, learner=learner)
+        wall_time = time.perf_counter() - start
+        rss_growth = peak_rss_mb() - rss_before
+        with open(game.results_path(layout, brick_number, True, abstraction=abstraction), newline='') as file:
+            rows = list(csv.reader(file))[1:]
+        table_bytes = None
+        if learner == 'q':
+            table_bytes = QTable(DenseIndex(game, layout, brick_number, abstraction).size).nbytes
+        return {'layout': layout, 'bricks': brick_number, 'learner': learner, 'abstraction': text or 'raw',
+                'episodes_per_sec': len(rows) / wall_time, 'wins': sum(1 for row in rows if row[1] == "WIN"),
+                'rss_growth_mb': rss_growth, 'table_mb': table_bytes / (1 << 20) if table_bytes else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dict policy vs dense Q-table: memory and episodes/s")
+    parser.add_argument('--layouts', nargs='+', default=['rectangle', 'circle'])
+    parser.add_argument('--bricks', nargs='+', type=int, default=[6])
+    parser.add_argument('--episodes', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    default = DEFAULT_ABSTRACTION.name
+    configs = [(layout, brick_number, learner, text) for layout in args.layouts for brick_number in args.bricks
+               for learner, text in [('table', ''), ('table', default), ('q', default)]]
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count(), max_tasks_per_child=1) as pool:
+        futures = [pool.submit(compare_run, layout, brick_number, learner, text, args.episodes, args.seed)
+                   for layout, brick_number, learner, text in configs]
+        print(f"{'layout':9} {'bricks':>6} {'learner':7} {'abstraction':20} {'episodes/s':>10} {'wins':>5} "
+              f"{'RSS growth MB':>13} {'table MB':>8}")
+        for future in futures:
+            row = future.result()
+            table = f"{row['table_mb']:8.1f}" if row['table_mb'] is not None else f"{'-':>8}"
+            print(f"{row['layout']:9} {row['bricks']:6} {row['learner']:7} {row['abstraction']:20} "
+                  f"{row['episodes_per_sec']:10.1f} {row['wins']:5} {row['rss_growth_mb']:13.1f} {table}")
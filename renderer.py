@@ -0,0 +1,143 @@
+import argparse
+import os
+import random
+import time
+
+# Dirty-rectangle renderer for the game window. The bricks (fill plus outline) live on a background surface
+# that is drawn once per board and patched only when a brick disappears; each frame then restores the
+# background under the previous paddle and ball, draws them at their new positions and hands just those
+# rectangles to display.update instead of redrawing and flipping the whole window.
+# A new board (a brick came back, or another layout) redraws the background and flips once.
+# The paddle and ball are drawn over the bricks; the full redraw drew the bricks last, over a touching ball.
+
+
+class Renderer:
+    def __init__(self, pygame, window, paddle_width, paddle_height, ball_radius, background_color, paddle_color,
+                 ball_color, brick_color, outline_color):
+        self.pygame = pygame
+        self.window = window
+        self.paddle_size = (paddle_width, paddle_height)
+        self.ball_radius = ball_radius
+        self.background_color = background_color
+        self.paddle_color = paddle_color
+        self.ball_color = ball_color
+        self.brick_color = brick_color
+        self.outline_color = outline_color
+        self.background = pygame.Surface(window.get_size()).convert(window)
+        self.grid = None  # the BrickGrid, or the brick tuple for plain brick lists, the background shows
+        self.alive = None
+        self.count = -1
+        self.previous = []  # paddle and ball rectangles on screen
+
+    def draw_brick(self, brick):
+        self.pygame.draw.rect(self.background, self.brick_color, brick)
+        self.pygame.draw.rect(self.background, self.outline_color, brick, 2)
+
+    def sync_bricks(self, bricks):
+        # Brings the background up to date: the rectangles of removed bricks, or None after a full redraw
+        alive = getattr(bricks, 'alive', None)
+        if alive is None:
+            # A plain list of bricks: any change redraws the board
+            grid = tuple(bricks)
+            if grid == self.grid:
+                return []
+            self.grid = grid
+            self.count = len(grid)
+            return self.redraw(grid)
+        if bricks.grid is self.grid and bricks.count == self.count:
+            return []
+        if bricks.grid is not self.grid or bricks.count > self.count:
+            self.grid = bricks.grid
+            self.alive = list(alive)
+            self.count = bricks.count
+            return self.redraw(bricks)
+        removed = []
+        for i, (was_alive, is_alive) in enumerate(zip(self.alive, alive)):
+            if was_alive and not is_alive:
+                brick = self.pygame.Rect(self.grid.bricks[i])
+                self.background.fill(self.background_color, brick)
+                removed.append(brick)
+        self.alive[:] = alive
+        self.count = bricks.count
+        return removed
+
+    def redraw(self, bricks):
+        self.background.fill(self.background_color)
+        for brick in bricks:
+            self.draw_brick(brick)
+        return None
+
+    def draw(self, paddle_x, paddle_y, ball_x, ball_y, bricks):
+        pygame = self.pygame
+        window = self.window
+        background = self.background
+        removed = self.sync_bricks(bricks)
+        if removed is None:
+            window.blit(background, (0, 0))
+        else:
+            # Last frame's paddle and ball, and bricks removed since, go back to the background
+            dirty = self.previous + removed
+            for rect in dirty:
+                window.blit(background, rect, rect)
+        paddle = pygame.draw.rect(window, self.paddle_color, (paddle_x, paddle_y) + self.paddle_size)
+        ball = pygame.draw.circle(window, self.ball_color, (ball_x, ball_y), self.ball_radius)
+        if removed is None:
+            pygame.display.flip()
+        else:
+            dirty.append(paddle)
+            dirty.append(ball)
+            pygame.display.update(dirty)
+        self.previous = [paddle, ball]
+
+
+def draw_full(pygame, game, paddle_x, paddle_y, ball_x, ball_y, bricks):
+    # The previous draw_elements, kept as the reference for benchmark()
+    window = game.window
+    window.fill(game.BLACK)
+    pygame.draw.rect(window, game.ORANGE, (paddle_x, paddle_y, game.PADDLE_WIDTH, game.PADDLE_HEIGHT))
+    pygame.draw.circle(window, game.RED, (ball_x, ball_y), game.BALL_RADIUS)
+    for brick in bricks:
+        pygame.draw.rect(window, game.GREEN, brick)
+        pygame.draw.rect(window, game.BLACK, brick, 2)
+    pygame.display.flip()
+
+
+def benchmark(layout, brick_number, frames=5000, seed=0):
+    # Frames/s of the full redraw and of the renderer over the same seeded random-action frames
+    from breakout_classes_final import BreakoutGame, load_pygame
+    from breakout_env import BreakoutEnv
+    game = BreakoutGame(headless=True)
+    game.open_window()
+    pygame = load_pygame()
+    env = BreakoutEnv(layout, brick_number, game=game, rng=random.Random(seed))
+    rng = random.Random(seed)
+    actions = [rng.choice([-1, 0, 1]) for _ in range(frames)]
+    paddle_y = game.physics.paddle_y
+    result = {}
+    for name, draw in (('full', lambda *args: draw_full(pygame, game, *args)), ('dirty', game.draw_elements)):
+        env.reset(seed)
+        state = env.state
+        start = time.perf_counter()
+        for action in actions:
+            if env.step(action)[2]:
+                env.reset()
+            draw(state.paddle_x, paddle_y, state.ball_x, state.ball_y, state.bricks)
+        result[name] = frames / (time.perf_counter() - start)
+    pygame.quit()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frames/s of the full redraw against the dirty-rect renderer")
+    parser.add_argument('--layouts', nargs='+', default=['rectangle', 'triangle', 'circle'])
+    parser.add_argument('--bricks', nargs='+', type=int, default=[6, 10, 15])
+    parser.add_argument('--frames', type=int, default=5000)
+    args = parser.parse_args()
+    if not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    print(f"{'layout':9} {'bricks':>6} {'full fps':>9} {'dirty fps':>9} {'speedup':>7}")
+    for layout in args.layouts:
+        for brick_number in args.bricks:
+            fps = benchmark(layout, brick_number, args.frames)
+            print(f"{layout:9} {brick_number:6} {fps['full']:9,.0f} {fps['dirty']:9,.0f} "
+                  f"{fps['dirty'] / fps['full']:6.1f}x")
@@ -0,0 +1,118 @@
+import argparse
+import os
+
+import breakout_physics
+from breakout_classes_final import BreakoutGame, load_pygame
+import trajectory
+
+# Offline replay of episodes recorded by play(record_every=N) (or a win_trajectories store): re-simulates them
+# frame by frame with BreakoutGame's physics and draws them in the window, into PNG frames, or only checks them.
+# A recorded event-driven or frame-skip decision is expanded into the frames the env stepped for it, so every
+# frame is drawn. Checksums recorded during training are compared at their decisions; a mismatch means the
+# physics changed since the recording and is reported, not fatal, so the diverging episode can still be watched.
+
+
+def replay_frames(game, config, record):
+    # Yields the GameState after every frame, and returns the decisions whose checksum did not match, plus -1
+    # when the episode ends differently from the record
+    env = trajectory.replay_env(game, config, record, frame_skip=1, event_driven=False)
+    state = env.state
+    checksums = record['checksums']
+    every = config['checksum_every']
+    frame_skip = config['frame_skip']
+    mismatches = []
+    done = False
+    info = env.info
+    yield state
+    for decision, action in enumerate(record['actions'].tolist(), 1):
+        if done:
+            mismatches.append(-1)
+            break
+        frames = frame_skip
+        if record['event_driven']:
+            frames += breakout_physics.quiet_frames(game.physics, state, env.decision_frames)
+        for frame in range(frames):
+            observation, reward, done, info = env.step(action)
+            yield state
+            if done:
+                break
+        if every and not done and decision % every == 0 and decision // every <= len(checksums):
+            if trajectory.state_checksum(game, state) != checksums[decision // every - 1]:
+                mismatches.append(decision)
+    if not done or info['won'] != record['won'] or info['score'] != record['score']:
+        mismatches.append(-1)
+    return mismatches
+
+
+def replay_episode(game, config, record, index, render=False, fps=0, frames_dir=None, render_every=1):
+    # Steps (and draws) one episode; returns (frames, mismatches)
+    frames = replay_frames(game, config, record)
+    pygame = load_pygame() if render else None
+    paddle_y = game.physics.paddle_y
+    count = 0
+    while True:
+        try:
+            state = next(frames)
+        except StopIteration as stop:
+            return count, stop.value
+        if render and count % render_every == 0:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    game.QUIT = True
+            if game.QUIT:
+                frames.close()
+                return count, []
+            game.draw_elements(state.paddle_x, paddle_y, state.ball_x, state.ball_y, state.bricks)
+            if frames_dir:
+                pygame.image.save(game.window, os.path.join(frames_dir, f"episode{index:05d}_{count:06d}.png"))
+            if fps:
+                game.clock.tick(fps)
+        count += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-simulate recorded episodes, render them and check checksums")
+    parser.add_argument('path', help="a results/*_episodes.trj recording or a win_policy/*.trj store")
+    parser.add_argument('--episodes', nargs='+', type=int, default=None, help="record indices, default all")
+    parser.add_argument('--only', choices=['wins', 'losses'], default=None)
+    parser.add_argument('--check', action='store_true', help="only re-simulate and check, draw nothing")
+    parser.add_argument('--fps', type=int, default=100, help="frames per second in the window, 0 for unpaced")
+    parser.add_argument('--frames-dir', default=None, help="save every drawn frame here as PNG")
+    parser.add_argument('--render-every', type=int, default=1, help="draw every Nth frame")
+    parser.add_argument('--layout-file', default=None, help="custom boards (layouts.py), in place of the ones "
+                                                            "the recording stored")
+    args = parser.parse_args()
+
+    store = trajectory.TrajectoryStore.open(args.path)
+    game = BreakoutGame(headless=True, layout_file=args.layout_file)
+    render = not args.check
+    if render:
+        if args.frames_dir:
+            os.makedirs(args.frames_dir, exist_ok=True)
+            if not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+                os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        game.open_window()
+    selected = set(args.episodes) if args.episodes is not None else None
+    replayed = failed = 0
+    for index, record in enumerate(store.records()):
+        if selected is not None and index not in selected:
+            continue
+        if args.only is not None and record['won'] != (args.only == 'wins'):
+            continue
+        frames, mismatches = replay_episode(game, store.config, record, index, render,
+                                            0 if args.frames_dir else args.fps, args.frames_dir, args.render_every)
+        if game.QUIT:
+            break
+        replayed += 1
+        result = "WIN" if record['won'] else "LOSE"
+        if mismatches:
+            failed += 1
+            decisions = [decision for decision in mismatches if decision >= 0]
+            print(f"episode {index} ({result}, {record['score']:.1f}): MISMATCH" +
+                  (f" checksum after decisions {decisions[:5]}" if decisions else "") +
+                  (", ends differently" if -1 in mismatches else ""))
+        else:
+            print(f"episode {index} ({result}, {record['score']:.1f}): ok, {frames} frames")
+    print(f"{replayed} episodes replayed, {failed} with mismatches")
+    if render:
+        load_pygame().quit()
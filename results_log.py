@@ -0,0 +1,76 @@
+import csv
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+
+HEADER = ["Epoch", "Result", "Score", "Date and Time", "Start", "Frames", "Loops", "Cut"]
+
+
+class ResultsLog:
+    # A run's results CSV, streamed as episodes finish instead of held in memory until the run ends.
+    # Rows go through a 64 KiB file buffer flushed every flush_seconds, so the file on disk is at most that far
+    # behind. Win rate, mean score and episodes/s are kept over the last `window` episodes, and a progress line is
+    # printed at most every progress_seconds (None for none); the checks only run once per episode.
+    # Frames, Loops and Cut are the episode's simulated frames, the loops loop_detector.py spotted in it and why it
+    # was cut short ('loop', 'cap', or empty); the totals show up in the progress line once any episode is cut.
+    def __init__(self, path, window=100, flush_seconds=5.0, progress_seconds=10.0):
+        self.path = path
+        self.file = open(path, mode='w', newline='', buffering=1 << 16)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(HEADER)
+        self.recent = deque(maxlen=window)  # (won, score, time) of the last window episodes
+        self.episodes = 0
+        self.wins = 0
+        self.frames = 0
+        self.loops = 0
+        self.cut = 0
+        self.flush_seconds = flush_seconds
+        self.progress_seconds = progress_seconds
+        self.start = self.last_flush = self.last_progress = perf_counter()
+
+    def write(self, epoch, result, score, start_ball_speed_x, frames='', loops=0, cut=''):
+        now = perf_counter()
+        self.writer.writerow([epoch, result, score, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), start_ball_speed_x,
+                              frames, loops, cut])
+        won = result == "WIN"
+        self.recent.append((won, score, now))
+        self.episodes += 1
+        self.wins += won
+        if frames != '':
+            self.frames += frames
+        self.loops += loops
+        self.cut += cut != ''
+        if now - self.last_flush >= self.flush_seconds:
+            self.file.flush()
+            self.last_flush = now
+        if self.progress_seconds is not None and now - self.last_progress >= self.progress_seconds:
+            self.last_progress = now
+            print(self.progress(), flush=True)
+
+    def stats(self):
+        recent = self.recent
+        if not recent:
+            return {'episodes': 0, 'wins': 0, 'win_rate': 0.0, 'mean_score': 0.0, 'episodes_per_sec': 0.0,
+                    'frames': 0, 'loops': 0, 'cut': 0}
+        # The first episode of the window has no start time of its own, so the rate is over the ones after it
+        span = recent[-1][2] - (recent[0][2] if len(recent) > 1 else self.start)
+        episodes = len(recent) - 1 if len(recent) > 1 else 1
+        return {'episodes': self.episodes, 'wins': self.wins,
+                'win_rate': sum(won for won, _, _ in recent) / len(recent),
+                'mean_score': sum(score for _, score, _ in recent) / len(recent),
+                'episodes_per_sec': episodes / span if span > 0 else 0.0, 'frames': self.frames,
+                'loops': self.loops, 'cut': self.cut}
+
+    def progress(self):
+        stats = self.stats()
+        line = (f"Episode {stats['episodes']}: {stats['wins']} wins, last {len(self.recent)}: "
+                f"win rate {stats['win_rate']:.1%}, mean score {stats['mean_score']:.1f}, "
+                f"{stats['episodes_per_sec']:.1f} episodes/s")
+        if stats['loops'] or stats['cut']:
+            line += f", {stats['loops']} loops, {stats['cut']} episodes cut"
+        return line
+
+    def close(self):
+        self.file.close()
+        if self.progress_seconds is not None and self.episodes:
+            print(self.progress() + f", {perf_counter() - self.start:.1f} s in total", flush=True)
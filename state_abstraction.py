@@ -0,0 +1,151 @@
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Pluggable state keys for the learner. A StateAbstraction packs the same fields as BreakoutGame.state_key
+# (brick mask above FIELD_BITS, paddle << 30, ball x << 19, ball y << 8, speed codes in the low byte), so keys
+# still fit the policy file formats, but each field can be coarser:
+#   paddle_bin, ball_x_bin, ball_y_bin  pixels per bin, round(value / bin) like the old commented-out /20 keys
+#   relative                            ball x measured from the paddle centre instead of the left wall
+#   speed_sign                          only the direction of each speed component, not its magnitude
+#   bricks                              False drops the brick mask, one table for every board state
+# StateAbstraction() reproduces BreakoutGame.state_key exactly.
+
+
+class StateAbstraction:
+    def __init__(self, paddle_bin=1, ball_x_bin=1, ball_y_bin=1, relative=False, speed_sign=False, bricks=True):
+        self.paddle_bin = paddle_bin
+        self.ball_x_bin = ball_x_bin
+        self.ball_y_bin = ball_y_bin
+        self.relative = relative
+        self.speed_sign = speed_sign
+        self.bricks = bricks
+
+    @property
+    def name(self):
+        # Suffix of this abstraction's policy and results files, '' for raw keys
+        parts = []
+        for prefix, size in (('p', self.paddle_bin), ('x', self.ball_x_bin), ('y', self.ball_y_bin)):
+            if size != 1:
+                parts.append(prefix + str(size))
+        if self.relative:
+            parts.append('rel')
+        if self.speed_sign:
+            parts.append('sign')
+        if not self.bricks:
+            parts.append('nobricks')
+        return '_'.join(parts)
+
+    def __repr__(self):
+        return 'StateAbstraction(' + (self.name or 'raw') + ')'
+
+    def key(self, game, paddle_x, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks):
+        if self.relative:
+            ball_x = ball_x - paddle_x - game.PADDLE_WIDTH / 2
+        if self.speed_sign:
+            speed_x = (ball_speed_x > 0) - (ball_speed_x < 0) + 1
+            speed_y = (ball_speed_y > 0) - (ball_speed_y < 0) + 1
+        else:
+            speed_x = game.SPEED_X_CODES[ball_speed_x]
+            speed_y = game.SPEED_Y_CODES[ball_speed_y]
+        key = (round(paddle_x / self.paddle_bin) << 30 |
+               (round(ball_x / self.ball_x_bin) + game.POSITION_BIAS) << 19 |
+               (round(ball_y / self.ball_y_bin) + game.POSITION_BIAS) << 8 | speed_x << 4 | speed_y)
+        if self.bricks:
+            key |= bricks.key
+        return key
+
+
+def parse(text):
+    # 'p20_x20_y20_rel_sign' -> StateAbstraction(20, 20, 20, relative=True, speed_sign=True); 'raw' for the default
+    options = {}
+    for part in text.split('_'):
+        if part in ('', 'raw'):
+            continue
+        elif part == 'rel':
+            options['relative'] = True
+        elif part == 'sign':
+            options['speed_sign'] = True
+        elif part == 'nobricks':
+            options['bricks'] = False
+        elif part[0] in 'pxy' and part[1:].isdigit():
+            options[{'p': 'paddle_bin', 'x': 'ball_x_bin', 'y': 'ball_y_bin'}[part[0]]] = int(part[1:])
+        else:
+            raise ValueError("Unknown state abstraction part " + part)
+    return StateAbstraction(**options)
+
+
+def lookups_per_sec(game, abstraction, policy, layout, brick_number, frames=100000, seed=0):
+    # Key build plus policy lookup along a seeded random-action trajectory
+    from breakout_env import BreakoutEnv
+    env = BreakoutEnv(layout, brick_number, game=game)
+    env.reset(seed)
+    rng = random.Random(seed)
+    states = []
+    for _ in range(frames):
+        state = env.state
+        states.append((state.paddle_x, state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y))
+        if env.step(rng.choice([-1, 0, 1]))[2]:
+            env.reset()
+    key = abstraction.key
+    start = time.perf_counter()
+    for state in states:
+        policy.get(key(game, *state))
+    return frames / (time.perf_counter() - start)
+
+
+def evaluate(layout, brick_number, text, episodes, seed):
+    # Runs in a worker inside a scratch directory: learn `episodes` episodes with this abstraction
+    from breakout_classes_final import BreakoutGame
+    abstraction = parse(text)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for name in ['policy', 'win_policy', 'results']:
+            os.makedirs(name)
+        game = BreakoutGame(headless=True)
+        random.seed(seed)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.play(layout, brick_number, episodes, True, abstraction=abstraction)
+        wall_time = time.perf_counter() - start
+
+        with open(game.results_path(layout, brick_number, True, abstraction=abstraction), newline='') as file:
+            rows = list(csv.reader(file))[1:]
+        first_win = next((int(row[0]) for row in rows if row[1] == "WIN"), None)
+        policy = game.load_policy(game.policy_path(layout, brick_number, abstraction=abstraction),
+                                  game.policy_path(layout, brick_number, 'bin', abstraction=abstraction), 'json')
+        return {'layout': layout, 'bricks': brick_number, 'abstraction': text, 'table_size': len(policy),
+                'lookups_per_sec': lookups_per_sec(game, abstraction, policy, layout, brick_number, seed=seed),
+                'first_win': first_win, 'wins': sum(1 for row in rows if row[1] == "WIN"),
+                'episodes_per_sec': len(rows) / wall_time}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare state abstractions: table size, lookup rate, first win")
+    parser.add_argument('--layouts', nargs='+', default=['rectangle', 'triangle', 'circle'])
+    parser.add_argument('--bricks', nargs='+', type=int, default=[6])
+    parser.add_argument('--abstractions', nargs='+',
+                        default=['raw', 'p5_x5_y5', 'p20_x20_y20', 'x10_y10_rel_sign', 'p20_x20_y20_rel_sign'])
+    parser.add_argument('--episodes', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    configs = [(layout, brick_number, text) for layout in args.layouts for brick_number in args.bricks
+               for text in args.abstractions]
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count(), max_tasks_per_child=1) as pool:
+        futures = [pool.submit(evaluate, layout, brick_number, text, args.episodes, args.seed)
+                   for layout, brick_number, text in configs]
+        print(f"{'layout':9} {'bricks':>6} {'abstraction':22} {'states':>9} {'lookups/s':>11} {'first win':>9} "
+              f"{'wins':>5} {'episodes/s':>10}")
+        for future in futures:
+            row = future.result()
+            print(f"{row['layout']:9} {row['bricks']:6} {row['abstraction']:22} {row['table_size']:9} "
+                  f"{row['lookups_per_sec']:11,.0f} {str(row['first_win']):>9} {row['wins']:5} "
+                  f"{row['episodes_per_sec']:10.1f}")
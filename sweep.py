@@ -0,0 +1,149 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from breakout_classes_final import BreakoutGame
+
+LAYOUTS = ['rectangle', 'triangle', 'circle']
+BRICK_NUMBERS = [6, 10, 15]
+FRAME_SKIPS = [1]
+SUMMARY_PATH = 'results/sweep_summary.csv'
+SUMMARY_HEADER = ["Layout", "Bricks", "Learn", "Episodes", "Wins", "Win rate", "Episodes/sec", "Wall time",
+                  "Status", "Frame skip"]
+
+
+def build_grid(layouts=LAYOUTS, brick_numbers=BRICK_NUMBERS, num_episodes=1000, frame_skips=FRAME_SKIPS):
+    # Every (layout, brick_number, frame_skip) gets a learn run followed by an eval run on the learned policy
+    return [(layout, brick_number, num_episodes, frame_skip) for layout in layouts for brick_number in brick_numbers
+            for frame_skip in frame_skips]
+
+
+def read_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as file:
+        return list(csv.reader(file))[1:]
+
+
+def is_complete(game, layout, brick_number, num_episodes, learn_mode, frame_skip=1):
+    if len(read_results(game.results_path(layout, brick_number, learn_mode, frame_skip))) < num_episodes:
+        return False
+    # Policies are saved through a temporary file and a rename, so one that exists was written in full
+    return os.path.exists(game.policy_path(layout, brick_number, frame_skip=frame_skip)) and os.path.exists(
+        game.win_policy_path(layout, brick_number, frame_skip=frame_skip))
+
+
+def run_config(layout, brick_number, num_episodes, learn_mode, layout_file=None, frame_skip=1):
+    # Runs in a pool worker, one fresh process per config since play() shuts pygame down at the end
+    start = time.perf_counter()
+    BreakoutGame(headless=True, layout_file=layout_file).play(layout, brick_number, num_episodes, learn_mode,
+                                                              frame_skip=frame_skip)
+    return time.perf_counter() - start
+
+
+def summary_row(game, layout, brick_number, num_episodes, learn_mode, wall_time, status, frame_skip=1):
+    rows = read_results(game.results_path(layout, brick_number, learn_mode, frame_skip))[:num_episodes]
+    wins = sum(1 for row in rows if row[1] == "WIN")
+    win_rate = wins / len(rows) if rows else 0.0
+    episodes_per_sec = len(rows) / wall_time if wall_time else ''
+    return [layout, brick_number, learn_mode, len(rows), wins, win_rate, episodes_per_sec,
+            wall_time if wall_time else '', status, frame_skip]
+
+
+def load_summary(path):
+    # Timings of configs finished by an earlier invocation, so a resumed sweep still reports them.
+    # Summaries written before the frame skip column was added are frame skip 1.
+    previous = {}
+    if os.path.exists(path):
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                key = (row["Layout"], int(row["Bricks"]), row["Learn"] == 'True', int(row.get("Frame skip") or 1))
+                previous[key] = float(row["Wall time"]) if row["Wall time"] else None
+    return previous
+
+
+def frame_skip_report(rows):
+    # Win rate of each (layout, bricks, mode) for every frame skip in the sweep, one line per configuration
+    win_rates = {}
+    for row in rows:
+        layout, brick_number, learn_mode, frame_skip = row[0], row[1], row[2], row[9]
+        win_rates.setdefault((layout, brick_number, learn_mode), {})[frame_skip] = row[5]
+    frame_skips = sorted({row[9] for row in rows})
+    lines = ["Layout     Bricks Learn  " + "".join(f"{'k=' + str(k):>8}" for k in frame_skips)]
+    for (layout, brick_number, learn_mode), by_skip in win_rates.items():
+        cells = "".join(f"{by_skip[k]:8.3f}" if k in by_skip else f"{'':8}" for k in frame_skips)
+        lines.append(f"{layout:10} {brick_number:6} {str(learn_mode):6} {cells}")
+    return "\n".join(lines)
+
+
+def run_sweep(grid, max_workers=None, summary_path=SUMMARY_PATH, layout_file=None):
+    for directory in ['policy', 'win_policy', 'results']:
+        os.makedirs(directory, exist_ok=True)
+
+    game = BreakoutGame(headless=True)
+    previous = load_summary(summary_path)
+    summary = {}
+    pending = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), max_tasks_per_child=1) as pool:
+        def submit(layout, brick_number, num_episodes, learn_mode, frame_skip):
+            key = (layout, brick_number, learn_mode, frame_skip)
+            if is_complete(game, layout, brick_number, num_episodes, learn_mode, frame_skip):
+                print("Skipping complete", layout, brick_number, learn_mode, frame_skip)
+                summary[key] = summary_row(game, layout, brick_number, num_episodes, learn_mode,
+                                           previous.get(key), "skipped", frame_skip)
+                return False
+            future = pool.submit(run_config, layout, brick_number, num_episodes, learn_mode, layout_file,
+                                 frame_skip)
+            pending[future] = (layout, brick_number, num_episodes, learn_mode, frame_skip)
+            return True
+
+        # Learn runs first; an eval run is only queued once its policy has been learned
+        for layout, brick_number, num_episodes, frame_skip in grid:
+            if not submit(layout, brick_number, num_episodes, True, frame_skip):
+                submit(layout, brick_number, num_episodes, False, frame_skip)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                layout, brick_number, num_episodes, learn_mode, frame_skip = pending.pop(future)
+                try:
+                    wall_time = future.result()
+                    status = "ok"
+                except Exception as error:
+                    print("Failed", layout, brick_number, learn_mode, frame_skip, error)
+                    wall_time = None
+                    status = "failed"
+                summary[(layout, brick_number, learn_mode, frame_skip)] = summary_row(
+                    game, layout, brick_number, num_episodes, learn_mode, wall_time, status, frame_skip)
+                if learn_mode and status == "ok":
+                    submit(layout, brick_number, num_episodes, False, frame_skip)
+
+    rows = [summary[key] for key in sorted(summary, key=lambda key: (key[0], key[1], not key[2], key[3]))]
+    with open(summary_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(SUMMARY_HEADER)
+        writer.writerows(rows)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the layout x brick-count experiment grid in parallel")
+    parser.add_argument('--layouts', nargs='+', default=LAYOUTS)
+    parser.add_argument('--bricks', nargs='+', type=int, default=BRICK_NUMBERS)
+    parser.add_argument('--episodes', type=int, default=1000)
+    parser.add_argument('--frame-skips', nargs='+', type=int, default=FRAME_SKIPS,
+                        help="frames each decision is held for, e.g. --frame-skips 1 2 4 8")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--summary', default=SUMMARY_PATH)
+    parser.add_argument('--layout-file', default=None, help="JSON file with custom layouts, see layouts.py")
+    args = parser.parse_args()
+
+    grid = build_grid(args.layouts, args.bricks, args.episodes, args.frame_skips)
+    rows = run_sweep(grid, args.workers, args.summary, args.layout_file)
+    for row in rows:
+        print(*row)
+    if len(args.frame_skips) > 1:
+        print(frame_skip_report(rows))
@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from breakout_batch import BreakoutBatch
+from breakout_classes_final import BreakoutGame
+
+# Differential check of the batched engine: one batched game and one BreakoutGame fed the same random actions
+# must agree on every field after every frame. Mismatches fail explicitly, so the check survives python -O.
+
+
+@pytest.mark.parametrize('brick_number', [6, 10, 15])
+@pytest.mark.parametrize('layout', ['rectangle', 'triangle', 'circle'])
+def test_batch_matches_scalar(layout, brick_number, frames=20000, seed=0):
+    game = BreakoutGame(headless=True)
+    batch = BreakoutBatch(1, layout, brick_number, game=game, seed=seed)
+    rng = random.Random(seed)
+    paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = game.reset_game(
+        layout, brick_number, rng)
+    episodes = 0
+    for frame in range(frames):
+        action = rng.choice([-1, 0, 1])
+        game.GAME_OVER = False
+        paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward, kicks = \
+            game.update_game_state(layout, brick_number, action, paddle_x, paddle_speed, ball_x, ball_y,
+                                   ball_speed_x, ball_speed_y, bricks, 0, 0)
+        batch_reward, done, won = batch.step([action])
+        scalar_done = game.GAME_OVER or len(bricks) == 0
+        if (batch_reward[0], bool(done[0])) != (reward, scalar_done):
+            pytest.fail(f"frame {frame}: batch reward/done {batch_reward[0]}/{done[0]}, scalar {reward}/{scalar_done}")
+        if scalar_done:
+            episodes += 1
+            paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = game.reset_game(
+                layout, brick_number, rng)
+            batch.ball_speed_x[0] = ball_speed_x
+            continue
+        expected = (paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y)
+        actual = (batch.paddle_x[0], batch.paddle_speed[0], batch.ball_x[0], batch.ball_y[0],
+                  batch.ball_speed_x[0], batch.ball_speed_y[0])
+        if expected != actual:
+            pytest.fail(f"frame {frame}: scalar {expected}, batch {actual}")
+        alive = [brick for brick, alive in zip(batch.bricks, batch.alive[0]) if alive]
+        if alive != bricks:
+            pytest.fail(f"frame {frame}: scalar bricks {bricks}, batch {alive}")
+    if not episodes:
+        pytest.fail(f"no episode ended in {frames} frames, the resets went unchecked")
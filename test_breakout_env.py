@@ -0,0 +1,170 @@
+import random
+
+import pytest
+
+from breakout_classes_final import BreakoutGame
+from breakout_env import BreakoutEnv
+
+# Differential checks of BreakoutEnv's bit-identical claims. Mismatches fail explicitly, so the checks survive
+# python -O.
+LAYOUTS = ['rectangle', 'triangle', 'circle']
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_step_matches_update_game_state(layout, brick_number=10, frames=20000, seed=0):
+    # env.step and the frame-by-frame trainer's update_game_state, both serving from the shared random module
+    # seeded alike, must produce the same state keys, scores and episode ends
+    game = BreakoutGame(headless=True)
+    rng = random.Random(seed)
+    actions = [rng.choice([-1, 0, 1]) for _ in range(frames)]
+
+    random.seed(seed)
+    expected = []
+    paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = game.reset_game(
+        layout, brick_number)
+    reward = kicks = 0
+    for action in actions:
+        game.GAME_OVER = False
+        paddle_x, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks, reward, kicks = \
+            game.update_game_state(layout, brick_number, action, paddle_x, paddle_speed, ball_x, ball_y,
+                                   ball_speed_x, ball_speed_y, bricks, reward, kicks)
+        done = game.GAME_OVER or len(bricks) == 0
+        key = game.state_key(paddle_x, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks)
+        expected.append((key, reward, kicks, done))
+        if done:
+            paddle_x, paddle_y, paddle_speed, ball_x, ball_y, ball_speed_x, ball_speed_y, bricks = game.reset_game(
+                layout, brick_number)
+            reward = kicks = 0
+
+    random.seed(seed)
+    env = BreakoutEnv(layout, brick_number, game=BreakoutGame(headless=True), step_penalty=0)
+    env.reset()
+    for frame, action in enumerate(actions):
+        observation, reward, done, info = env.step(action)
+        actual = (observation, info['score'], info['kicks'], done)
+        if actual != expected[frame]:
+            pytest.fail(f"frame {frame}: update_game_state {expected[frame]}, env.step {actual}")
+        if done:
+            env.reset()
+    if not any(done for *_, done in expected):
+        pytest.fail(f"no episode ended in {frames} frames, the serves went unchecked")
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_event_driven_matches_frames(layout, brick_number=10, decisions=20000, seed=0):
+    # An event-driven env and a frame-stepping env fed the same actions for the same frames must agree on every
+    # field after every event-driven step
+    events = BreakoutEnv(layout, brick_number, game=BreakoutGame(headless=True), event_driven=True,
+                         rng=random.Random())
+    frames = BreakoutEnv(layout, brick_number, game=BreakoutGame(headless=True), rng=random.Random())
+    rng = random.Random(seed)
+    episode = 0
+    observation = events.reset(seed)
+    if frames.reset(seed) != observation:
+        pytest.fail("the first observations differ")
+    jumped = 0
+    for decision in range(decisions):
+        action = rng.choice([-1, 0, 1])
+        observation, reward, done, info = events.step(action)
+        for frame in range(info['frames']):
+            frame_observation, frame_reward, frame_done, frame_info = frames.step(action)
+            if frame_done and frame < info['frames'] - 1:
+                pytest.fail(f"decision {decision}: the frame-stepping episode ended after {frame + 1} of "
+                            f"{info['frames']} frames")
+        jumped += info['frames'] - 1
+        a, b = events.state, frames.state
+        expected = (frame_observation, b.paddle_x, b.paddle_speed, b.ball_x, b.ball_y, b.ball_speed_x,
+                    b.ball_speed_y, b.reward, b.kicks, frame_done)
+        actual = (observation, a.paddle_x, a.paddle_speed, a.ball_x, a.ball_y, a.ball_speed_x, a.ball_speed_y,
+                  a.reward, a.kicks, done)
+        if expected != actual:
+            pytest.fail(f"decision {decision}: frame by frame {expected}, event-driven {actual}")
+        if done:
+            episode += 1
+            if frames.reset(seed + episode) != events.reset(seed + episode):
+                pytest.fail(f"episode {episode}: the first observations differ")
+    if not jumped:
+        pytest.fail(f"no quiet frame was jumped in {decisions} decisions")
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_restored_snapshot_replays(layout, brick_number=10, decisions=20000, seed=0, branch=50):
+    # Every `branch` decisions a snapshot is taken, `branch` random actions played, the snapshot restored and the
+    # same actions played again; both passes must agree step for step
+    env = BreakoutEnv(layout, brick_number, game=BreakoutGame(headless=True), event_driven=True, rng=random.Random())
+    rng = random.Random(seed)
+    episode = 0
+    env.reset(seed)
+    for decision in range(0, decisions, branch):
+        snapshot = env.snapshot()
+        actions = [rng.choice([-1, 0, 1]) for _ in range(branch)]
+        passes = []
+        for _ in range(2):
+            env.restore(snapshot)
+            trace = []
+            for action in actions:
+                observation, reward, done, info = env.step(action)
+                trace.append((observation, reward, done, info['won'], info['bricks_left'], env.state.kicks))
+                if done:
+                    break
+            passes.append(trace)
+        if passes[0] != passes[1]:
+            step = next((i for i, (a, b) in enumerate(zip(*passes)) if a != b), min(map(len, passes)))
+            pytest.fail(f"decision {decision + step}: first pass {passes[0][step:step + 1]}, "
+                        f"after restore {passes[1][step:step + 1]}")
+        if env.done:
+            episode += 1
+            env.reset(seed + episode)
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_envs_sharing_a_game_stay_apart(layout, brick_number=10, decisions=5000, seed=0):
+    # Two envs stepped in turn on one game must see the same observations as each on a game of its own
+    shared = BreakoutGame(headless=True)
+    pairs = [(BreakoutEnv(layout, brick_number, game=shared, rng=random.Random()),
+              BreakoutEnv(layout, brick_number, game=BreakoutGame(headless=True), rng=random.Random()))
+             for _ in range(2)]
+    rng = random.Random(seed)
+    for i, (env, alone) in enumerate(pairs):
+        if env.reset(seed + i) != alone.reset(seed + i):
+            pytest.fail(f"env {i}: the first observations differ")
+    for decision in range(decisions):
+        for i, (env, alone) in enumerate(pairs):
+            action = rng.choice([-1, 0, 1])
+            step, alone_step = env.step(action)[:3], alone.step(action)[:3]
+            if step != alone_step:
+                pytest.fail(f"decision {decision}, env {i}: on the shared game {step}, alone {alone_step}")
+            if step[2]:
+                env.reset(seed + decision)
+                alone.reset(seed + decision)
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_lookahead_leaves_the_next_serve_alone(layout, brick_number=10, decisions=5000, seed=0, horizon=40):
+    # Before every decision one env plays `horizon` random steps ahead and restores, as planner.py does; it must
+    # then step exactly like an env that never looked ahead, serves after a lost ball included. The trainer only
+    # serves straight up, so the rngs are compared too: every serve still draws from them
+    planning = BreakoutEnv(layout, brick_number, game=BreakoutGame(headless=True), event_driven=True,
+                           rng=random.Random())
+    plain = BreakoutEnv(layout, brick_number, game=BreakoutGame(headless=True), event_driven=True,
+                        rng=random.Random())
+    rng = random.Random(seed)
+    planning.reset(seed)
+    plain.reset(seed)
+    lost_ahead = 0
+    for decision in range(decisions):
+        snapshot = planning.snapshot()
+        for _ in range(horizon):
+            observation, reward, done, info = planning.step(rng.choice([-1, 0, 1]))
+            if done:
+                lost_ahead += not info['won']
+                break
+        planning.restore(snapshot)
+        action = rng.choice([-1, 0, 1])
+        step, plain_step = planning.step(action)[:3], plain.step(action)[:3]
+        if step != plain_step:
+            pytest.fail(f"decision {decision}: after a lookahead {step}, without {plain_step}")
+        if planning.rng.getstate() != plain.rng.getstate():
+            pytest.fail(f"decision {decision}: the lookahead moved the rng the next serve is drawn from")
+    if not lost_ahead:
+        pytest.fail("no lookahead lost the ball, the serves went unchecked")
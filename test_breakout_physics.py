@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+import breakout_physics
+from breakout_physics import find_brick_hit, point_in_rect, rects_overlap
+
+# The pygame-free collision helpers against the pygame.Rect calls they stand in for. Mismatches fail explicitly,
+# so the checks survive python -O; without pygame there is nothing to compare against and the module is skipped.
+pygame = pytest.importorskip('pygame')
+
+
+def test_rects_and_points_match_pygame(probes=100000, seed=0):
+    # Random rects and points, negative and fractional coordinates included
+    rng = random.Random(seed)
+    for _ in range(probes):
+        ax, ay, bx, by, px, py = (rng.uniform(-60, 510) for _ in range(6))
+        aw, ah, bw, bh = (rng.randint(1, 120) for _ in range(4))
+        expected = bool(pygame.Rect(ax, ay, aw, ah).colliderect(pygame.Rect(bx, by, bw, bh)))
+        if rects_overlap(ax, ay, aw, ah, bx, by, bw, bh) != expected:
+            pytest.fail(f"rects_overlap{(ax, ay, aw, ah, bx, by, bw, bh)} != colliderect {expected}")
+        bx, by = int(bx), int(by)
+        expected = bool(pygame.Rect(bx, by, bw, bh).collidepoint(px, py))
+        if point_in_rect(px, py, bx, by, bw, bh) != expected:
+            pytest.fail(f"point_in_rect{(px, py, bx, by, bw, bh)} != collidepoint {expected}")
+
+
+@pytest.mark.parametrize('layout', ['rectangle', 'triangle', 'circle'])
+def test_game_collisions_match_pygame(layout, brick_number=10, frames=20000, seed=0):
+    # The paddle and brick tests of every frame of a random-action game: the helpers, check_paddle_collision's
+    # inlined overlap and the BrickSet grid must all agree with pygame.Rect
+    from breakout_classes_final import BreakoutGame
+    rng = random.Random(seed)
+    game = BreakoutGame(headless=True)
+    config = game.physics
+    r = config.ball_radius
+    state = breakout_physics.GameState(0, 0, 0, 0, 0, 0, None)
+    contacts = hits = 0
+    for frame in range(frames):
+        if state.bricks is None or not len(state.bricks) or state.ball_y >= config.height:
+            (state.paddle_x, paddle_y, state.paddle_speed, state.ball_x, state.ball_y, state.ball_speed_x,
+             state.ball_speed_y, state.bricks) = game.reset_game(layout, brick_number, rng)
+        state.paddle_speed = breakout_physics.accelerate(config, state.paddle_speed, rng.choice([-1, 0, 1]))
+        # The positions and speeds step() is about to test, worked out ahead of it
+        paddle_x = breakout_physics.move_paddle(config, state.paddle_x, state.paddle_speed)
+        ball_x, ball_y = breakout_physics.move_ball(state.ball_x, state.ball_y, state.ball_speed_x,
+                                                    state.ball_speed_y)
+        speed_x, speed_y = breakout_physics.check_wall_collision(config, ball_x, ball_y, state.ball_speed_x,
+                                                                 state.ball_speed_y)
+        expected = bool(pygame.Rect(ball_x - r, ball_y - r, r * 2, r * 2).colliderect(
+            pygame.Rect(paddle_x, config.paddle_y, config.paddle_width, config.paddle_height)))
+        overlap = rects_overlap(ball_x - r, ball_y - r, r * 2, r * 2, paddle_x, config.paddle_y, config.paddle_width,
+                                config.paddle_height)
+        speed_x, speed_y, on_paddle = breakout_physics.check_paddle_collision(config, ball_x, ball_y, speed_x,
+                                                                              speed_y, paddle_x, config.paddle_y)
+        if (overlap, on_paddle) != (expected, expected):
+            pytest.fail(f"frame {frame}: rects_overlap {overlap}, check_paddle_collision {on_paddle}, "
+                        f"pygame {expected}")
+        contacts += on_paddle
+
+        alive = list(state.bricks)
+        expected = breakout_physics.pygame_brick_hit(pygame, alive, ball_x, ball_y, speed_x, speed_y)
+        found = find_brick_hit(alive, ball_x, ball_y, speed_x, speed_y)
+        hit = state.bricks.hit(ball_x, ball_y, speed_x, speed_y)
+        if hit is not None:
+            hit = alive.index(state.bricks.grid.bricks[hit[0]]), hit[1]
+        if (found, hit) != (expected, expected):
+            pytest.fail(f"frame {frame}: find_brick_hit {found}, BrickSet.hit {hit}, pygame {expected}")
+        hits += expected is not None
+        brick_id = breakout_physics.step(config, state)
+        if (brick_id >= 0) != (expected is not None):
+            pytest.fail(f"frame {frame}: step() removed brick {brick_id}, pygame hit {expected}")
+    if not contacts or not hits:
+        pytest.fail(f"{contacts} paddle contacts and {hits} brick hits in {frames} frames, too few to compare")
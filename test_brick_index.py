@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from breakout_classes_final import BreakoutGame
+from brick_index import BrickGrid, BrickSet, linear_scan
+
+# The grid index against the pygame.Rect scan it replaced: both must agree hit for hit, including which probe
+# fired. Mismatches fail explicitly, so the check survives python -O; linear_scan needs pygame.
+pytest.importorskip('pygame')
+
+
+@pytest.mark.parametrize('brick_number', [6, 10, 15, 50])
+@pytest.mark.parametrize('layout', ['rectangle', 'triangle', 'circle'])
+def test_grid_matches_linear_scan(layout, brick_number, probes=50000, seed=0):
+    # Ball positions sampled over the upper part of the field, where the bricks are; the board is rebuilt once
+    # half of it is gone
+    game = BreakoutGame(headless=True)
+    bricks = list(game.reset_bricks(layout, brick_number))
+    grid = BrickGrid(bricks, game.BRICK_WIDTH, game.BRICK_HEIGHT)
+    rng = random.Random(seed)
+    speeds = [1.414213562373095, -1.414213562373095, 0]
+    scan_bricks, brick_set = list(bricks), BrickSet(grid)
+    hits = 0
+    for probe in range(probes):
+        sample = (rng.uniform(0, game.WIDTH), rng.uniform(0, game.HEIGHT / 2), rng.choice(speeds),
+                  rng.choice([-3, -1, 1, 3]))
+        expected = linear_scan(scan_bricks, *sample)
+        actual = brick_set.hit(*sample)
+        if actual is not None:
+            brick_set.remove_id(actual[0])
+            actual = grid.bricks[actual[0]], actual[1]
+        if expected != actual:
+            pytest.fail(f"probe {probe} {sample}: linear scan {expected}, grid {actual}")
+        hits += expected is not None
+        if len(scan_bricks) < brick_number // 2:
+            scan_bricks, brick_set = list(bricks), BrickSet(grid)
+    if not hits:
+        pytest.fail(f"no probe of {probes} hit a brick")
@@ -0,0 +1,35 @@
+import pytest
+
+from breakout_physics import GameState
+from loop_detector import LoopDetector
+
+# Checks fail explicitly, so they survive python -O.
+
+
+def contact(detector, state, ball_x, ball_y, ball_speed_x=1.5, ball_speed_y=-3.0):
+    # One paddle contact with the ball at the given position and speed
+    state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y = ball_x, ball_y, ball_speed_x, ball_speed_y
+    state.kicks += 1
+    return detector.check(state)
+
+
+def test_sub_pixel_contacts_are_no_loop():
+    # Contacts that only agree once rounded to whole pixels, as the policy key does, are different positions
+    state = GameState(0, 0, 0, 0, 0, 0, [(0, 0, 60, 20)])
+    detector = LoopDetector()
+    detector.reset(state)
+    for ball_x in (200.2, 200.4, 199.8):
+        if contact(detector, state, ball_x, 550.1):
+            pytest.fail(f"a contact at ball_x {ball_x} was taken for a loop")
+    if not contact(detector, state, 200.4, 550.1):
+        pytest.fail("an exact repeat of a contact was not reported")
+
+
+def test_falling_brick_starts_over():
+    state = GameState(0, 0, 0, 0, 0, 0, [(0, 0, 60, 20), (60, 0, 60, 20)])
+    detector = LoopDetector()
+    detector.reset(state)
+    contact(detector, state, 200.2, 550.1)
+    state.bricks = state.bricks[1:]
+    if contact(detector, state, 100.0, 550.1) or contact(detector, state, 200.2, 550.1):
+        pytest.fail("a contact from before the last brick fell was taken for a loop")
@@ -0,0 +1,391 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import state_abstraction
+
+ACTIONS = [-1, 0, 1]
+
+# Episodes as replayable trajectories (TrajectoryStore): winning ones in place of every visited state in
+# win_policy, or any episode play() records for offline replay (replay.py).
+# Given the serve, the game is deterministic in the actions: a lost ball ends the episode before the next serve
+# is drawn, so a run's config, the serve and the decision actions rebuild every state exactly.
+# File: MAGIC, a length-prefixed JSON header with the run config, then one record per episode:
+#   RECORD      seed (-1 if the episode was not reset with one), flags (EVENT_DRIVEN, WON), serve speeds, final
+#               score, decision count, byte length of the actions and number of checksums that follow
+#   actions     run-length encoded: each run of equal actions is one LEB128 varint, length << 2 | action + 1
+#   checksums   uint32 state_checksum after every checksum_every-th decision (header config, 0 for none),
+#               except the last one: a lost ball is served again from whatever rng the recording env had
+# A custom board (layouts.py) also stores its bricks in the header, so the file replays without the layout file.
+# Version 1 files (win records only, no checksums) are still read.
+MAGIC = b'BTRJ2'
+RECORD = struct.Struct('<qBdddIII')
+MAGIC_V1 = b'BTRJ1'
+RECORD_V1 = struct.Struct('<qBdddII')
+EVENT_DRIVEN = 1
+WON = 2
+CHECKSUM_EVERY = 64
+CHECKSUM_STATE = struct.Struct('<7dq')
+
+
+class TrajectoryBuffer:
+    # One episode's (state, action, reward, kicks) rows as preallocated numpy columns, reused from episode to
+    # episode. Rows are written through memoryviews, so appending allocates no tuples and nothing the garbage
+    # collector has to track; the columns double when an episode outgrows them.
+    # States are uint64 keys when key_bits fits, Python ints in an object column otherwise.
+    def __init__(self, key_bits=64, capacity=1 << 16):
+        self.key_dtype = np.uint64 if key_bits <= 64 else object
+        self.length = 0
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        states = np.zeros(capacity, dtype=self.key_dtype)
+        actions = np.zeros(capacity, dtype=np.int8)
+        rewards = np.zeros(capacity, dtype=np.float64)
+        kicks = np.zeros(capacity, dtype=np.int64)
+        if self.length:
+            states[:self.length] = self.states[:self.length]
+            actions[:self.length] = self.actions[:self.length]
+            rewards[:self.length] = self.rewards[:self.length]
+            kicks[:self.length] = self.kicks[:self.length]
+        self.states, self.actions, self.rewards, self.kicks = states, actions, rewards, kicks
+        self.capacity = capacity
+        self.state_view = states if self.key_dtype is object else memoryview(states)
+        self.action_view = memoryview(actions)
+        self.reward_view = memoryview(rewards)
+        self.kick_view = memoryview(kicks)
+
+    def __len__(self):
+        return self.length
+
+    def clear(self):
+        self.length = 0
+
+    def append(self, state, action, reward, kicks):
+        n = self.length
+        if n == self.capacity:
+            self.allocate(self.capacity * 2)
+        self.state_view[n] = state
+        self.action_view[n] = action
+        self.reward_view[n] = reward
+        self.kick_view[n] = kicks
+        self.length = n + 1
+
+    def keys(self):
+        return self.states[:self.length].tolist()
+
+
+def first_occurrences(states):
+    # Unique states and the index of each one's earliest row
+    unique, first = np.unique(states, return_index=True)
+    return unique, first
+
+
+def last_occurrences(states):
+    unique, first_reversed = np.unique(states[::-1], return_index=True)
+    return unique, len(states) - 1 - first_reversed
+
+
+def update_win_policy(win_policy, states, actions, reward):
+    # Each state's latest action with the episode's final reward, unless it already holds an equal or better one
+    unique, last = last_occurrences(states)
+    for state, action in zip(unique.tolist(), actions[last].tolist()):
+        previous = win_policy.get(state)
+        if previous is None or reward > previous[1]:
+            win_policy[state] = [action, reward]
+
+
+def credit_win(buffer, policy, win_policy, reward):
+    # Same result as walking the episode backwards writing every row into policy and win_policy: policy keeps
+    # each state's earliest action, win_policy as update_win_policy
+    n = buffer.length
+    if not n:
+        return
+    states = buffer.states[:n]
+    actions = buffer.actions[:n]
+    unique, first = first_occurrences(states)
+    policy.update(zip(unique.tolist(), actions[first].tolist()))
+    update_win_policy(win_policy, states, actions, reward)
+
+
+def credit_loss(buffer, policy):
+    # Same result, and the same random.choice calls in the same order, as the backwards walk over a lost
+    # episode: rows with more than one kick and over 20 reward per kick keep their action, every other row
+    # draws a random one; each state ends up with the value of its earliest row
+    n = buffer.length
+    if not n:
+        return
+    states = buffer.states[:n]
+    values = buffer.actions[:n].copy()
+    kicks = buffer.kicks[:n]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keep = (kicks > 1) & (buffer.rewards[:n] / kicks > 20)
+    redraw = np.flatnonzero(~keep)[::-1]
+    values[redraw] = [random.choice(ACTIONS) for _ in range(len(redraw))]
+    unique, first = first_occurrences(states)
+    policy.update(zip(unique.tolist(), values[first].tolist()))
+
+
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        sizes += values >= np.uint64(1 << shift)
+    offsets = np.cumsum(sizes) - sizes
+    data = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for i in range(int(sizes.max(initial=0))):
+        rows = sizes > i
+        byte = (values[rows] >> np.uint64(7 * i)) & np.uint64(0x7f)
+        data[offsets[rows] + i] = byte | np.where(sizes[rows] > i + 1, 0x80, 0).astype(np.uint64)
+    return data.tobytes()
+
+
+def decode_varints(data):
+    data = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    values = np.zeros(len(ends), dtype=np.uint64)
+    i = 0
+    while True:
+        rows = np.flatnonzero(starts + i <= ends)
+        if not len(rows):
+            return values
+        values[rows] |= (data[starts[rows] + i] & 0x7f).astype(np.uint64) << np.uint64(7 * i)
+        i += 1
+
+
+def encode_actions(actions):
+    actions = np.asarray(actions, dtype=np.int8)
+    if not len(actions):
+        return b''
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(actions)) + 1))
+    lengths = np.diff(np.append(starts, len(actions)))
+    return encode_varints(lengths.astype(np.uint64) << np.uint64(2) | (actions[starts] + 1).astype(np.uint64))
+
+
+def decode_actions(data):
+    runs = decode_varints(data)
+    return np.repeat((runs & np.uint64(3)).astype(np.int8) - 1, (runs >> np.uint64(2)).astype(np.int64))
+
+
+class TrajectoryStore:
+    # Append-only file of one run's episodes, see the format above. The file stays open from the first append
+    # until close(), and every record is flushed as it is written.
+    def __init__(self, path, layout, brick_number, frame_skip=1, abstraction=None, step_penalty=0.1,
+                 checksum_every=0, bricks=None):
+        self.path = path
+        self.config = {'layout': layout, 'brick_number': brick_number, 'frame_skip': frame_skip,
+                       'abstraction': abstraction.name if abstraction is not None else '',
+                       'step_penalty': step_penalty, 'checksum_every': checksum_every}
+        if bricks is not None:
+            self.config['bricks'] = [list(brick) for brick in bricks]
+        self.file = None
+        if os.path.exists(path):
+            stored = read_header(path)[0]
+            if stored != self.config:
+                raise ValueError(path + " holds trajectories of another run: " + json.dumps(stored))
+
+    @classmethod
+    def open(cls, path):
+        # A store with the config its file was written with
+        config = read_header(path)[0]
+        return cls(path, config['layout'], config['brick_number'], config['frame_skip'],
+                   state_abstraction.parse(config['abstraction']) if config['abstraction'] else None,
+                   config['step_penalty'], config['checksum_every'], config.get('bricks'))
+
+    def append(self, actions, score, serve, event_driven, seed=None, won=True, checksums=()):
+        if self.file is None:
+            if os.path.exists(self.path) and read_header(self.path)[2] == 1:
+                self.upgrade()
+            self.file = open(self.path, 'ab')
+        file = self.file
+        if not file.tell():
+            header = json.dumps(self.config).encode()
+            file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        data = encode_actions(actions)
+        checksums = np.asarray(checksums, dtype='<u4')
+        file.write(RECORD.pack(-1 if seed is None else seed, event_driven * EVENT_DRIVEN | won * WON, serve[0],
+                               serve[1], score, len(actions), len(data), len(checksums)) + data +
+                   checksums.tobytes())
+        file.flush()
+        return RECORD.size + len(data) + checksums.nbytes
+
+    def upgrade(self):
+        # Rewrites a version 1 file in the current format, next to it and renamed over it
+        records = list(self.records())
+        path, self.path = self.path, self.path + '.tmp'
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        try:
+            for record in records:
+                self.append(record['actions'], record['score'], record['serve'], record['event_driven'],
+                            record['seed'], record['won'])
+            self.close()
+            os.replace(self.path, path)
+        finally:
+            self.close()
+            self.path = path
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return
+        config, offset, version = read_header(self.path)
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        while offset < len(data):
+            start = offset
+            if version == 1:
+                seed, flags, speed_x, speed_y, score, decisions, size = RECORD_V1.unpack_from(data, offset)
+                flags |= WON
+                count = 0
+                offset += RECORD_V1.size
+            else:
+                seed, flags, speed_x, speed_y, score, decisions, size, count = RECORD.unpack_from(data, offset)
+                offset += RECORD.size
+            actions = decode_actions(data[offset:offset + size])
+            offset += size
+            checksums = np.frombuffer(data, dtype='<u4', count=count, offset=offset)
+            offset += 4 * count
+            if len(actions) != decisions:
+                raise ValueError(f"{self.path}: record at byte {start} decodes to {len(actions)} actions, "
+                                 f"expected {decisions}")
+            yield {'seed': None if seed < 0 else seed, 'event_driven': bool(flags & EVENT_DRIVEN),
+                   'won': bool(flags & WON), 'serve': (speed_x, speed_y), 'score': score, 'actions': actions,
+                   'checksums': checksums}
+
+
+def read_header(path):
+    # The stored run config, the offset of the first record and the format version
+    with open(path, 'rb') as file:
+        magic = file.read(len(MAGIC))
+        if magic not in (MAGIC, MAGIC_V1):
+            raise ValueError(path + " is not a trajectory file")
+        size, = struct.unpack('<I', file.read(4))
+        config = json.loads(file.read(size))
+    config.setdefault('checksum_every', 0)
+    return config, len(MAGIC) + 4 + size, 1 if magic == MAGIC_V1 else 2
+
+
+def state_checksum(game, state):
+    # CRC32 of everything a decision leaves behind: paddle, ball, score, kicks and the alive-brick mask
+    return zlib.crc32(CHECKSUM_STATE.pack(state.paddle_x, state.paddle_speed, state.ball_x, state.ball_y,
+                                          state.ball_speed_x, state.ball_speed_y, state.reward, state.kicks),
+                      zlib.crc32(state.bricks.key.to_bytes((state.bricks.key.bit_length() + 7) // 8, 'little')))
+
+
+def register_layout(game, config):
+    # Makes a custom board stored in the header known to game, unless a layout file already defined it
+    if 'bricks' in config and config['layout'] not in game.layouts.names():
+        game.layouts.register(config['layout'], config['bricks'])
+
+
+def replay_env(game, config, record, frame_skip=None, event_driven=None):
+    # An env at the start of a stored episode: same run config, serve and seed
+    from breakout_env import BreakoutEnv
+    register_layout(game, config)
+    abstraction = state_abstraction.parse(config['abstraction']) if config['abstraction'] else None
+    env = BreakoutEnv(config['layout'], config['brick_number'], game=game, step_penalty=config['step_penalty'],
+                      frame_skip=config['frame_skip'] if frame_skip is None else frame_skip,
+                      event_driven=record['event_driven'] if event_driven is None else event_driven,
+                      abstraction=abstraction, rng=random.Random(record['seed']))
+    env.reset(record['seed'])
+    env.state.ball_speed_x, env.state.ball_speed_y = record['serve']
+    return env
+
+
+def replay(game, config, record):
+    # Rebuilds the state key the learner saw before each action of a stored episode; raises ValueError when the
+    # episode ends differently from the record or a checksum does not match
+    env = replay_env(game, config, record)
+    observation = env.observation()
+    actions = record['actions']
+    checksums = record['checksums']
+    every = config['checksum_every']
+    keys = []
+    done = False
+    info = env.info
+    for action in actions.tolist():
+        if done:
+            raise ValueError(f"Episode ended after {len(keys)} of {len(actions)} actions")
+        keys.append(observation)
+        observation, reward, done, info = env.step(action)
+        if every and not done and len(keys) % every == 0 and len(keys) // every <= len(checksums):
+            if state_checksum(game, env.state) != checksums[len(keys) // every - 1]:
+                raise ValueError(f"Checksum mismatch after decision {len(keys)}")
+    if not done or info['won'] != record['won'] or info['score'] != record['score']:
+        raise ValueError(f"Replay ended with score {info['score']} won={info['won']} done={done}, stored "
+                         f"{record['score']} won={record['won']}")
+    bricks = len(game.layouts.get(config['layout'], config['brick_number']).bricks)
+    return np.array(keys, dtype=np.uint64 if game.FIELD_BITS + bricks <= 64 else object)
+
+
+def rebuild_win_policy(game, store):
+    # The win_policy the stored winning episodes produced, replayed in the order they were won
+    win_policy = {}
+    for record in store.records():
+        if record['won']:
+            update_win_policy(win_policy, replay(game, store.config, record), record['actions'], record['score'])
+    return win_policy
+
+
+def measure_gc(layout='rectangle', brick_number=6, episodes=200, seed=0):
+    # Garbage collector activity and allocated blocks over a seeded learn run in a scratch directory
+    from breakout_classes_final import BreakoutGame
+    pauses = []
+    started = []
+
+    def on_gc(phase, info):
+        if phase == 'start':
+            started.append(time.perf_counter())
+        else:
+            pauses.append((info['generation'], time.perf_counter() - started.pop()))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        for name in ['policy', 'win_policy', 'results']:
+            os.makedirs(name)
+        game = BreakoutGame(headless=True)
+        random.seed(seed)
+        gc.collect()
+        blocks_before = sys.getallocatedblocks()
+        gc.callbacks.append(on_gc)
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                game.play(layout, brick_number, episodes, True)
+        finally:
+            gc.callbacks.remove(on_gc)
+            os.chdir(cwd)
+        wall_time = time.perf_counter() - start
+    return {'collections': len(pauses), 'gen2_collections': sum(1 for generation, _ in pauses if generation == 2),
+            'gc_seconds': sum(pause for _, pause in pauses),
+            'max_pause_ms': max((pause for _, pause in pauses), default=0) * 1e3,
+            'allocated_blocks_growth': sys.getallocatedblocks() - blocks_before, 'wall_time': wall_time}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GC pauses and allocations of a seeded learn run")
+    parser.add_argument('--layout', default='rectangle')
+    parser.add_argument('--bricks', type=int, default=6)
+    parser.add_argument('--episodes', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for key, value in measure_gc(args.layout, args.bricks, args.episodes, args.seed).items():
+        print(f"{key:24} {value:.4g}")